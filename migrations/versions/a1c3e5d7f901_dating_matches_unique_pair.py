@@ -0,0 +1,35 @@
+"""dating_matches: unique (user_id, target_user_id)
+
+Revision ID: a1c3e5d7f901
+Revises:
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c3e5d7f901'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Сначала чистим дубли от двойных тапов: оставляем самый первый голос по паре
+    op.execute("""
+        DELETE FROM dating_matches d
+        USING dating_matches keep
+        WHERE d.user_id = keep.user_id
+          AND d.target_user_id = keep.target_user_id
+          AND d.id > keep.id
+    """)
+    op.create_unique_constraint('uq_dating_matches_pair', 'dating_matches', ['user_id', 'target_user_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_dating_matches_pair', 'dating_matches', type_='unique')
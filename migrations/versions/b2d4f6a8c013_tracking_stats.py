@@ -0,0 +1,40 @@
+"""tracking_stats: per-user/per-mode streak and weekly counters
+
+Revision ID: b2d4f6a8c013
+Revises: a1c3e5d7f901
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2d4f6a8c013'
+down_revision: Union[str, Sequence[str], None] = 'a1c3e5d7f901'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'tracking_stats',
+        sa.Column('user_id', sa.BigInteger(), sa.ForeignKey('users.user_id'), primary_key=True),
+        sa.Column('mode', sa.String(length=20), primary_key=True),
+        sa.Column('current_streak', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('last_date', sa.Date(), nullable=True),
+        sa.Column('recent', sa.String(length=7), server_default='', nullable=False),
+        sa.Column('week_success', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('week_partial', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('week_fail', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    )
+    # Заполнение по истории: python src/scripts/backfill_tracking_stats.py
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('tracking_stats')
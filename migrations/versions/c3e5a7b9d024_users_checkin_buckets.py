@@ -0,0 +1,44 @@
+"""users: timezone, check-in slot and staggered check-in minute
+
+Revision ID: c3e5a7b9d024
+Revises: b2d4f6a8c013
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from src.config import settings
+from src.utils.checkin import DEFAULT_SLOT
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e5a7b9d024'
+down_revision: Union[str, Sequence[str], None] = 'b2d4f6a8c013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('timezone', sa.String(length=64), server_default=settings.DEFAULT_TIMEZONE, nullable=False))
+    op.add_column('users', sa.Column('checkin_slot', sa.SmallInteger(), server_default=str(DEFAULT_SLOT), nullable=False))
+    op.add_column('users', sa.Column('checkin_minute', sa.SmallInteger(), nullable=True))
+
+    # Та же формула, что и staggered_minute(): слот + user_id % окно
+    op.execute(sa.text(
+        "UPDATE users SET checkin_minute = (checkin_slot + user_id % :window) % 1440"
+    ).bindparams(window=max(settings.CHECKIN_WINDOW_MINUTES, 1)))
+    op.alter_column('users', 'checkin_minute', nullable=False)
+
+    op.create_index('ix_users_checkin_bucket', 'users', ['checkin_minute', 'timezone'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_checkin_bucket', table_name='users')
+    op.drop_column('users', 'checkin_minute')
+    op.drop_column('users', 'checkin_slot')
+    op.drop_column('users', 'timezone')
@@ -0,0 +1,36 @@
+"""daily_tracking: unique (user_id, mode, date)
+
+Revision ID: d4f6b8c0e135
+Revises: c3e5a7b9d024
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f6b8c0e135'
+down_revision: Union[str, Sequence[str], None] = 'c3e5a7b9d024'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Оставляем первую отметку за день (так же поступала старая проверка дублей)
+    op.execute("""
+        DELETE FROM daily_tracking d
+        USING daily_tracking keep
+        WHERE d.user_id = keep.user_id
+          AND d.mode = keep.mode
+          AND d.date = keep.date
+          AND d.id > keep.id
+    """)
+    op.create_unique_constraint('uq_daily_tracking_user_mode_date', 'daily_tracking', ['user_id', 'mode', 'date'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_daily_tracking_user_mode_date', 'daily_tracking', type_='unique')
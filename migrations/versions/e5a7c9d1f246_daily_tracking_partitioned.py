@@ -0,0 +1,103 @@
+"""daily_tracking: monthly range partitions + tracking_monthly rollups
+
+Revision ID: e5a7c9d1f246
+Revises: d4f6b8c0e135
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a7c9d1f246'
+down_revision: Union[str, Sequence[str], None] = 'd4f6b8c0e135'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 2
+
+
+def _add_months(month: datetime.date, count: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 1. Итоги по месяцам (сюда сворачиваются старые партиции)
+    op.create_table(
+        'tracking_monthly',
+        sa.Column('user_id', sa.BigInteger(), sa.ForeignKey('users.user_id'), primary_key=True),
+        sa.Column('mode', sa.String(length=20), primary_key=True),
+        sa.Column('month', sa.Date(), primary_key=True),
+        sa.Column('success', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('partial', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('fail', sa.Integer(), server_default='0', nullable=False),
+    )
+
+    # 2. Старую таблицу откладываем, освобождая имена ограничений
+    op.execute("ALTER TABLE daily_tracking RENAME TO daily_tracking_old")
+    op.execute("ALTER TABLE daily_tracking_old DROP CONSTRAINT uq_daily_tracking_user_mode_date")
+    op.execute("ALTER TABLE daily_tracking_old DROP CONSTRAINT daily_tracking_pkey")
+
+    # 3. Партиционированная таблица: PK и уникальный ключ включают date,
+    #    уникальный ключ заодно дает составной индекс (user_id, mode, date) в каждой партиции
+    op.execute("""
+        CREATE TABLE daily_tracking (
+            id INTEGER NOT NULL DEFAULT nextval('daily_tracking_id_seq'),
+            user_id BIGINT NOT NULL REFERENCES users (user_id),
+            mode VARCHAR(20) NOT NULL DEFAULT 'diet',
+            date DATE NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT daily_tracking_pkey PRIMARY KEY (id, date),
+            CONSTRAINT uq_daily_tracking_user_mode_date UNIQUE (user_id, mode, date)
+        ) PARTITION BY RANGE (date)
+    """)
+    op.execute("ALTER SEQUENCE daily_tracking_id_seq OWNED BY daily_tracking.id")
+
+    # 4. Партиции на всю историю и на пару месяцев вперед
+    bind = op.get_bind()
+    first_day = bind.execute(sa.text("SELECT min(date) FROM daily_tracking_old")).scalar()
+    today = datetime.date.today()
+    month = (first_day or today).replace(day=1)
+    last = _add_months(today.replace(day=1), MONTHS_AHEAD)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE daily_tracking_y{month.year:04d}m{month.month:02d} PARTITION OF daily_tracking "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        month = _add_months(month, 1)
+
+    # 5. Перенос данных
+    op.execute("""
+        INSERT INTO daily_tracking (id, user_id, mode, date, status, created_at)
+        SELECT id, user_id, mode, date, status, created_at FROM daily_tracking_old
+    """)
+    op.execute("DROP TABLE daily_tracking_old")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE daily_tracking RENAME TO daily_tracking_parted")
+    op.execute("ALTER TABLE daily_tracking_parted DROP CONSTRAINT uq_daily_tracking_user_mode_date")
+    op.execute("ALTER TABLE daily_tracking_parted DROP CONSTRAINT daily_tracking_pkey")
+    op.execute("""
+        CREATE TABLE daily_tracking (
+            id INTEGER NOT NULL DEFAULT nextval('daily_tracking_id_seq') PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES users (user_id),
+            mode VARCHAR(20) NOT NULL DEFAULT 'diet',
+            date DATE NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT uq_daily_tracking_user_mode_date UNIQUE (user_id, mode, date)
+        )
+    """)
+    op.execute("ALTER SEQUENCE daily_tracking_id_seq OWNED BY daily_tracking.id")
+    op.execute("INSERT INTO daily_tracking SELECT id, user_id, mode, date, status, created_at FROM daily_tracking_parted")
+    op.execute("DROP TABLE daily_tracking_parted")
+    op.drop_table('tracking_monthly')
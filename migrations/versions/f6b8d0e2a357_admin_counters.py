@@ -0,0 +1,116 @@
+"""admin_counters: admin stats maintained by statement-level triggers
+
+Revision ID: f6b8d0e2a357
+Revises: e5a7c9d1f246
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6b8d0e2a357'
+down_revision: Union[str, Sequence[str], None] = 'e5a7c9d1f246'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Счетчик размазан по строкам-шардам: параллельные транзакции не ждут одну строку
+SHARDS = 16
+
+# (метрика, таблица, условие строки, события)
+TRACKED = [
+    ('users', 'users', 'true', ('INSERT', 'DELETE')),
+    ('qr_total', 'qr_codes', 'true', ('INSERT', 'DELETE')),
+    ('qr_activated', 'qr_codes', 'activated_at IS NOT NULL', ('INSERT', 'UPDATE', 'DELETE')),
+    ('surveys', 'user_surveys', 'true', ('INSERT', 'DELETE')),
+    ('matches', 'dating_matches', 'is_match', ('INSERT', 'UPDATE', 'DELETE')),
+]
+
+REFERENCING = {
+    'INSERT': 'REFERENCING NEW TABLE AS new_rows',
+    'UPDATE': 'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows',
+    'DELETE': 'REFERENCING OLD TABLE AS old_rows',
+}
+
+
+def _trigger_name(metric: str, event: str) -> str:
+    return f"trg_admin_{metric}_{event.lower()}"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'admin_counters',
+        sa.Column('metric', sa.String(length=32), primary_key=True),
+        sa.Column('shard', sa.SmallInteger(), primary_key=True),
+        sa.Column('value', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    # Активные подписки считаем диапазоном по индексу (метрика зависит от времени, триггером ее не вести)
+    op.create_index('ix_users_subscription_expires_at', 'users', ['subscription_expires_at'])
+
+    op.execute(f"""
+        CREATE FUNCTION admin_counter_add(p_metric text, p_delta bigint) RETURNS void AS $$
+        BEGIN
+            IF p_delta <> 0 THEN
+                INSERT INTO admin_counters (metric, shard, value, updated_at)
+                VALUES (p_metric, floor(random() * {SHARDS})::smallint, p_delta, now())
+                ON CONFLICT (metric, shard) DO UPDATE
+                SET value = admin_counters.value + EXCLUDED.value, updated_at = EXCLUDED.updated_at;
+            END IF;
+        END $$ LANGUAGE plpgsql
+    """)
+    # Statement-level: одна строчка счетчика на оператор, даже если это COPY миллиона QR-кодов.
+    # TG_ARGV[0] — метрика, TG_ARGV[1] — условие, по которому строка попадает в счетчик
+    op.execute("""
+        CREATE FUNCTION admin_counters_track() RETURNS trigger AS $$
+        DECLARE
+            delta bigint := 0;
+            n bigint;
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                EXECUTE format('SELECT count(*) FROM new_rows WHERE %s', TG_ARGV[1]) INTO n;
+                delta := delta + n;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                EXECUTE format('SELECT count(*) FROM old_rows WHERE %s', TG_ARGV[1]) INTO n;
+                delta := delta - n;
+            END IF;
+            PERFORM admin_counter_add(TG_ARGV[0], delta);
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql
+    """)
+
+    for metric, table, condition, events in TRACKED:
+        for event in events:
+            op.execute(f"""
+                CREATE TRIGGER {_trigger_name(metric, event)}
+                AFTER {event} ON {table}
+                {REFERENCING[event]}
+                FOR EACH STATEMENT EXECUTE FUNCTION admin_counters_track('{metric}', '{condition}')
+            """)
+        # Начальные значения — один полный подсчет при миграции
+        op.execute(f"""
+            INSERT INTO admin_counters (metric, shard, value)
+            SELECT '{metric}', 0, count(*) FROM {table} WHERE {condition}
+            ON CONFLICT (metric, shard) DO UPDATE SET value = admin_counters.value + EXCLUDED.value
+        """)
+
+    op.execute("""
+        INSERT INTO admin_counters (metric, shard, value)
+        SELECT 'active_subs', 0, count(*) FROM users WHERE subscription_expires_at > now()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for metric, table, _, events in TRACKED:
+        for event in events:
+            op.execute(f"DROP TRIGGER IF EXISTS {_trigger_name(metric, event)} ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS admin_counters_track()")
+    op.execute("DROP FUNCTION IF EXISTS admin_counter_add(text, bigint)")
+    op.drop_index('ix_users_subscription_expires_at', table_name='users')
+    op.drop_table('admin_counters')
@@ -0,0 +1,76 @@
+"""qr_batch_funnel: batches and hourly activation rollups
+
+Revision ID: g7c9e1f3b468
+Revises: f6b8d0e2a357
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'g7c9e1f3b468'
+down_revision: Union[str, Sequence[str], None] = 'f6b8d0e2a357'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'qr_batches',
+        sa.Column('batch_id', sa.String(length=50), primary_key=True),
+        sa.Column('codes', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_table(
+        'qr_batch_hourly',
+        sa.Column('batch_id', sa.String(length=50), primary_key=True),
+        sa.Column('hour', sa.DateTime(timezone=True), primary_key=True),
+        sa.Column('activations', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('first_activations', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('repeat_activations', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('fifth_activations', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('seconds_to_fifth', sa.BigInteger(), server_default='0', nullable=False),
+    )
+    op.create_index('ix_qr_codes_activated_by_id', 'qr_codes', ['activated_by_id'])
+
+    # Начальные данные — один полный проход по qr_codes при миграции, дальше пишет бот
+    op.execute("""
+        INSERT INTO qr_batches (batch_id, codes, created_at)
+        SELECT batch_id, count(*), min(created_at) FROM qr_codes GROUP BY batch_id
+    """)
+    # Порядковый номер активации юзера восстанавливаем по времени активаций
+    op.execute("""
+        INSERT INTO qr_batch_hourly (
+            batch_id, hour, activations, first_activations, repeat_activations, fifth_activations, seconds_to_fifth
+        )
+        SELECT
+            batch_id,
+            date_trunc('hour', activated_at),
+            count(*),
+            count(*) FILTER (WHERE n = 1),
+            count(*) FILTER (WHERE n > 1),
+            count(*) FILTER (WHERE n = 5),
+            coalesce(sum(extract(epoch FROM activated_at - first_at)) FILTER (WHERE n = 5), 0)::bigint
+        FROM (
+            SELECT
+                batch_id,
+                activated_at,
+                row_number() OVER (PARTITION BY activated_by_id ORDER BY activated_at) AS n,
+                min(activated_at) OVER (PARTITION BY activated_by_id) AS first_at
+            FROM qr_codes
+            WHERE activated_at IS NOT NULL AND activated_by_id IS NOT NULL
+        ) AS a
+        GROUP BY 1, 2
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_qr_codes_activated_by_id', table_name='qr_codes')
+    op.drop_table('qr_batch_hourly')
+    op.drop_table('qr_batches')
@@ -0,0 +1,46 @@
+"""survey_config_versions: one row per (mode, version), one current per mode
+
+Revision ID: h8d0f2a4c579
+Revises: g7c9e1f3b468
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'h8d0f2a4c579'
+down_revision: Union[str, Sequence[str], None] = 'g7c9e1f3b468'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # init_configs.py раньше вставлял id 1-5 явно, последовательность так и стояла на старте:
+    # первая вставка синхронизации упала бы на дубле первичного ключа
+    op.execute(
+        "SELECT setval(pg_get_serial_sequence('survey_configs', 'id'), "
+        "(SELECT coalesce(max(id), 1) FROM survey_configs))"
+    )
+    # Если актуальных строк на режим несколько — оставляем последнюю
+    op.execute("""
+        UPDATE survey_configs SET is_current = false
+        WHERE is_current AND id NOT IN (
+            SELECT max(id) FROM survey_configs WHERE is_current GROUP BY mode
+        )
+    """)
+    op.create_unique_constraint('uq_survey_configs_mode_version', 'survey_configs', ['mode', 'version'])
+    op.create_index(
+        'ux_survey_configs_current', 'survey_configs', ['mode'],
+        unique=True, postgresql_where=sa.text('is_current'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_survey_configs_current', table_name='survey_configs')
+    op.drop_constraint('uq_survey_configs_mode_version', 'survey_configs', type_='unique')
@@ -0,0 +1,37 @@
+"""config_snapshots: full survey/prompt snapshots for warm start
+
+Revision ID: i9e1a3b5d680
+Revises: h8d0f2a4c579
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'i9e1a3b5d680'
+down_revision: Union[str, Sequence[str], None] = 'h8d0f2a4c579'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'config_snapshots',
+        sa.Column('id', sa.Integer(), autoincrement=True, primary_key=True),
+        sa.Column('version', sa.String(length=12), nullable=False),
+        sa.Column('marker', sa.String(length=64), nullable=True),
+        sa.Column('surveys', sa.JSON(), nullable=False),
+        sa.Column('prompts', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.UniqueConstraint('version'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('config_snapshots')
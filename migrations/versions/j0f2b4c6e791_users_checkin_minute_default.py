@@ -0,0 +1,30 @@
+"""users: server default for checkin_minute
+
+Revision ID: j0f2b4c6e791
+Revises: i9e1a3b5d680
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from src.utils.checkin import DEFAULT_SLOT
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'j0f2b4c6e791'
+down_revision: Union[str, Sequence[str], None] = 'i9e1a3b5d680'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Вставки мимо ORM (SQL, COPY) не знают формулу сдвига — получают минуту слота по умолчанию
+    op.alter_column('users', 'checkin_minute', server_default=str(DEFAULT_SLOT))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('users', 'checkin_minute', server_default=None)
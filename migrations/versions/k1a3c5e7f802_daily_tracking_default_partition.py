@@ -0,0 +1,29 @@
+"""daily_tracking: DEFAULT partition for rows without a monthly partition
+
+Revision ID: k1a3c5e7f802
+Revises: j0f2b4c6e791
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'k1a3c5e7f802'
+down_revision: Union[str, Sequence[str], None] = 'j0f2b4c6e791'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Пропущенное обслуживание не должно ронять запись отчетов: строки ждут здесь,
+    # ежедневная задача переносит их в партицию месяца (tracking_partitions.ensure_partitions)
+    op.execute("CREATE TABLE daily_tracking_default PARTITION OF daily_tracking DEFAULT")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TABLE daily_tracking_default")
@@ -0,0 +1,76 @@
+import json
+from typing import Any, Optional
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+
+# --- КОМПАКТНЫЙ КОДЕК ДАННЫХ FSM ---
+# RedisStorage хранит data одной строкой; сокращаем служебные ключи и пишем JSON
+# без пробелов и \u-экранирования (кириллица в ответах: 2 байта вместо 6).
+# Старые записи с длинными ключами читаются как есть.
+_ALIASES = {
+    "survey_mode": "m",
+    "survey_version": "v",
+    "current_step": "s",
+    "answers": "a",
+    "last_bot_message_id": "l",
+    "survey_header_id": "h",
+}
+_REVERSE = {short: full for full, short in _ALIASES.items()}
+
+
+def compact_dumps(data: dict) -> str:
+    return json.dumps(
+        {_ALIASES.get(key, key): value for key, value in data.items()},
+        ensure_ascii=False, separators=(",", ":"),
+    )
+
+
+def compact_loads(raw: str) -> dict:
+    return {_REVERSE.get(key, key): value for key, value in json.loads(raw).items()}
+
+
+# --- ЧЕРНОВИК СОСТОЯНИЯ НА ОДИН АПДЕЙТ ---
+
+_UNSET = object()
+
+
+class StateDraft:
+    """
+    Состояние FSM на время одного апдейта: читаем из Redis не больше одного раза,
+    все изменения копим локально, записываем одним set_data (и set_state, если менялся)
+    после хендлера — см. StateDraftMiddleware.
+    """
+    def __init__(self, state: FSMContext):
+        self.state = state
+        self._data: Optional[dict] = None
+        self._dirty = False
+        self._new_state: Any = _UNSET
+
+    async def data(self) -> dict:
+        if self._data is None:
+            self._data = await self.state.get_data()
+        return self._data
+
+    async def get(self, key: str, default=None):
+        return (await self.data()).get(key, default)
+
+    async def update(self, **kwargs):
+        (await self.data()).update(kwargs)
+        self._dirty = True
+
+    def set_state(self, state: Optional[State]):
+        self._new_state = state
+
+    def clear(self):
+        self._data = {}
+        self._dirty = True
+        self._new_state = None
+
+    async def flush(self):
+        if self._new_state is not _UNSET:
+            await self.state.set_state(self._new_state)
+        if self._dirty:
+            await self.state.set_data(self._data)
+        self._dirty = False
+        self._new_state = _UNSET
@@ -1,56 +1,86 @@
+import html
+
 from aiogram import Router, F
-from aiogram.types import Message
-from sqlalchemy import select, func, and_
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, Message
+from zoneinfo import ZoneInfo
 
-from src.database.session import async_session_maker
-from src.database.models import User, QRCode, UserSurvey, DatingMatch
+from src.services.admin_stats import read_admin_stats
+from src.services.qr_analytics import (
+    avg_hours_to_fifth, batch_summaries, batch_timeline, export_batch_csv, format_summary,
+)
 from src.config import settings
 
-router = Router()
+MSK = ZoneInfo("Europe/Moscow")
 
-# Список админов из конфига
-def get_admin_ids():
-    return [int(x) for x in settings.ADMIN_IDS.split(',')]
+router = Router()
 
 # Фильтр: пускаем только админов
-router.message.filter(F.from_user.id.in_(get_admin_ids()))
+router.message.filter(F.from_user.id.in_(settings.admin_ids))
 
 @router.message(F.text == "🔒 Админка")
 async def admin_menu(message: Message):
-    """Показывает статистику проекта."""
-    
-    async with async_session_maker() as session:
-        # 1. Всего пользователей
-        total_users = await session.scalar(select(func.count(User.user_id)))
-        
-        # 2. Активные подписки (у кого дата истечения в будущем)
-        active_subs = await session.scalar(
-            select(func.count(User.user_id)).where(User.subscription_expires_at > func.now())
-        )
-        
-        # 3. Активированные QR коды
-        activated_qrs = await session.scalar(
-            select(func.count(QRCode.code_hash)).where(QRCode.activated_at.is_not(None))
-        )
-        
-        # 4. Всего QR кодов
-        total_qrs = await session.scalar(select(func.count(QRCode.code_hash)))
-        
-        # 5. Заполнено анкет (Всего)
-        total_surveys = await session.scalar(select(func.count(UserSurvey.id)))
-        
-        # 6. Мэтчи в дейтинге
-        matches = await session.scalar(
-            select(func.count(DatingMatch.id)).where(DatingMatch.is_match == True)
-        )
+    """Показывает статистику проекта (снимок счетчиков, без полных подсчетов по таблицам)."""
+    stats = await read_admin_stats()
+    refreshed = stats.refreshed_at.astimezone(MSK).strftime("%d.%m %H:%M") if stats.refreshed_at else "—"
 
     text = (
         "📊 <b>Статистика REX Bot:</b>\n\n"
-        f"👥 <b>Пользователи:</b> {total_users}\n"
-        f"✅ <b>Активные подписки:</b> {active_subs}\n\n"
-        f"🎫 <b>QR-коды:</b> {activated_qrs} / {total_qrs}\n"
-        f"📝 <b>Заполнено анкет:</b> {total_surveys}\n"
-        f"💘 <b>Сложилось пар:</b> {matches}\n"
+        f"👥 <b>Пользователи:</b> {stats.users}\n"
+        f"✅ <b>Активные подписки:</b> {stats.active_subs}\n\n"
+        f"🎫 <b>QR-коды:</b> {stats.qr_activated} / {stats.qr_total}\n"
+        f"📝 <b>Заполнено анкет:</b> {stats.surveys}\n"
+        f"💘 <b>Сложилось пар:</b> {stats.matches}\n\n"
+        f"<i>Подписки пересчитаны: {refreshed} (МСК)</i>"
     )
     
-    await message.answer(text)
\ No newline at end of file
+    await message.answer(text)
+
+
+# --- ВОРОНКА ПАРТИЙ QR (только почасовые роллапы, без сканов qr_codes) ---
+
+@router.message(Command("batches"))
+async def batches_report(message: Message):
+    """Сводка по последним партиям: конверсия, новые/повторные, дошедшие до 5-й активации."""
+    rows = await batch_summaries()
+    if not rows:
+        await message.answer("🎫 Партий пока нет.")
+        return
+
+    text = "📦 <b>Партии QR-кодов:</b>\n\n" + "\n\n".join(format_summary(row) for row in rows)
+    text += "\n\n<i>/batch &lt;id&gt; — по дням, /batch_export &lt;id&gt; — CSV по часам</i>"
+    await message.answer(text)
+
+
+@router.message(Command("batch"))
+async def batch_report(message: Message, command: CommandObject):
+    batch_id = (command.args or "").strip()
+    if not batch_id:
+        await message.answer("Использование: /batch &lt;id партии&gt;")
+        return
+
+    days = await batch_timeline(batch_id)
+    if not days:
+        await message.answer(f"🤷 По партии <b>{html.escape(batch_id)}</b> активаций за 14 дней нет.")
+        return
+
+    lines = [f"📈 <b>{html.escape(batch_id)}</b> по дням (МСК):"]
+    for row in days:
+        to_fifth = avg_hours_to_fifth(row)
+        lines.append(
+            f"{row.day.astimezone(MSK).strftime('%d.%m')}: {row.activations} "
+            f"(нов. {row.first_activations}, повт. {row.repeat_activations}, 5-я {row.fifth_activations}"
+            + (f", ~{to_fifth} ч" if to_fifth is not None else "") + ")"
+        )
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("batch_export"))
+async def batch_export(message: Message, command: CommandObject):
+    batch_id = (command.args or "").strip()
+    if not batch_id:
+        await message.answer("Использование: /batch_export &lt;id партии&gt;")
+        return
+
+    data = await export_batch_csv(batch_id)
+    await message.answer_document(BufferedInputFile(data, filename=f"batch_{batch_id}_hourly.csv"))
@@ -1,13 +1,17 @@
+from typing import Optional
+
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
-from sqlalchemy import select, and_
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update, exists, literal, and_, func, BigInteger
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from prometheus_client import Counter
 
 from src.database.session import async_session_maker
 from src.database.models import DatingMatch, User
-from src.bot.keyboards.dating import get_contact_kb
+from src.bot.keyboards.dating import get_contact_kb, get_dating_kb, get_next_profile_kb
 from src.services.rabbit import send_to_queue
+from src.services.matching import next_card, CARD_TITLE
 
 # --- OBSERVABILITY ---
 from src.utils.logger import logger
@@ -19,25 +23,57 @@ router = Router()
 DATING_INTERACTIONS = Counter('rex_dating_interactions_total', 'Total dating actions', ['action'])
 DATING_MATCHES = Counter('rex_dating_matches_new_total', 'Total mutual matches found')
 
-# --- ВСПОМОГАТЕЛЬНАЯ ФУНКЦИЯ: Создание записи в БД ---
-async def _create_interaction_record(session: Session, user_id: int, target_user_id: int, action: str) -> bool:
+# --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ: Запись голоса в БД (один запрос) ---
+def _insert_vote(user_id: int, target_user_id: int, action: str, is_match):
+    """INSERT ... ON CONFLICT DO NOTHING: повторный голос (двойной тап) просто ничего не вставит."""
+    values = select(
+        literal(user_id, BigInteger), literal(target_user_id, BigInteger), literal(action), is_match
+    )
+    return (
+        pg_insert(DatingMatch)
+        .from_select(["user_id", "target_user_id", "action", "is_match"], values)
+        .on_conflict_do_nothing(index_elements=["user_id", "target_user_id"])
+        .returning(DatingMatch.id, DatingMatch.is_match)
+    )
+
+
+async def _record_dislike(session: AsyncSession, user_id: int, target_user_id: int) -> bool:
+    """Возвращает True если голос записан, False если юзер уже голосовал."""
+    inserted = await session.execute(_insert_vote(user_id, target_user_id, "dislike", literal(False)))
+    return inserted.first() is not None
+
+
+async def _record_like(session: AsyncSession, user_id: int, target_user_id: int) -> Optional[bool]:
     """
-    Проверяет, было ли уже взаимодействие, и создает новую запись.
-    Возвращает True если успешно, False если запись уже была.
+    Лайк + проверка взаимности + пометка обеих записей как мэтч — одним CTE запросом.
+    Возвращает None если юзер уже голосовал, иначе признак мэтча.
     """
-    # 1. Проверяем, голосовал ли юзер уже
-    existing = await session.execute(
-        select(DatingMatch).where(
-            and_(DatingMatch.user_id == user_id, DatingMatch.target_user_id == target_user_id)
-        )
+    # 0. Одновременные встречные лайки: каждый CTE не видит незакоммиченную запись другого,
+    # и мэтч теряется. Лок на пару (до конца транзакции) выстраивает их друг за другом.
+    pair = f"dating:{min(user_id, target_user_id)}:{max(user_id, target_user_id)}"
+    await session.execute(select(func.pg_advisory_xact_lock(func.hashtextextended(pair, 0))))
+
+    # 1. Встречный лайк (если есть)
+    reverse = select(DatingMatch.id).where(
+        and_(DatingMatch.user_id == target_user_id, DatingMatch.target_user_id == user_id, DatingMatch.action == "like")
+    ).cte("reverse")
+
+    # 2. Наш лайк сразу с is_match, если встречный уже был
+    ins = _insert_vote(
+        user_id, target_user_id, "like", exists(select(reverse.c.id))
+    ).cte("ins")
+
+    # 3. Помечаем встречный лайк, только если наша запись действительно вставилась
+    flip = (
+        update(DatingMatch)
+        .where(DatingMatch.id.in_(select(reverse.c.id)), exists(select(ins.c.id).where(ins.c.is_match)))
+        .values(is_match=True)
+        .returning(DatingMatch.id)
+        .cte("flip")
     )
-    if existing.scalar_one_or_none():
-        return False # Уже голосовал
 
-    # 2. Создаем новую запись
-    record = DatingMatch(user_id=user_id, target_user_id=target_user_id, action=action)
-    session.add(record)
-    return True
+    row = (await session.execute(select(ins.c.is_match).add_cte(flip))).first()
+    return None if row is None else bool(row.is_match)
 
 # --- ВСПОМОГАТЕЛЬНАЯ ФУНКЦИЯ: Формирование упоминания ---
 def _get_user_mention(user: User) -> str:
@@ -60,39 +96,22 @@ async def process_like(callback: CallbackQuery):
             return await callback.answer("Себя лайкать нельзя 😅")
 
         async with async_session_maker() as session:
-            # 1. Создаем запись о лайке (с проверкой)
-            if not await _create_interaction_record(session, user_id, target_user_id, "like"):
+            # 1. Лайк и взаимность — один запрос
+            is_match = await _record_like(session, user_id, target_user_id)
+            if is_match is None:
                 return await callback.answer("Вы уже голосовали за эту анкету.")
-
-            # 2. Проверяем взаимность
-            mutual_like_stmt = select(DatingMatch).where(
-                and_(DatingMatch.user_id == target_user_id, DatingMatch.target_user_id == user_id, DatingMatch.action == "like")
-            )
-            mutual_like = (await session.execute(mutual_like_stmt)).scalar_one_or_none()
-
-            is_match = False
-            if mutual_like:
-                is_match = True
-                # Обновляем обе записи в БД, помечая их как мэтч
-                stmt = select(DatingMatch).where(and_(DatingMatch.user_id == user_id, DatingMatch.target_user_id == target_user_id))
-                my_like_res = await session.execute(stmt)
-                my_like_record = my_like_res.scalar_one_or_none()
-
-                if my_like_record: my_like_record.is_match = True
-                mutual_like.is_match = True
-            
             await session.commit()
 
             # Метрики и логи
             DATING_INTERACTIONS.labels(action="like").inc()
             log.info("dating_like_processed", is_match=is_match)
 
-            # 3. Реакция интерфейса
+            # 2. Реакция интерфейса
             await callback.answer("❤️ Лайк отправлен!")
             await callback.message.edit_reply_markup(reply_markup=None)
-            await callback.message.answer("Анкета обработана. Ждите следующую подборку завтра!")
+            await callback.message.answer("Анкета обработана.", reply_markup=get_next_profile_kb())
 
-            # 4. Если Мэтч — отправляем уведомления
+            # 3. Если Мэтч — отправляем уведомления
             if is_match:
                 DATING_MATCHES.inc()
                 
@@ -134,8 +153,8 @@ async def process_dislike(callback: CallbackQuery):
         log = logger.bind(user_id=user_id, target_id=target_user_id, action="dislike")
 
         async with async_session_maker() as session:
-            # Создаем запись о дизлайке (с проверкой)
-            if not await _create_interaction_record(session, user_id, target_user_id, "dislike"):
+            # Создаем запись о дизлайке (повтор отсекает уникальный ключ)
+            if not await _record_dislike(session, user_id, target_user_id):
                 return await callback.answer("Вы уже голосовали за эту анкету.")
             await session.commit()
 
@@ -144,9 +163,37 @@ async def process_dislike(callback: CallbackQuery):
         log.info("dating_dislike_processed")
 
         await callback.answer("👎 Анкета скрыта.")
-        await callback.message.edit_text("🚫 Вы пропустили эту анкету.")
+        await callback.message.edit_text("🚫 Вы пропустили эту анкету.", reply_markup=get_next_profile_kb())
         
     except Exception as e:
         logger.error("dating_dislike_error", error=str(e), user_id=callback.from_user.id)
         await send_alert(e, context="Dating Dislike Handler")
-        await callback.answer("Ошибка обработки", show_alert=True)
\ No newline at end of file
+        await callback.answer("Ошибка обработки", show_alert=True)
+
+
+@router.callback_query(F.data == "dating_next")
+async def process_next_profile(callback: CallbackQuery):
+    """Показывает следующую анкету из заранее собранной очереди (без похода в БД)."""
+    user_id = callback.from_user.id
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+
+        card = await next_card(user_id)
+        if not card:
+            await callback.answer()
+            return await callback.message.answer("😔 Новых анкет пока нет. Загляните позже!")
+
+        text = CARD_TITLE + card['text']
+        keyboard = get_dating_kb(card['target_user_id'])
+        if card.get('photo'):
+            await callback.message.answer_photo(photo=card['photo'], caption=text, reply_markup=keyboard)
+        else:
+            await callback.message.answer(text, reply_markup=keyboard)
+
+        DATING_INTERACTIONS.labels(action="next").inc()
+        await callback.answer()
+
+    except Exception as e:
+        logger.error("dating_next_error", error=str(e), user_id=user_id)
+        await send_alert(e, context="Dating Next Handler")
+        await callback.answer("Ошибка загрузки анкеты", show_alert=True)
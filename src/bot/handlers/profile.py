@@ -1,8 +1,7 @@
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from src.database.session import async_session_maker
-from src.database.models import User
 from src.bot.keyboards.menu import get_main_menu
+from src.services.user_context import UserContext
 
 # --- OBSERVABILITY ---
 from src.utils.logger import logger
@@ -31,18 +30,12 @@ async def edit_profile_menu(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data == "back_to_main_menu")
-async def back_to_main_menu(callback: CallbackQuery):
+async def back_to_main_menu(callback: CallbackQuery, user_ctx: UserContext):
     """Возвращает в главное меню."""
-    user_id = callback.from_user.id
-    
-    activations = 0
-    async with async_session_maker() as session:
-        user = await session.get(User, user_id)
-        if user:
-            credits = user.natal_chart_credits
+    credits = await user_ctx.menu_credits()
 
     await callback.message.edit_text(
         "🏠 Главное меню:", 
-        reply_markup=get_main_menu(qr_activations=activations)
+        reply_markup=get_main_menu(natal_credits=credits, is_admin=user_ctx.is_admin)
     )
     await callback.answer()
\ No newline at end of file
@@ -2,7 +2,6 @@ import json
 import datetime
 import asyncio
 from aiogram import Router, F, types
-from aiogram.fsm.context import FSMContext
 from aiogram.types import (
     Message, CallbackQuery, 
     InlineKeyboardMarkup, InlineKeyboardButton,
@@ -10,17 +9,26 @@ from aiogram.types import (
 )
 from aiogram.enums import ContentType
 from aiogram.exceptions import TelegramBadRequest
-from sqlalchemy import select, update
+from sqlalchemy import select, update, not_
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.config import settings
 
 # Сервисы и настройки
 from src.services.redis import redis_service 
 from src.bot.states import SurveyState
+from src.bot.fsm import StateDraft
 from src.bot.keyboards.menu import get_cancel_kb, get_main_menu
-from src.database.session import async_session_maker
+from src.services.survey_plans import get_plan
+from src.services.config_sync import survey_config_id
 from src.database.models import UserSurvey, User
+from src.services.user_context import UserContext
 from src.services.rabbit import send_to_queue
 from src.services.horoscope import get_zodiac_sign, RUS_SIGNS
+from src.services.matching import on_profile_saved
+from src.services.geo import resolve_city, get_gazetteer
+from src.utils.checkin import CHECKIN_SLOTS, DEFAULT_SLOT, parse_slot, format_slot, staggered_minute
+from src.bot.keyboards.dating import get_next_profile_kb
+from src.utils.logger import logger
 
 router = Router()
 
@@ -36,41 +44,23 @@ MENU_MAPPING = {
 # --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ---
 
 def is_admin(user_id: int) -> bool:
-    try:
-        admin_ids = [int(x) for x in settings.ADMIN_IDS.split(',')]
-        return user_id in admin_ids
-    except:
-        return False
-
-async def _get_menu_markup(user_id: int) -> ReplyKeyboardMarkup:
-    """Генерирует объект клавиатуры главного меню."""
-    credits = 0
-    if is_admin(user_id):
-        credits = 999
-    else:
-        async with async_session_maker() as session:
-            user = await session.get(User, user_id)
-            if user: credits = user.natal_chart_credits
-            
-    return get_main_menu(natal_credits=credits, is_admin=is_admin(user_id))
+    return user_id in settings.admin_ids
+
+async def _get_menu_markup(user_ctx: UserContext) -> ReplyKeyboardMarkup:
+    """Генерирует объект клавиатуры главного меню (баланс берется из снимка апдейта)."""
+    credits = await user_ctx.menu_credits()
+    return get_main_menu(natal_credits=credits, is_admin=user_ctx.is_admin)
 
 async def safe_delete(bot, chat_id, message_id):
     try: await bot.delete_message(chat_id, message_id)
     except Exception: pass
 
-def get_options_keyboard_inline(options: list) -> InlineKeyboardMarkup:
-    keyboard = []
-    row = []
-    for opt in options:
-        cb_data = f"ans_{opt}"[:64]
-        row.append(InlineKeyboardButton(text=opt, callback_data=cb_data))
-        if len(row) == 2:
-            keyboard.append(row)
-            row = []
-    if row:
-        keyboard.append(row)
-    # Кнопку отмены отсюда убрали, она теперь в Reply (снизу)
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+# Reply-кнопка "Назад" на время анкеты (одна на процесс)
+BACK_KB = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text="↩️ Назад")]],
+    resize_keyboard=True,
+    persistent=True # Важно: помогает кнопке не прятаться
+)
 
 # --- ХЕНДЛЕРЫ МЕНЮ И СПРАВКИ ---
 
@@ -86,64 +76,100 @@ async def show_help(message: Message):
         "   — 🔮 Гороскоп на сегодня.\n"
         "   — ❤️ Поиск партнера.\n\n"
         "📅 <b>Ежедневный трекинг:</b>\n"
-        "Мы будем спрашивать о ваших успехах в 20:00."
+        "Мы будем спрашивать о ваших успехах в выбранное время "
+        f"({', '.join(CHECKIN_SLOTS)}, по умолчанию {format_slot(DEFAULT_SLOT)}).\n"
+        "Время меняется кнопкой «🕗 Отчет в …» в меню режима."
     )
     await message.answer(help_text)
 
-def get_mode_menu_kb(mode: str, is_tracking_on: bool) -> InlineKeyboardMarkup:
+def get_mode_menu_kb(mode: str, is_tracking_on: bool, checkin_slot: int = DEFAULT_SLOT) -> InlineKeyboardMarkup:
     tracking_text = "✅ Трекинг ВКЛ" if is_tracking_on else "❌ Трекинг ВЫКЛ"
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📝 Заполнить/обновить анкету", callback_data=f"start_survey_{mode}")],
-        [InlineKeyboardButton(text=tracking_text, callback_data=f"toggle_tracking_{mode}")]
+        [InlineKeyboardButton(text=tracking_text, callback_data=f"toggle_tracking_{mode}")],
+        [InlineKeyboardButton(text=f"🕗 Отчет в {format_slot(checkin_slot)}", callback_data=f"checkin_time_{mode}")]
+    ])
+
+def get_checkin_slots_kb(mode: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=slot, callback_data=f"checkin_slot_{mode}_{parse_slot(slot)}") for slot in CHECKIN_SLOTS]
     ])
 
 @router.message(F.text.in_(["🥦 Диетолог", "💪 Тренер"]))
-async def show_mode_menu(message: Message):
+async def show_mode_menu(message: Message, user_ctx: UserContext):
     await safe_delete(message.bot, message.chat.id, message.message_id)
     mode = MENU_MAPPING[message.text]
-    async with async_session_maker() as session:
-        user = await session.get(User, message.from_user.id)
-        if not user: return 
-        is_tracking = user.is_diet_tracking if mode == 'diet' else user.is_trainer_tracking
+    user = await user_ctx.get()
+    if not user: return
     
     await message.answer(
         f"Режим <b>{mode.capitalize()}</b>. Настройки:",
-        reply_markup=get_mode_menu_kb(mode, is_tracking)
+        reply_markup=get_mode_menu_kb(mode, user.is_tracking(mode), user.checkin_slot)
     )
 
 @router.callback_query(F.data.startswith("toggle_tracking_"))
-async def toggle_tracking(callback: CallbackQuery):
+async def toggle_tracking(callback: CallbackQuery, session: AsyncSession, user_ctx: UserContext):
     mode = callback.data.split("_")[2]
-    new_status = False 
-    async with async_session_maker() as session:
-        user = await session.get(User, callback.from_user.id)
-        if mode == 'diet':
-            new_status = not user.is_diet_tracking
-            user.is_diet_tracking = new_status
-        elif mode == 'trainer':
-            new_status = not user.is_trainer_tracking
-            user.is_trainer_tracking = new_status
-        await session.commit()
+    if mode not in ('diet', 'trainer'):
+        return await callback.answer()
+    column = User.is_diet_tracking if mode == 'diet' else User.is_trainer_tracking
+
+    # Переключаем флаг прямо в UPDATE: один запрос вместо чтения и записи объекта
+    row = (await session.execute(
+        update(User)
+        .where(User.user_id == callback.from_user.id)
+        .values({column.key: not_(column)})
+        .returning(column, User.checkin_slot)
+    )).first()
+    await session.commit()
+    if not row:
+        return await callback.answer()
+
+    new_status, checkin_slot = row
+    user_ctx.patch(**{column.key: new_status})
     
-    await callback.message.edit_reply_markup(reply_markup=get_mode_menu_kb(mode, new_status))
+    await callback.message.edit_reply_markup(reply_markup=get_mode_menu_kb(mode, new_status, checkin_slot))
     await callback.answer(f"Трекинг {'включен' if new_status else 'выключен'}")
 
+@router.callback_query(F.data.startswith("checkin_time_"))
+async def choose_checkin_time(callback: CallbackQuery):
+    mode = callback.data.split("_")[2]
+    await callback.message.edit_reply_markup(reply_markup=get_checkin_slots_kb(mode))
+    await callback.answer("Во сколько присылать вечерний отчет? (ваше местное время)")
+
+@router.callback_query(F.data.startswith("checkin_slot_"))
+async def set_checkin_time(callback: CallbackQuery, session: AsyncSession, user_ctx: UserContext):
+    _, _, mode, slot = callback.data.split("_")
+    slot = int(slot)
+    user_id = callback.from_user.id
+    # Слот + стабильный сдвиг внутри окна: отправки не слипаются в одну минуту
+    row = (await session.execute(
+        update(User)
+        .where(User.user_id == user_id)
+        .values(checkin_slot=slot, checkin_minute=staggered_minute(user_id, slot))
+        .returning(User.is_diet_tracking, User.is_trainer_tracking)
+    )).first()
+    await session.commit()
+    if not row:
+        return await callback.answer()
+    user_ctx.patch(checkin_slot=slot)
+    is_tracking = row.is_diet_tracking if mode == 'diet' else row.is_trainer_tracking
+
+    await callback.message.edit_reply_markup(reply_markup=get_mode_menu_kb(mode, is_tracking, slot))
+    await callback.answer(f"Отчет будет приходить около {format_slot(slot)}")
+
 # --- ЗАПУСК АНКЕТЫ ---
 
 @router.message(F.text.contains("Натальная карта"))
-async def start_natal_chart(message: Message, state: FSMContext):
+async def start_natal_chart(message: Message, fsm: StateDraft, user_ctx: UserContext):
     await safe_delete(message.bot, message.chat.id, message.message_id)
-    user_id = message.from_user.id
-    if not is_admin(user_id):
-        async with async_session_maker() as session:
-            user = await session.get(User, user_id)
-            if user.natal_chart_credits < 1:
-                await message.answer("❌ Нет попыток. Активируйте больше QR-кодов!")
-                return
-    await _start_survey_logic(message, state, "natal_chart")
+    if await user_ctx.menu_credits() < 1:
+        await message.answer("❌ Нет попыток. Активируйте больше QR-кодов!")
+        return
+    await _start_survey_logic(message, fsm, "natal_chart")
 
 @router.message(F.text.contains("Астро-прогноз"))
-async def start_horoscope(message: Message, state: FSMContext):
+async def start_horoscope(message: Message, fsm: StateDraft):
     await safe_delete(message.bot, message.chat.id, message.message_id)
     user_id = message.from_user.id
     today_str = datetime.date.today().strftime("%Y-%m-%d")
@@ -152,129 +178,104 @@ async def start_horoscope(message: Message, state: FSMContext):
     if viewed and not is_admin(user_id):
         return await message.answer("🔮 Только один прогноз в день!")
         
-    await _start_survey_logic(message, state, "horoscope")
+    await _start_survey_logic(message, fsm, "horoscope")
 
 @router.message(F.text.in_(["❤️ Найти партнера"]))
-async def start_survey_by_text(message: Message, state: FSMContext):
+async def start_survey_by_text(message: Message, fsm: StateDraft):
     await safe_delete(message.bot, message.chat.id, message.message_id)
     mode = MENU_MAPPING[message.text]
-    await _start_survey_logic(message, state, mode)
+    await _start_survey_logic(message, fsm, mode)
 
 @router.callback_query(F.data.startswith(("mode_", "start_survey_")))
-async def start_survey_by_callback(callback: CallbackQuery, state: FSMContext):
+async def start_survey_by_callback(callback: CallbackQuery, fsm: StateDraft):
     mode = callback.data.split("_")[-1]
     # Удаляем меню выбора перед стартом анкеты
     await safe_delete(callback.message.bot, callback.message.chat.id, callback.message.message_id)
-    await _start_survey_logic(callback.message, state, mode)
+    await _start_survey_logic(callback.message, fsm, mode)
     await callback.answer()
 
 # === ЛОГИКА ЗАПУСКА (ИСПРАВЛЕНАЯ) ===
 
-async def _start_survey_logic(message: Message, state: FSMContext, mode: str):
-    questions = await redis_service.get_survey_config(mode)
-    if not questions:
+async def _start_survey_logic(message: Message, fsm: StateDraft, mode: str):
+    plan = await get_plan(mode)
+    if not plan or not plan.questions:
         return await message.answer("⚠️ Режим не настроен.")
 
-    await state.set_state(SurveyState.in_progress)
-    await state.update_data(survey_mode=mode, current_step=0, answers={})
-    
-    first_q = questions[0]
+    first_q = plan.questions[0]
     
     # 1. Отправляем Reply клавиатуру "Назад" и СОХРАНЯЕМ это сообщение
     # (Мы его не удаляем, чтобы кнопка висела!)
-    back_kb = ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text="↩️ Назад")]],
-        resize_keyboard=True,
-        persistent=True # Важно: помогает кнопке не прятаться
-    )
-    
     # Отправляем сообщение-заголовок, которое держит клавиатуру
-    header_msg = await message.answer(f"🚀 <b>Режим: {mode.upper()}</b>", reply_markup=back_kb)
-    
-    # Сохраняем ID хедера, чтобы потом его удалить
-    await state.update_data(survey_header_id=header_msg.message_id)
-
-    # 2. Формируем Inline клавиатуру для вопроса
-    kb = None
-    if first_q['type'] == 'button' and first_q.get('options'):
-        kb = get_options_keyboard_inline(first_q['options'])
-    
-    # 3. Отправляем первый вопрос
-    sent_msg = await message.answer(
-        f"Вопрос 1/{len(questions)}:\n{first_q['text']}", 
-        reply_markup=kb
+    header_msg = await message.answer(plan.header, reply_markup=BACK_KB)
+
+    # 2. Отправляем первый вопрос (текст и Inline клавиатура собраны в плане)
+    sent_msg = await message.answer(first_q.prompt, reply_markup=first_q.keyboard)
+
+    # Новое состояние целиком, одной записью после хендлера.
+    # Версия закрепляется за анкетой: правка таблицы посреди анкеты не сдвинет шаги
+    fsm.clear()
+    fsm.set_state(SurveyState.in_progress)
+    await fsm.update(
+        survey_mode=mode, survey_version=plan.version, current_step=0, answers={},
+        survey_header_id=header_msg.message_id, last_bot_message_id=sent_msg.message_id
     )
-    await state.update_data(last_bot_message_id=sent_msg.message_id)
 
 # --- ОТМЕНА ---
 
 @router.callback_query(F.data == "cancel_survey", SurveyState.in_progress)
-async def cancel_survey_callback(callback: CallbackQuery, state: FSMContext):
-    await _cleanup_survey(callback.message, state)
-    menu = await _get_menu_markup(callback.from_user.id)
+async def cancel_survey_callback(callback: CallbackQuery, fsm: StateDraft, user_ctx: UserContext):
+    await _cleanup_survey(callback.message, fsm)
+    menu = await _get_menu_markup(user_ctx)
     await callback.message.answer("", reply_markup=menu)
 
 @router.message(F.text == "↩️ Назад", SurveyState.in_progress)
-async def cancel_survey_text(message: Message, state: FSMContext):
+async def cancel_survey_text(message: Message, fsm: StateDraft, user_ctx: UserContext):
     # Удаляем само сообщение "Назад"
     await safe_delete(message.bot, message.chat.id, message.message_id)
     
-    await _cleanup_survey(message, state)
+    await _cleanup_survey(message, fsm)
     
-    menu = await _get_menu_markup(message.from_user.id)
+    menu = await _get_menu_markup(user_ctx)
     await message.answer("🏠 Главное меню", reply_markup=menu)
 
-async def _cleanup_survey(message: Message, state: FSMContext):
+async def _cleanup_survey(message: Message, fsm: StateDraft):
     """Удаляет вопросы и хедер с кнопкой Назад."""
-    data = await state.get_data()
+    data = await fsm.data()
     last_id = data.get('last_bot_message_id')
     header_id = data.get('survey_header_id')
     
     if last_id: await safe_delete(message.bot, message.chat.id, last_id)
     if header_id: await safe_delete(message.bot, message.chat.id, header_id)
     
-    await state.clear()
+    fsm.clear()
 
 # --- ПОШАГОВАЯ ОБРАБОТКА ВОПРОСОВ ---
 
 @router.callback_query(F.data.startswith("ans_"), SurveyState.in_progress)
-async def process_button_answer(callback: CallbackQuery, state: FSMContext):
+async def process_button_answer(callback: CallbackQuery, fsm: StateDraft, session: AsyncSession, user_ctx: UserContext):
     answer = callback.data[4:] 
-    await _handle_answer(callback.message, state, answer_value=answer, is_edit=True)
+    await _handle_answer(callback.message, fsm, session, user_ctx, answer_value=answer, is_edit=True)
     await callback.answer()
 
 @router.message(SurveyState.in_progress, F.content_type.in_([ContentType.TEXT, ContentType.PHOTO]))
-async def process_message_answer(message: Message, state: FSMContext):
+async def process_message_answer(message: Message, fsm: StateDraft, session: AsyncSession, user_ctx: UserContext):
     # Удаляем ответ юзера
     await safe_delete(message.bot, message.chat.id, message.message_id)
     
-    data = await state.get_data()
-    mode = data['survey_mode']
-    step = data['current_step']
-    questions = await redis_service.get_survey_config(mode)
-    if not questions: return
-
-    current_q = questions[step]
-    val = None
-    error_msg = None
-    
-    if current_q['type'] == 'photo':
-        if not message.photo: error_msg = "📸 Нужно прислать ФОТО!"
-        else: val = message.photo[-1].file_id
-    else:
-        if not message.text: error_msg = "✍️ Нужно прислать ТЕКСТ!"
-        else:
-            val = message.text.strip()
-            if current_q['key'] == 'birth_date':
-                try: datetime.datetime.strptime(val, "%d.%m.%Y").date()
-                except ValueError: error_msg = "❗️ Неверный формат даты! (ДД.ММ.ГГГГ)"
+    data = await fsm.data()
+    plan = await get_plan(data['survey_mode'], data.get('survey_version'))
+    if not plan:
+        return await _restart_outdated_survey(message, fsm, user_ctx)
+
+    current_q = plan.questions[data['current_step']]
+    val, error_msg = current_q.validate(message)
     
     if error_msg:
         last_id = data.get('last_bot_message_id')
         if last_id:
             try:
                 await message.bot.edit_message_text(
-                    text=f"❗️ <b>{error_msg}</b>\n\n{current_q['text']}",
+                    text=f"❗️ <b>{error_msg}</b>\n\n{current_q.text}",
                     chat_id=message.chat.id,
                     message_id=last_id,
                     reply_markup=get_cancel_kb() # Тут можно оставить Inline Отмену как опцию
@@ -282,28 +283,34 @@ async def process_message_answer(message: Message, state: FSMContext):
             except: pass
         return
 
-    await _handle_answer(message, state, answer_value=val, is_edit=True)
+    await _handle_answer(message, fsm, session, user_ctx, answer_value=val, is_edit=True)
 
-async def _handle_answer(message: Message, state: FSMContext, answer_value, is_edit: bool):
-    data = await state.get_data()
+async def _restart_outdated_survey(message: Message, fsm: StateDraft, user_ctx: UserContext):
+    """Закрепленная версия анкеты больше недоступна — начинаем заново, а не сдвигаем шаги."""
+    await _cleanup_survey(message, fsm)
+    menu = await _get_menu_markup(user_ctx)
+    await message.answer("🔄 Анкета обновилась, пожалуйста, заполните ее заново.", reply_markup=menu)
+
+async def _handle_answer(
+    message: Message, fsm: StateDraft, session: AsyncSession, user_ctx: UserContext, answer_value, is_edit: bool
+):
+    data = await fsm.data()
     mode, step, answers = data['survey_mode'], data['current_step'], data['answers']
     last_bot_msg_id = data.get('last_bot_message_id')
     
-    questions = await redis_service.get_survey_config(mode)
-    current_q = questions[step]
+    # Версия закреплена в FSM: план берется из памяти процесса, без Redis
+    plan = await get_plan(mode, data.get('survey_version'))
+    if not plan:
+        return await _restart_outdated_survey(message, fsm, user_ctx)
+    current_q = plan.questions[step]
     
-    answers[current_q['key']] = answer_value
+    answers[current_q.key] = answer_value
     next_step = step + 1
 
-    if next_step < len(questions):
-        await state.update_data(current_step=next_step, answers=answers)
-        next_q = questions[next_step]
-        
-        kb = None
-        if next_q['type'] == 'button' and next_q.get('options'):
-            kb = get_options_keyboard_inline(next_q['options'])
-        
-        text = f"Вопрос {next_step + 1}/{len(questions)}:\n{next_q['text']}"
+    if next_step < len(plan):
+        await fsm.update(current_step=next_step, answers=answers)
+        next_q = plan.questions[next_step]
+        kb, text = next_q.keyboard, next_q.prompt
         
         if is_edit and last_bot_msg_id:
             try:
@@ -313,26 +320,24 @@ async def _handle_answer(message: Message, state: FSMContext, answer_value, is_e
             except TelegramBadRequest:
                 await safe_delete(message.bot, message.chat.id, last_bot_msg_id)
                 sent = await message.answer(text, reply_markup=kb)
-                await state.update_data(last_bot_message_id=sent.message_id)
+                await fsm.update(last_bot_message_id=sent.message_id)
         else:
             sent = await message.answer(text, reply_markup=kb)
-            await state.update_data(last_bot_message_id=sent.message_id)
+            await fsm.update(last_bot_message_id=sent.message_id)
 
     else:
         # ВОПРОСЫ ЗАКОНЧИЛИСЬ
-        await state.update_data(answers=answers)
+        await fsm.update(answers=answers)
         
         # Проверка согласия (если уже было - пропускаем)
-        user_id = message.chat.id
-        async with async_session_maker() as session:
-            user = await session.get(User, user_id)
-            has_accepted = user.has_accepted_policy if user else False
+        user = await user_ctx.get()
+        has_accepted = user.has_accepted_policy if user else False
             
         if has_accepted:
-            # Сразу финиш
-            await _finish_survey(message, state, user_id, mode, answers)
+            # Сразу финиш (снимок уже загружен — _finish_survey его переиспользует)
+            await _finish_survey(message, fsm, session, user_ctx, mode, answers)
         else:
-            await state.set_state(SurveyState.final_consent)
+            fsm.set_state(SurveyState.final_consent)
             # Удаляем последний вопрос
             if last_bot_msg_id: await safe_delete(message.bot, message.chat.id, last_bot_msg_id)
 
@@ -349,57 +354,75 @@ async def _handle_answer(message: Message, state: FSMContext, answer_value, is_e
 # --- ОБРАБОТКА СОГЛАСИЯ ---
 
 @router.callback_query(SurveyState.final_consent, F.data.in_(["consent_yes", "consent_no"]))
-async def process_consent(callback: CallbackQuery, state: FSMContext):
+async def process_consent(callback: CallbackQuery, fsm: StateDraft, session: AsyncSession, user_ctx: UserContext):
     await safe_delete(callback.bot, callback.message.chat.id, callback.message.message_id)
     user_id = callback.from_user.id
     
     if callback.data == "consent_no":
-        await _cleanup_survey(callback.message, state)
-        menu = await _get_menu_markup(user_id)
+        await _cleanup_survey(callback.message, fsm)
+        menu = await _get_menu_markup(user_ctx)
         return await callback.message.answer("❌ Анкета отменена.", reply_markup=menu)
 
-    # Записываем согласие
-    async with async_session_maker() as session:
-        stmt = update(User).where(User.user_id == user_id).values(has_accepted_policy=True)
-        await session.execute(stmt)
-        await session.commit()
+    # Записываем согласие (коммит — вместе с анкетой в _finish_survey)
+    stmt = update(User).where(User.user_id == user_id).values(has_accepted_policy=True)
+    await session.execute(stmt)
+    user_ctx.patch(has_accepted_policy=True)
 
-    data = await state.get_data()
+    data = await fsm.data()
     mode, answers = data['survey_mode'], data['answers']
     
-    await _finish_survey(callback.message, state, user_id, mode, answers)
+    await _finish_survey(callback.message, fsm, session, user_ctx, mode, answers)
 
 # --- ФИНАЛИЗАЦИЯ (ОБЩАЯ) ---
 
-async def _finish_survey(message: Message, state: FSMContext, user_id: int, mode: str, answers: dict):
+async def _finish_survey(
+    message: Message, fsm: StateDraft, session: AsyncSession, user_ctx: UserContext, mode: str, answers: dict
+):
+    user_id = user_ctx.user_id
+    # Версия, по которой юзер отвечал (закреплена в FSM при старте анкеты)
+    survey_version = (await fsm.data()).get('survey_version')
     # Чистим чат (хедер с кнопкой Назад)
-    await _cleanup_survey(message, state)
-    
-    # Меню для возврата
-    menu = await _get_menu_markup(user_id)
-    
-    async with async_session_maker() as session:
-        user = await session.get(User, user_id)
-        
-        # Кредиты
-        if mode == 'natal_chart' and not is_admin(user_id):
-            if user.natal_chart_credits > 0:
-                user.natal_chart_credits -= 1
-            else:
-                return await message.answer("❌ Нет кредитов.", reply_markup=menu)
-
-        is_tracking_enabled = False
-        if mode == 'diet': is_tracking_enabled = user.is_diet_tracking
-        elif mode == 'trainer': is_tracking_enabled = user.is_trainer_tracking
+    await _cleanup_survey(message, fsm)
 
-        config_map = {'diet': 1, 'trainer': 2, 'dating': 3, 'horoscope': 4, 'natal_chart': 5}
-        config_id = config_map.get(mode, 1)
-
-        new_survey = UserSurvey(user_id=user_id, mode=mode, survey_config_id=config_id, answers=answers)
-        session.add(new_survey)
-        await session.flush()
-        new_survey_id = new_survey.id
-        await session.commit()
+    # Город сразу приводим к каноническому ID из справочника
+    if answers.get('city'):
+        answers['city_id'] = resolve_city(answers['city'])
+    user_tz = get_gazetteer().timezone(answers['city_id']) if answers.get('city_id') else None
+    
+    user = await user_ctx.get()
+    if not user: return
+    checkin_slot = user.checkin_slot
+    is_tracking_enabled = user.is_tracking(mode)
+
+    # Часовой пояс по городу (отчеты приходят по местному времени) и списание кредита —
+    # одним UPDATE; кредит списывается условием в WHERE, без чтения объекта
+    charge = mode == 'natal_chart' and not user_ctx.is_admin
+    values = {}
+    if user_tz:
+        values['timezone'] = user_tz
+    if charge:
+        values['natal_chart_credits'] = User.natal_chart_credits - 1
+    if values:
+        stmt = update(User).where(User.user_id == user_id).values(**values)
+        if charge:
+            stmt = stmt.where(User.natal_chart_credits > 0)
+        credits_left = await session.scalar(stmt.returning(User.natal_chart_credits))
+        if charge:
+            if credits_left is None:
+                return await message.answer("❌ Нет кредитов.", reply_markup=await _get_menu_markup(user_ctx))
+            user_ctx.patch(natal_chart_credits=credits_left)
+
+    config_id = await survey_config_id(session, mode, survey_version)
+
+    new_survey = UserSurvey(user_id=user_id, mode=mode, survey_config_id=config_id, answers=answers)
+    session.add(new_survey)
+    await session.flush()
+    new_survey_id = new_survey.id
+    # Коммитим до публикации задачи: воркер должен увидеть анкету
+    await session.commit()
+
+    # Меню для возврата (баланс уже с учетом списания)
+    menu = await _get_menu_markup(user_ctx)
     
     # Логика по режимам
     if mode in ['diet', 'trainer', 'natal_chart']:
@@ -414,10 +437,22 @@ async def _finish_survey(message: Message, state: FSMContext, user_id: int, mode
                 InlineKeyboardButton(text="👎 Не сейчас", callback_data="ignore")
             ]])
             await asyncio.sleep(0.5) 
-            await message.answer("Включить ежедневный трекинг (20:00)?", reply_markup=tracking_kb)
+            await message.answer(f"Включить ежедневный трекинг ({format_slot(checkin_slot)})?", reply_markup=tracking_kb)
             
     elif mode == 'dating':
-        await message.answer("✅ <b>Анкета сохранена!</b>\nЖдите предложений в 12:00.", reply_markup=menu)
+        await message.answer("✅ <b>Анкета сохранена!</b>", reply_markup=menu)
+        # Сразу собираем очередь кандидатов, чтобы первая анкета открылась мгновенно.
+        # Анкета уже сохранена: сбой Redis/БД здесь не должен ронять апдейт —
+        # тогда очередь пересоберет фоновый refresh_dirty_feeds
+        try:
+            await on_profile_saved(user_id, answers)
+        except Exception as e:
+            logger.error("dating_profile_saved_error", error=str(e), user_id=user_id)
+            try:
+                await redis_service.mark_dating_dirty(user_id)
+            except Exception as e:
+                logger.error("dating_mark_dirty_error", error=str(e), user_id=user_id)
+        await message.answer("Подборка готова 👇", reply_markup=get_next_profile_kb())
         
     elif mode == 'horoscope':
         today_str = datetime.date.today().strftime("%Y-%m-%d")
@@ -1,13 +1,10 @@
 import datetime
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
-from sqlalchemy import select, desc, and_
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
+from redis.exceptions import RedisError
 from prometheus_client import Counter
 
-from src.database.session import async_session_maker
-from src.database.models import DailyTracking
+from src.services.tracking_buffer import tracking_buffer
 
 # --- OBSERVABILITY ---
 from src.utils.logger import logger
@@ -29,38 +26,6 @@ STREAK_MILESTONES = Counter(
     ['mode', 'days']
 )
 
-# --- ВСПОМОГАТЕЛЬНАЯ ЛОГИКА ---
-
-async def _calculate_streak(session: Session, user_id: int, mode: str) -> int:
-    """Считает серию дней для конкретного режима ('diet' или 'trainer')."""
-    stmt = select(DailyTracking).where(
-        and_(
-            DailyTracking.user_id == user_id,
-            DailyTracking.mode == mode
-        )
-    ).order_by(desc(DailyTracking.date))
-    
-    result = await session.execute(stmt)
-    history = result.scalars().all()
-    
-    if not history: return 0
-
-    streak = 0
-    check_date = datetime.date.today()
-    
-    for record in history:
-        if record.date > check_date: continue
-        
-        if record.date == check_date and record.status in ['success', 'partial']:
-            streak += 1
-            check_date -= datetime.timedelta(days=1)
-        elif record.date < check_date:
-            break
-        else:
-            break
-            
-    return streak
-
 # --- ХЕНДЛЕРЫ ЕЖЕДНЕВНОГО ОТЧЕТА ---
 
 @router.callback_query(F.data.startswith("track_"))
@@ -76,45 +41,24 @@ async def process_daily_track(callback: CallbackQuery):
         
         await callback.message.edit_reply_markup(reply_markup=None)
         
-        async with async_session_maker() as session:
-            # 1. Защита от повторного ответа
-            try:
-                existing_stmt = select(DailyTracking).where(
-                    and_(DailyTracking.user_id == user_id, DailyTracking.date == today, DailyTracking.mode == mode)
-                )
-                if (await session.execute(existing_stmt)).scalar_one_or_none():
-                    log.warning("tracking_duplicate_attempt")
-                    return await callback.answer("Вы уже отметились сегодня по этому направлению.", show_alert=True)
+        # 1. Дубль проверяется в Redis, запись уходит в write-behind буфер (без транзакции на каждый тап)
+        try:
+            current_streak = await tracking_buffer.submit(user_id, mode, today, status)
+        except RedisError:
+            log.warning("tracking_buffer_unavailable")
+            current_streak = await tracking_buffer.write_direct(user_id, mode, today, status)
 
-                # 2. Сохраняем
-                track = DailyTracking(user_id=user_id, status=status, date=today, mode=mode)
-                session.add(track)
-                await session.commit()
-                
-                # Метрика: Запись сохранена
-                TRACKING_SUBMISSIONS.labels(mode=mode, status=status).inc()
-                log.info("tracking_saved")
+        if current_streak is None:
+            log.warning("tracking_duplicate_attempt")
+            return await callback.answer("Вы уже отметились сегодня по этому направлению.", show_alert=True)
 
-            except IntegrityError:
-                await session.rollback()
-                log.warning("tracking_integrity_error")
-                return await callback.answer("Ошибка сохранения.", show_alert=True)
-            
-            # 3. Считаем стрик для этого режима
-            current_streak = await _calculate_streak(session, user_id, mode)
-            
-            # 4. Выдача награды
-            if current_streak == 7:
-                log.info("streak_milestone_reached", days=7)
-                STREAK_MILESTONES.labels(mode=mode, days="7").inc()
-                
-                await callback.message.answer(
-                    "🎉 <b>НЕДЕЛЯ ПОБЕД!</b>\n"
-                    f"Вы 7 дней подряд следуете плану ({'питание' if mode == 'diet' else 'тренировки'}).\n\n"
-                    "🎁 Ваш промокод: <code>HEALTH7DAY</code>"
-                )
+        # Метрика: Отметка принята
+        TRACKING_SUBMISSIONS.labels(mode=mode, status=status).inc()
+        log.info("tracking_saved")
+        # Отвечаем сразу — в БД строка попадет со следующим сбросом буфера
+        await callback.answer()
 
-        # 5. Ответ пользователю
+        # 2. Ответ пользователю
         msg_text = ""
         if status == 'success':
             msg_text = f"🔥 Отлично! Серия ({mode}): {current_streak} дн."
@@ -124,7 +68,17 @@ async def process_daily_track(callback: CallbackQuery):
             msg_text = f"Ничего, завтра наверстаете! Серия ({mode}) сброшена."
 
         await callback.message.edit_text(callback.message.text + f"\n\n<b>Итог: {msg_text}</b>")
-        await callback.answer()
+
+        # 3. Выдача награды
+        if current_streak == 7:
+            log.info("streak_milestone_reached", days=7)
+            STREAK_MILESTONES.labels(mode=mode, days="7").inc()
+            
+            await callback.message.answer(
+                "🎉 <b>НЕДЕЛЯ ПОБЕД!</b>\n"
+                f"Вы 7 дней подряд следуете плану ({'питание' if mode == 'diet' else 'тренировки'}).\n\n"
+                "🎁 Ваш промокод: <code>HEALTH7DAY</code>"
+            )
 
     except Exception as e:
         logger.error("tracking_process_failed", error=str(e), user_id=callback.from_user.id)
@@ -20,4 +20,9 @@ def get_contact_kb(username: str) -> InlineKeyboardMarkup:
     url = f"https://t.me/{username}" if username else "https://t.me/"
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="💬 Написать партнеру", url=url)]
-    ])
\ No newline at end of file
+    ])
+def get_next_profile_kb() -> InlineKeyboardMarkup:
+    """Кнопка показа следующей анкеты из очереди кандидатов"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="➡️ Следующая анкета", callback_data="dating_next")]
+    ])
@@ -48,4 +48,18 @@ def get_main_menu(natal_credits: int = 0, is_admin: bool = False) -> ReplyKeyboa
 def get_cancel_kb() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="❌ Прервать анкету", callback_data="cancel_survey")]
-    ])
\ No newline at end of file
+    ])
+
+def get_options_keyboard_inline(options: list) -> InlineKeyboardMarkup:
+    keyboard = []
+    row = []
+    for opt in options:
+        cb_data = f"ans_{opt}"[:64]
+        row.append(InlineKeyboardButton(text=opt, callback_data=cb_data))
+        if len(row) == 2:
+            keyboard.append(row)
+            row = []
+    if row:
+        keyboard.append(row)
+    # Кнопку отмены отсюда убрали, она теперь в Reply (снизу)
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
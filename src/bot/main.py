@@ -11,12 +11,14 @@ from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.filters import CommandStart, CommandObject
 from aiogram.types import Message
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 
 from src.config import settings
 from src.database.session import async_session_maker
 from src.database.models import User, QRCode
-from sqlalchemy import select
+from sqlalchemy import select, update, case
 from src.services.redis import redis_client
 
 # --- OBSERVABILITY ---
@@ -33,14 +35,21 @@ from src.bot.handlers import profile as profile_router
 from src.bot.handlers import admin as admin_router
 
 from src.bot.middlewares.check_sub import CheckSubscriptionMiddleware
+from src.bot.middlewares.user_context import UserContextMiddleware
+from src.bot.middlewares.dedupe import DedupeUpdatesMiddleware
+from src.bot.middlewares.fsm_draft import StateDraftMiddleware
+from src.bot.fsm import compact_dumps, compact_loads
+from src.services.tracking_buffer import tracking_buffer
+from src.services.subscription_cache import invalidate_subscription
+from src.services.qr_filter import qr_filter
+from src.services.config_sync import config_watcher, warm_start
+from src.services.qr_analytics import record_activation
+
+SUBSCRIPTION_PERIOD = datetime.timedelta(days=5)
 
 # Хелпер для проверки админа
 def is_admin(user_id: int) -> bool:
-    try:
-        admin_ids = [int(x) for x in settings.ADMIN_IDS.split(',')]
-        return user_id in admin_ids
-    except:
-        return False
+    return user_id in settings.admin_ids
 
 async def start_handler(message: Message, command: CommandObject):
     args = command.args 
@@ -48,6 +57,12 @@ async def start_handler(message: Message, command: CommandObject):
     
     log = logger.bind(user_id=user_id, command="start")
     USER_UPDATES.labels(type="command_start").inc()
+
+    # Несуществующий код (опечатка, перебор) отсекаем в памяти, без БД
+    if args and not await qr_filter.may_exist(args):
+        log.warning("invalid_qr_attempt", code_hash=args, rejected_by="filter")
+        await message.answer("❌ Неверный QR-код.")
+        return
     
     async with async_session_maker() as session:
         # 1. Проверяем или создаем юзера
@@ -84,22 +99,60 @@ async def start_handler(message: Message, command: CommandObject):
         # 2. Активация QR кода
         if args:
             qr_hash = args
-            q_stmt = select(QRCode).where(QRCode.code_hash == qr_hash)
-            q_res = await session.execute(q_stmt)
-            qr = q_res.scalar_one_or_none()
-
-            # --- БЛОК ПРОВЕРОК ---
-            if not qr:
-                log.warning("invalid_qr_attempt", code_hash=qr_hash)
-                await message.answer("❌ Неверный QR-код.")
-                return
+            now = datetime.datetime.now(datetime.timezone.utc)
 
-            if not qr.is_active:
-                log.warning("inactive_qr_attempt", code_hash=qr_hash)
-                await message.answer("❌ Этот код деактивирован администратором.")
-                return
+            # --- АКТИВАЦИЯ ---
+            # Один атомарный запрос: код забирает только тот, чей UPDATE прошел условие.
+            # Два одновременных скана одного кода — ровно один победитель.
+            activated = (
+                update(QRCode)
+                .where(
+                    QRCode.code_hash == qr_hash,
+                    QRCode.activated_at.is_(None),
+                    QRCode.is_active.is_(True),
+                )
+                .values(activated_at=now, activated_by_id=user_id)
+                .returning(QRCode.activated_by_id, QRCode.batch_id)
+                .cte("activated")
+            )
+            new_count = User.qr_activations_count + 1
+            stmt = (
+                update(User)
+                .where(User.user_id == activated.c.activated_by_id)
+                .values(
+                    qr_activations_count=new_count,
+                    # Кредит на натальную карту — ТОЛЬКО за 5-ю активацию
+                    natal_chart_credits=User.natal_chart_credits + case((new_count == 5, 1), else_=0),
+                    # Подписка: продлеваем действующую или начинаем заново
+                    subscription_expires_at=case(
+                        (User.subscription_expires_at > now, User.subscription_expires_at + SUBSCRIPTION_PERIOD),
+                        else_=now + SUBSCRIPTION_PERIOD,
+                    ),
+                )
+                .returning(
+                    User.qr_activations_count, User.natal_chart_credits, User.subscription_expires_at,
+                    activated.c.batch_id,
+                )
+            )
+            row = (await session.execute(stmt)).first()
+
+            # --- БЛОК ПРОВЕРОК (только если код не достался нам) ---
+            if not row:
+                q_res = await session.execute(
+                    select(QRCode.is_active, QRCode.activated_by_id).where(QRCode.code_hash == qr_hash)
+                )
+                qr = q_res.first()
+
+                if not qr:
+                    log.warning("invalid_qr_attempt", code_hash=qr_hash)
+                    await message.answer("❌ Неверный QR-код.")
+                    return
+
+                if not qr.is_active:
+                    log.warning("inactive_qr_attempt", code_hash=qr_hash)
+                    await message.answer("❌ Этот код деактивирован администратором.")
+                    return
 
-            if qr.activated_at:
                 if qr.activated_by_id == user_id:
                     await message.answer("ℹ️ Вы уже активировали этот код ранее.")
                 else:
@@ -108,39 +161,30 @@ async def start_handler(message: Message, command: CommandObject):
                 
                 await message.answer("🏠 Главное меню:", reply_markup=menu_kb)
                 return
-            
-            # --- АКТИВАЦИЯ ---
-            now = datetime.datetime.now(datetime.timezone.utc)
-            qr.activated_at = now
-            qr.activated_by_id = user_id
-            user.qr_activations_count += 1
-            
-            # Логика начисления КРЕДИТОВ (каждый 3-й код)
+
+            activation_count, natal_credits, expires_at, batch_id = row
+            # Почасовая воронка партии — в той же транзакции, что и активация
+            await record_activation(session, batch_id, user_id, activation_count, now)
+
+            await session.commit()
+            # Подписка изменилась — сбрасываем кэш проверки доступа
+            await invalidate_subscription(user_id)
+
+            log.info("qr_activated_successfully", code_hash=qr_hash, activation_count=activation_count)
+
             bonus_msg = ""
-            # Даем кредит ТОЛЬКО если это 5-я активация
-            if user.qr_activations_count == 5:
-                user.natal_chart_credits += 1
+            if activation_count == 5:
                 bonus_msg = "\n\n🌟 <b>Поздравляем!</b> Вы активировали 5 кодов! Вам доступна <b>Натальная карта</b> (1 раз)."
-            elif user.qr_activations_count < 5:
-                left = 5 - user.qr_activations_count
+            elif activation_count < 5:
+                left = 5 - activation_count
                 bonus_msg = f"\n\n(Активируйте еще {left} шт., чтобы открыть Натальную карту)"
             # Если > 5, то ничего не пишем и кредиты не даем
-            # ----------------------------------------
-            # Обновляем подписку
-            if user.subscription_expires_at and user.subscription_expires_at > now:
-                user.subscription_expires_at += datetime.timedelta(days=5)
-            else:
-                user.subscription_expires_at = now + datetime.timedelta(days=5)
-            
-            await session.commit()
-            
-            log.info("qr_activated_successfully", code_hash=qr_hash, activation_count=user.qr_activations_count)
             
-            expires_str = user.subscription_expires_at.strftime("%d.%m.%Y")
+            expires_str = expires_at.strftime("%d.%m.%Y")
             
             # Обновляем меню с учетом НОВЫХ кредитов
             new_menu_kb = get_main_menu(
-                natal_credits=user.natal_chart_credits, # <--- ИСПРАВЛЕНО
+                natal_credits=natal_credits,
                 is_admin=False
             )
             
@@ -160,22 +204,42 @@ async def start_handler(message: Message, command: CommandObject):
         else:
              await message.answer("👋 Привет! Я REX Bot.\nДля доступа к диетологу и тренировкам отсканируйте QR-код с упаковки.")
 
-# --- ЗАПУСК ---
-async def main():
-    logger.info("service_started", service="bot_polling")
-    
-    storage = RedisStorage(redis=redis_client)
-    
-    bot = Bot(
+# --- СБОРКА БОТА И ДИСПЕТЧЕРА (общая для polling и webhook) ---
+def create_bot() -> Bot:
+    session = None
+    if settings.BOT_API_URL:
+        # Свой Bot API сервер (локальный фейк для тестов webhook-режима)
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.BOT_API_URL))
+    return Bot(
         token=settings.BOT_TOKEN.get_secret_value(), 
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+
+def create_dispatcher() -> Dispatcher:
+    # FSM в Redis: любая реплика продолжает анкету с того же шага.
+    # Компактный кодек + TTL: брошенные анкеты сами уходят из памяти Redis
+    storage = RedisStorage(
+        redis=redis_client,
+        state_ttl=settings.FSM_TTL_SECONDS,
+        data_ttl=settings.FSM_TTL_SECONDS,
+        json_loads=compact_loads,
+        json_dumps=compact_dumps,
+    )
     dp = Dispatcher(storage=storage)
 
     # --- ПОДКЛЮЧЕНИЕ MIDDLEWARE (ВАЖНО!) ---
+    # Повторы update_id отсекаем до всего остального (несколько реплик / ретраи)
+    dp.update.outer_middleware(DedupeUpdatesMiddleware())
+    # Внешний: сессия на апдейт + ленивый снимок юзера (data["session"], data["user_ctx"])
+    dp.message.outer_middleware(UserContextMiddleware())
+    dp.callback_query.outer_middleware(UserContextMiddleware())
     # Ставим его ДО роутеров, чтобы проверять всё
     dp.message.middleware(CheckSubscriptionMiddleware())
     dp.callback_query.middleware(CheckSubscriptionMiddleware())
+    # Данные FSM: одно чтение и одна запись на апдейт (data["fsm"])
+    dp.message.middleware(StateDraftMiddleware())
+    dp.callback_query.middleware(StateDraftMiddleware())
     # ---------------------------------------
 
     # ПОДКЛЮЧЕНИЕ РОУТЕРОВ
@@ -192,6 +256,23 @@ async def main():
     dp.message.register(start_handler, CommandStart())
     
     # Echo handler убран. Бот будет молчать на неизвестные сообщения.
+    return dp
+
+# --- ЗАПУСК ---
+async def main():
+    logger.info("service_started", service="bot_polling")
+    
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    # Write-behind буфер отметок трекинга
+    tracking_buffer.start()
+    # Фильтр существующих QR-кодов (новые партии подтягиваются по версии в Redis)
+    await qr_filter.refresh()
+    # Анкеты и промпты из последнего снимка в БД (Redis мог быть очищен, Google недоступен)
+    await warm_start()
+    # Смена анкет в таблице -> сброс кэша актуальных версий
+    config_watcher.start()
 
     logger.info("bot_polling_started")
     try:
@@ -200,6 +281,10 @@ async def main():
         logger.critical("bot_crashed", error=str(e))
         await send_alert(e, context="Bot Polling Service")
         raise e
+    finally:
+        # Дописываем накопленные отметки в БД до выхода
+        await tracking_buffer.stop()
+        await config_watcher.stop()
 
 if __name__ == "__main__":
     if sys.platform == 'win32':
@@ -1,11 +1,8 @@
-import datetime
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, TelegramObject
-from sqlalchemy import select
 
-from src.database.session import async_session_maker
-from src.database.models import User
+from src.services.subscription_cache import has_active_subscription
 from src.config import settings
 
 class CheckSubscriptionMiddleware(BaseMiddleware):
@@ -30,24 +27,16 @@ class CheckSubscriptionMiddleware(BaseMiddleware):
         if not user:
             return await handler(event, data)
 
-        # 2. Исключение для Админов
-        admin_ids = [int(x) for x in settings.ADMIN_IDS.split(',')]
-        if user.id in admin_ids:
+        # 2. Исключение для Админов (список разобран один раз при старте)
+        if user.id in settings.admin_ids:
             return await handler(event, data)
 
-        # 3. Проверка в Базе Данных
-        async with async_session_maker() as session:
-            db_user = await session.get(User, user.id)
-            
-            # Если юзера нет или подписка истекла
-            if not db_user or not db_user.subscription_expires_at:
-                return await self.send_block_message(event)
-            
-            # Сравниваем даты (с учетом часового пояса UTC)
-            now = datetime.datetime.now(datetime.timezone.utc)
-            
-            if db_user.subscription_expires_at < now:
-                return await self.send_block_message(event)
+        # 3. Проверка подписки через кэш (процесс -> Redis -> БД).
+        # При промахе читаем снимок юзера из UserContext: тот же SELECT потом достанется хендлеру
+        user_ctx = data.get("user_ctx")
+        load = user_ctx.subscription_expiry if user_ctx else None
+        if not await has_active_subscription(user.id, load):
+            return await self.send_block_message(event)
 
         # 4. Если все ок — пропускаем дальше
         return await handler(event, data)
@@ -0,0 +1,48 @@
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+
+from src.config import settings
+from src.services.redis import redis_service
+
+# --- OBSERVABILITY ---
+from src.utils.logger import logger
+
+UPDATES_DEDUPED = Counter('rex_bot_updates_deduped_total', 'Updates dropped as already seen by some replica')
+
+
+class DedupeUpdatesMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на уровне Update: update_id обрабатывается ровно одной репликой.
+    Повторная доставка (ретрай Telegram, балансировщик, перезапуск реплики) отбрасывается.
+    Отметку после ошибки не снимаем: вебхук обрабатывает апдейты в фоне и отвечает Telegram 200 сразу,
+    так что повтора упавшего апдейта все равно не будет (исключение логирует aiogram).
+    """
+    def __init__(self, ttl: int = None):
+        self.ttl = ttl or settings.UPDATE_DEDUPE_TTL
+        self.log = logger.bind(middleware="dedupe")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        try:
+            claimed = await redis_service.claim_update(event.update_id, self.ttl)
+        except RedisError as e:
+            # Redis недоступен: лучше редкий дубль, чем потерянный апдейт
+            self.log.error("update_dedupe_unavailable", update_id=event.update_id, error=str(e))
+            return await handler(event, data)
+
+        if not claimed:
+            UPDATES_DEDUPED.inc()
+            self.log.info("update_duplicate_skipped", update_id=event.update_id)
+            return None
+
+        return await handler(event, data)
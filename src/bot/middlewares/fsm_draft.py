@@ -0,0 +1,27 @@
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from src.bot.fsm import StateDraft
+
+
+class StateDraftMiddleware(BaseMiddleware):
+    """
+    Кладет в data["fsm"] StateDraft поверх FSMContext и записывает его после хендлера.
+    Хендлер, не тронувший fsm, не делает ни одного обращения к Redis за данными.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        state = data.get("state")
+        if state is None:
+            return await handler(event, data)
+
+        draft = StateDraft(state)
+        data["fsm"] = draft
+        result = await handler(event, data)
+        await draft.flush()
+        return result
@@ -0,0 +1,35 @@
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from src.database.session import async_session_maker
+from src.services.user_context import UserContext
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """
+    Внешний middleware: одна сессия (unit of work) на апдейт и ленивый снимок юзера.
+    В data кладутся:
+      session  — общая сессия для middleware и хендлера;
+      user_ctx — UserContext, снимок users грузится максимум одним SELECT.
+    Если хендлер завершился без ошибки, незакоммиченные изменения фиксируются здесь.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+
+        # Сессия не берет соединение из пула, пока к ней не обратились
+        async with async_session_maker() as session:
+            data["session"] = session
+            if user:
+                data["user_ctx"] = UserContext(session, user.id)
+
+            result = await handler(event, data)
+
+            if session.in_transaction():
+                await session.commit()
+            return result
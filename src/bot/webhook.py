@@ -0,0 +1,159 @@
+import asyncio
+import sys
+import uuid
+from os.path import abspath, dirname
+
+# Пути
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from sqlalchemy import text
+
+from src.config import settings
+from src.database.session import async_session_maker
+from src.services.redis import redis_client, redis_service
+from src.services.tracking_buffer import tracking_buffer
+from src.services.qr_filter import qr_filter
+from src.services.config_sync import config_watcher, warm_start
+from src.bot.main import create_bot, create_dispatcher
+
+# --- OBSERVABILITY ---
+from src.utils.logger import logger
+from src.utils.metrics import start_metrics_server
+from src.utils.alerting import send_alert
+
+# Реплик много, а setWebhook достаточно одного: остальные пропускают регистрацию
+WEBHOOK_SETUP_LOCK = "webhook_setup"
+WEBHOOK_SETUP_LOCK_TTL_MS = 60_000
+READINESS_TIMEOUT = 2
+
+# Ключи в приложении aiohttp
+BOT_KEY = web.AppKey("bot", Bot)
+DISPATCHER_KEY = web.AppKey("dispatcher", Dispatcher)
+READY_KEY = web.AppKey("ready", dict)
+
+
+# --- HEALTH / READINESS ---
+
+async def healthz(request: web.Request) -> web.Response:
+    """Liveness: процесс жив и event loop отвечает."""
+    return web.json_response({"status": "ok"})
+
+
+async def readyz(request: web.Request) -> web.Response:
+    """
+    Readiness: можно ли слать трафик на эту реплику.
+    Не готовы, пока не стартовали, во время остановки и без Redis (FSM + дедуп) или БД.
+    """
+    checks = {"started": request.app[READY_KEY]["started"]}
+
+    async def check_redis():
+        await redis_client.ping()
+
+    async def check_db():
+        async with async_session_maker() as session:
+            await session.execute(text("SELECT 1"))
+
+    for name, check in (("redis", check_redis), ("db", check_db)):
+        try:
+            await asyncio.wait_for(check(), timeout=READINESS_TIMEOUT)
+            checks[name] = True
+        except Exception as e:
+            logger.warning("readiness_check_failed", check=name, error=str(e))
+            checks[name] = False
+
+    status = 200 if all(checks.values()) else 503
+    return web.json_response({"status": "ready" if status == 200 else "not_ready", "checks": checks}, status=status)
+
+
+# --- ЖИЗНЕННЫЙ ЦИКЛ ---
+
+async def _register_webhook(bot: Bot, dp: Dispatcher):
+    """setWebhook делает одна реплика; при гонке остальные просто пропускают шаг."""
+    token = uuid.uuid4().hex
+    if not await redis_service.acquire_lock(WEBHOOK_SETUP_LOCK, token, WEBHOOK_SETUP_LOCK_TTL_MS):
+        logger.info("webhook_setup_skipped", reason="another_replica")
+        return
+
+    try:
+        await bot.set_webhook(
+            url=settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET.get_secret_value() if settings.WEBHOOK_SECRET else None,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False,
+        )
+    except Exception as e:
+        # Вебхук не зарегистрирован — отпускаем лок, чтобы следующая реплика (или рестарт) повторила вызов
+        logger.error("webhook_setup_failed", error=str(e))
+        await redis_service.release_lock(WEBHOOK_SETUP_LOCK, token)
+        raise
+    # Лок не снимаем: пусть доживет TTL, чтобы одновременно поднятые реплики не повторяли вызов
+    logger.info("webhook_registered", url=settings.WEBHOOK_URL)
+
+
+async def on_startup(app: web.Application):
+    bot, dp = app[BOT_KEY], app[DISPATCHER_KEY]
+    if settings.WEBHOOK_URL:
+        await _register_webhook(bot, dp)
+
+    # Write-behind буфер отметок трекинга (сброс защищен локом, реплик может быть сколько угодно)
+    tracking_buffer.start()
+    # Фильтр существующих QR-кодов (новые партии подтягиваются по версии в Redis)
+    await qr_filter.refresh()
+    # Анкеты и промпты из последнего снимка в БД (Redis мог быть очищен, Google недоступен)
+    await warm_start()
+    # Смена анкет в таблице -> сброс кэша актуальных версий
+    config_watcher.start()
+    app[READY_KEY]["started"] = True
+    logger.info("bot_webhook_started", port=settings.WEBHOOK_PORT, path=settings.WEBHOOK_PATH)
+
+
+async def on_shutdown(app: web.Application):
+    # Сначала выпадаем из балансировщика, потом досбрасываем буфер.
+    # deleteWebhook не вызываем: остальные реплики продолжают принимать апдейты
+    app[READY_KEY]["started"] = False
+    await tracking_buffer.stop()
+    await config_watcher.stop()
+    logger.info("bot_webhook_stopped")
+
+
+def create_app() -> web.Application:
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    app = web.Application()
+    app[BOT_KEY] = bot
+    app[DISPATCHER_KEY] = dp
+    app[READY_KEY] = {"started": False}
+
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=settings.WEBHOOK_SECRET.get_secret_value() if settings.WEBHOOK_SECRET else None,
+    ).register(app, path=settings.WEBHOOK_PATH)
+
+    # Хуки aiogram (старт/стоп диспетчера, закрытие сессии бота) + наши
+    setup_application(app, dp, bot=bot)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    start_metrics_server(8002)
+    logger.info("service_started", service="bot_webhook")
+
+    try:
+        web.run_app(create_app(), host=settings.WEBHOOK_HOST, port=settings.WEBHOOK_PORT, print=None)
+    except Exception as e:
+        logger.critical("bot_crashed", error=str(e))
+        asyncio.run(send_alert(e, context="Bot Webhook Service"))
+        raise
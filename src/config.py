@@ -1,3 +1,4 @@
+from functools import cached_property
 from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import SecretStr
@@ -15,6 +16,8 @@ class Settings(BaseSettings):
     # --- Google ---
     GOOGLE_CREDENTIALS_FILE: str
     GOOGLE_SHEET_ID: str
+    # Свой сервер Sheets/Drive API без авторизации (фейковый для локальных проверок)
+    GOOGLE_API_URL: Optional[str] = None
 
     # --- LLM ---
     OPENAI_API_KEY: SecretStr
@@ -27,6 +30,48 @@ class Settings(BaseSettings):
     SQUID_PROXY_USER: str
     SQUID_PROXY_PASSWORD: str
 
+    # --- Dating ---
+    # Шардированный (по городам) пакетный подбор в пуле процессов
+    MATCHING_SHARDED: bool = True
+    # Размер пула процессов (None = по числу ядер)
+    MATCHING_PROCESSES: Optional[int] = None
+    # Радиус поиска пары (км) по справочнику городов
+    DATING_RADIUS_KM: int = 50
+
+    # --- Tracking check-ins ---
+    # Время вечернего отчета по умолчанию (местное время юзера)
+    CHECKIN_DEFAULT_SLOT: str = "20:00"
+    # Окно, на которое размазываем отправку внутри слота (минуты)
+    CHECKIN_WINDOW_MINUTES: int = 60
+    DEFAULT_TIMEZONE: str = "Europe/Moscow"
+    # Write-behind буфер отметок: сброс в БД каждые N мс или при N накопленных строк
+    TRACKING_FLUSH_INTERVAL_MS: int = 500
+    TRACKING_FLUSH_MAX_ROWS: int = 500
+    # Сколько месяцев daily_tracking держим детально (старше — только месячные итоги)
+    TRACKING_RETENTION_MONTHS: int = 3
+    TRACKING_PARTITIONS_AHEAD: int = 2
+
+    # --- Webhook (горизонтально масштабируемые реплики бота) ---
+    # Публичный URL, который регистрируем в Telegram (None = webhook не выставляем)
+    WEBHOOK_URL: Optional[str] = None
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: Optional[SecretStr] = None
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    # Сколько помним update_id для отсечения повторов (сек)
+    UPDATE_DEDUPE_TTL: int = 3600
+    # Свой Bot API сервер (например, фейковый для локальных тестов)
+    BOT_API_URL: Optional[str] = None
+
+    # --- FSM ---
+    # Сколько живет брошенная анкета в Redis (ключи состояния и данных FSM)
+    FSM_TTL_SECONDS: int = 2 * 86400
+
+    @cached_property
+    def admin_ids(self) -> frozenset[int]:
+        """ADMIN_IDS, разобранный один раз на процесс."""
+        return frozenset(int(x) for x in self.ADMIN_IDS.split(',') if x.strip())
+
     # --- Конфигурация Pydantic ---
     model_config = SettingsConfigDict(
         env_file='.env', 
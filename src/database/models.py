@@ -1,16 +1,29 @@
 import datetime
-from sqlalchemy import BigInteger, String, Boolean, DateTime, ForeignKey, Integer, JSON, Text, Date
+from sqlalchemy import BigInteger, String, Boolean, DateTime, ForeignKey, Integer, SmallInteger, JSON, Text, Date, UniqueConstraint, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.ext.asyncio import AsyncAttrs
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
+
+from src.config import settings
+from src.utils.checkin import DEFAULT_SLOT, staggered_minute
 
 # Базовый класс для всех моделей
 class Base(AsyncAttrs, DeclarativeBase):
     pass
 
+def _default_checkin_minute(context) -> int:
+    params = context.get_current_parameters()
+    return staggered_minute(params['user_id'], params.get('checkin_slot') or DEFAULT_SLOT)
+
 # 1. Пользователи
 class User(Base):
     __tablename__ = 'users'
+    # Корзины рассылки отчетов: (минута, пояс) -> маленький индексный запрос раз в минуту
+    __table_args__ = (
+        Index('ix_users_checkin_bucket', 'checkin_minute', 'timezone'),
+        # Счетчик активных подписок для админки — диапазон по индексу, а не полный скан
+        Index('ix_users_subscription_expires_at', 'subscription_expires_at'),
+    )
 
     user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)  # Telegram ID
     username: Mapped[str | None] = mapped_column(String(255), nullable=True)
@@ -28,6 +41,13 @@ class User(Base):
     is_diet_tracking: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
     is_trainer_tracking: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
     has_accepted_policy: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
+
+    # Часовой пояс (по городу из анкеты) и слот вечернего отчета в минутах местного времени
+    timezone: Mapped[str] = mapped_column(String(64), default=settings.DEFAULT_TIMEZONE, server_default=settings.DEFAULT_TIMEZONE)
+    checkin_slot: Mapped[int] = mapped_column(SmallInteger, default=DEFAULT_SLOT, server_default=str(DEFAULT_SLOT))
+    # Минута отправки = слот + стабильный сдвиг внутри окна (см. staggered_minute)
+    # server_default — для вставок мимо ORM (без сдвига, ровно минута слота по умолчанию)
+    checkin_minute: Mapped[int] = mapped_column(SmallInteger, default=_default_checkin_minute, server_default=str(DEFAULT_SLOT))
     # ----------------------------
 
     created_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
@@ -39,6 +59,8 @@ class User(Base):
 # 2. QR Коды
 class QRCode(Base):
     __tablename__ = 'qr_codes'
+    # Первая активация юзера (время до 5-й активации в воронке партий)
+    __table_args__ = (Index('ix_qr_codes_activated_by_id', 'activated_by_id'),)
 
     code_hash: Mapped[str] = mapped_column(String(64), primary_key=True) # Уникальный хэш
     batch_id: Mapped[str] = mapped_column(String(50)) # Номер партии
@@ -51,9 +73,35 @@ class QRCode(Base):
     
     activated_by_user: Mapped["User"] = relationship(back_populates="qr_activation")
 
+# 2.1 Партии QR-кодов (размер пополняется генератором вместе с вставкой кодов)
+class QRBatch(Base):
+    __tablename__ = 'qr_batches'
+
+    batch_id: Mapped[str] = mapped_column(String(50), primary_key=True)
+    codes: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+# 2.2 Почасовая воронка активаций партии (пишется в транзакции активации, см. services/qr_analytics.py)
+class QRBatchHourly(Base):
+    __tablename__ = 'qr_batch_hourly'
+
+    batch_id: Mapped[str] = mapped_column(String(50), primary_key=True)
+    hour: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+
+    activations: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    first_activations: Mapped[int] = mapped_column(Integer, default=0, server_default="0")  # Первый код юзера
+    repeat_activations: Mapped[int] = mapped_column(Integer, default=0, server_default="0") # Юзер уже активировал раньше
+    fifth_activations: Mapped[int] = mapped_column(Integer, default=0, server_default="0")  # Дошли до 5-й активации
+    seconds_to_fifth: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0") # Сумма: 1-я -> 5-я активация
+
 # 3. Конфигурация анкет (Версионирование)
 class SurveyConfig(Base):
     __tablename__ = 'survey_configs'
+    __table_args__ = (
+        UniqueConstraint('mode', 'version', name='uq_survey_configs_mode_version'),
+        # Ровно одна актуальная версия на режим (пишет синхронизация, см. services/config_sync.py)
+        Index('ux_survey_configs_current', 'mode', unique=True, postgresql_where=text('is_current')),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     mode: Mapped[str] = mapped_column(String(20)) # 'diet', 'fitness', 'dating'
@@ -65,6 +113,17 @@ class SurveyConfig(Base):
     created_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
     is_current: Mapped[bool] = mapped_column(Boolean, default=True)
 
+# 3.1 Снимки всех анкет и промптов (пишет каждая успешная синхронизация; с них стартуют сервисы)
+class ConfigSnapshot(Base):
+    __tablename__ = 'config_snapshots'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    version: Mapped[str] = mapped_column(String(12), unique=True) # хэш содержимого
+    marker: Mapped[str | None] = mapped_column(String(64), nullable=True) # версия файла в Google Drive
+    surveys: Mapped[dict] = mapped_column(JSON)
+    prompts: Mapped[dict] = mapped_column(JSON)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
 # 4. Ответы пользователей
 class UserSurvey(Base):
     __tablename__ = 'user_surveys'
@@ -88,6 +147,8 @@ class UserSurvey(Base):
 # 5. Дейтинг (Мэтчи)
 class DatingMatch(Base):
     __tablename__ = 'dating_matches'
+    # Один голос на пару: защищает от двойных тапов и дает ON CONFLICT DO NOTHING
+    __table_args__ = (UniqueConstraint('user_id', 'target_user_id', name='uq_dating_matches_pair'),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     
@@ -102,6 +163,12 @@ class DatingMatch(Base):
 # 6. Ежедневный трекинг
 class DailyTracking(Base):
     __tablename__ = 'daily_tracking'
+    # Одна отметка в день на режим: буфер пишет через ON CONFLICT DO NOTHING.
+    # Таблица разбита на месячные партиции по date (см. services/tracking_partitions.py)
+    __table_args__ = (
+        UniqueConstraint('user_id', 'mode', 'date', name='uq_daily_tracking_user_mode_date'),
+        {'postgresql_partition_by': 'RANGE (date)'},
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('users.user_id'))
@@ -110,7 +177,48 @@ class DailyTracking(Base):
     mode: Mapped[str] = mapped_column(String(20), default="diet", server_default="diet") 
 
     # ТУТ Я ПОМЕНЯЛ DateTime на Date для строгости
-    date: Mapped[datetime.date] = mapped_column(Date, default=func.current_date())
+    # Ключ партиции обязан входить в первичный ключ, поэтому PK = (id, date)
+    date: Mapped[datetime.date] = mapped_column(Date, primary_key=True, default=func.current_date())
     status: Mapped[str] = mapped_column(String(20)) # 'success', 'partial', 'fail'
     
-    created_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
\ No newline at end of file
+    created_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
+
+# 6.1 Месячные итоги трекинга (сюда сворачиваются старые партиции daily_tracking)
+class TrackingMonthly(Base):
+    __tablename__ = 'tracking_monthly'
+
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.user_id'), primary_key=True)
+    mode: Mapped[str] = mapped_column(String(20), primary_key=True)
+    month: Mapped[datetime.date] = mapped_column(Date, primary_key=True) # Первое число месяца
+
+    success: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    partial: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    fail: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+# 7. Сводка трекинга (обновляется вместе с каждой отметкой)
+class TrackingStats(Base):
+    __tablename__ = 'tracking_stats'
+
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.user_id'), primary_key=True)
+    mode: Mapped[str] = mapped_column(String(20), primary_key=True)
+
+    current_streak: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    last_date: Mapped[datetime.date | None] = mapped_column(Date, nullable=True)
+
+    # Последние 7 дней, начиная с last_date: 's'/'p'/'f', '-' если отметки не было
+    recent: Mapped[str] = mapped_column(String(7), default="", server_default="")
+    week_success: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    week_partial: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    week_fail: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+    updated_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now(), onupdate=func.now())
+
+# 8. Счетчики админки (ведутся триггерами на users / qr_codes / user_surveys / dating_matches,
+# см. миграцию f6b8d0e2a357). Значение метрики = сумма по шардам
+class AdminCounter(Base):
+    __tablename__ = 'admin_counters'
+
+    metric: Mapped[str] = mapped_column(String(32), primary_key=True)
+    shard: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,79 @@
+import asyncio
+import sys
+from os.path import abspath, dirname
+
+# Магия путей, чтобы видеть папку src
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from src.database.session import async_session_maker
+from src.database.models import DailyTracking, TrackingStats
+from src.services.tracking_stats import apply_checkin
+
+UPSERT_CHUNK = 2000
+STREAM_BATCH = 10000
+
+STATS_COLUMNS = ("current_streak", "last_date", "recent", "week_success", "week_partial", "week_fail")
+
+
+def _to_row(stats: TrackingStats) -> dict:
+    row = {"user_id": stats.user_id, "mode": stats.mode}
+    row.update({col: getattr(stats, col) for col in STATS_COLUMNS})
+    return row
+
+
+async def _upsert(session, rows: list):
+    stmt = pg_insert(TrackingStats).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "mode"],
+        set_={col: stmt.excluded[col] for col in STATS_COLUMNS},
+    )
+    await session.execute(stmt)
+
+
+async def backfill():
+    """Пересчитывает tracking_stats по всей истории daily_tracking одним проходом."""
+    print("🔄 Пересчет сводок трекинга...")
+
+    stmt = (
+        select(DailyTracking.user_id, DailyTracking.mode, DailyTracking.date, DailyTracking.status)
+        .order_by(DailyTracking.user_id, DailyTracking.mode, DailyTracking.date)
+        .execution_options(yield_per=STREAM_BATCH)
+    )
+
+    rows, total = [], 0
+    current = None
+
+    async with async_session_maker() as read_session, async_session_maker() as write_session:
+        # Идем по истории потоком (серверный курсор), в памяти только текущий юзер/режим
+        result = await read_session.stream(stmt)
+        async for user_id, mode, date, status in result:
+            if current is None or (current.user_id, current.mode) != (user_id, mode):
+                if current is not None:
+                    rows.append(_to_row(current))
+                current = TrackingStats(user_id=user_id, mode=mode, current_streak=0, recent="")
+            apply_checkin(current, date, status)
+
+            if len(rows) >= UPSERT_CHUNK:
+                await _upsert(write_session, rows)
+                total += len(rows)
+                rows = []
+                print(f"   ...{total} сводок")
+
+        if current is not None:
+            rows.append(_to_row(current))
+        if rows:
+            await _upsert(write_session, rows)
+            total += len(rows)
+
+        await write_session.commit()
+
+    print(f"💾 Готово! Обновлено сводок: {total}")
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(backfill())
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from os.path import abspath, dirname
+
+# Магия путей, чтобы видеть папку src
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from sqlalchemy import event
+
+from src.config import settings
+from src.database.session import engine
+from src.services.matching import compute_feeds, run_daily_matching, last_similarity_run
+from src.scripts.gen_population import generate_population, load_population, drop_population
+
+DEFAULT_SIZES = "1000,10000,100000"
+
+
+class QueryCounter:
+    """Считает SQL запросы, ушедшие в БД через наш engine."""
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+async def bench_one(size: int, target: str, seed: int, avg_seen: int) -> dict:
+    profiles, seen = generate_population(size, seed, avg_seen)
+
+    if target == "postgres":
+        await drop_population()
+        await load_population(profiles, seen)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with QueryCounter() as queries:
+        if target == "postgres":
+            feeds = await run_daily_matching(dry_run=True)
+        else:
+            # In-memory: та же вычислительная часть, без БД
+            feeds, _ = await compute_feeds(profiles, seen)
+    runtime = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if target == "postgres":
+        await drop_population()
+
+    covered = sum(1 for uid in profiles if feeds.get(uid))
+    return {
+        "size": size,
+        "target": target,
+        "sharded": settings.MATCHING_SHARDED,
+        "runtime_sec": round(runtime, 3),
+        "db_queries": queries.count,
+        "similarity_build_sec": round(last_similarity_run["build_sec"], 3),
+        "similarity_top_k_sec": round(last_similarity_run["top_k_sec"], 3),
+        "vocabulary": last_similarity_run["vocabulary"],
+        "memory_peak_mb": round(peak / 2 ** 20, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        # Шарды считаются в пуле процессов: максимум RSS среди завершившихся дочерних
+        "children_max_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "coverage": round(covered / max(size, 1), 4),
+        "avg_feed_len": round(sum(len(f) for f in feeds.values()) / max(len(feeds), 1), 2),
+    }
+
+
+def find_regressions(results: list, baseline: list, tolerance: float) -> list:
+    """Сравнивает с сохраненным прогоном: время/память выросли или покрытие упало больше допуска."""
+    base = {(r["size"], r["target"], r["sharded"]): r for r in baseline}
+    problems = []
+    for r in results:
+        b = base.get((r["size"], r["target"], r["sharded"]))
+        if not b:
+            continue
+        for key in ("runtime_sec", "similarity_top_k_sec", "memory_peak_mb", "children_max_rss_mb", "db_queries"):
+            if b.get(key) and r[key] > b[key] * (1 + tolerance):
+                problems.append(f"size={r['size']}: {key} {b[key]} -> {r[key]}")
+        if r["coverage"] < b["coverage"] * (1 - tolerance):
+            problems.append(f"size={r['size']}: coverage {b['coverage']} -> {r['coverage']}")
+    return problems
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк пакетного подбора пар")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Размеры популяций через запятую")
+    parser.add_argument("--target", choices=["memory", "postgres"], default="memory")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--avg-seen", type=int, default=20)
+    parser.add_argument("--no-sharded", action="store_true", help="Считать в одном процессе")
+    parser.add_argument("--save", help="Сохранить результаты в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для поиска регрессий")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.no_sharded:
+        settings.MATCHING_SHARDED = False
+
+    print(f"🏁 Бенчмарк подбора: target={args.target}, sharded={settings.MATCHING_SHARDED}")
+    print("   (память: tracemalloc основного процесса + max RSS процессов пула шардов)")
+
+    results = []
+    for size in [int(x) for x in args.sizes.split(",")]:
+        result = await bench_one(size, args.target, args.seed, args.avg_seen)
+        results.append(result)
+        print(
+            f"📊 {size:>7} анкет | {result['runtime_sec']:>8.2f} с | запросов БД: {result['db_queries']:>3} | "
+            f"пик памяти: {result['memory_peak_mb']:>7.1f} МБ (пул: {result['children_max_rss_mb']:.1f} МБ RSS) | "
+            f"покрытие: {result['coverage']:.1%} | очередь: {result['avg_feed_len']}"
+        )
+        print(
+            f"   🔤 TF-IDF: словарь {result['vocabulary']} | сборка {result['similarity_build_sec']:.2f} с | "
+            f"top-k {result['similarity_top_k_sec']:.2f} с"
+        )
+        if not result["vocabulary"]:
+            print("❌ Пустой словарь TF-IDF: соседи по 'О себе' не считаются, замеры подбора недостоверны.")
+            sys.exit(1)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты сохранены в {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = find_regressions(results, json.load(f), args.tolerance)
+        if problems:
+            print("❌ Регрессии:\n" + "\n".join(f"   — {p}" for p in problems))
+            sys.exit(1)
+        print("✅ Регрессий нет.")
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
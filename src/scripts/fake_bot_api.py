@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import itertools
+import random
+import sys
+import time
+from collections import Counter
+from os.path import abspath, dirname
+
+# Магия путей, чтобы видеть папку src
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from aiohttp import ClientSession, web
+
+# Локальная проверка webhook-режима без Telegram:
+#   1) поднимаем фейковый Bot API (отвечает на вызовы бота),
+#   2) реплики бота запускаем с BOT_API_URL=http://localhost:8081,
+#   3) шлем апдейты на реплики по кругу, часть — повторно на другую реплику (проверка дедупа).
+#
+#   BOT_API_URL=http://localhost:8081 WEBHOOK_PORT=8080 python -m src.bot.webhook
+#   BOT_API_URL=http://localhost:8081 WEBHOOK_PORT=8090 python -m src.bot.webhook
+#   python -m src.scripts.fake_bot_api --webhooks http://localhost:8080/webhook,http://localhost:8090/webhook
+
+FAKE_BOT = {"id": 1, "is_bot": True, "first_name": "REX Fake", "username": "rex_fake_bot"}
+TEXTS = ["/start", "ℹ️ Справка", "🥦 Диетолог", "💪 Тренер"]
+
+
+class FakeBotAPI:
+    """Минимальный Bot API: отвечает ok на любые методы, считает вызовы."""
+    def __init__(self):
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    def _message(self, params) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            "from": FAKE_BOT,
+            "text": params.get("text", ""),
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] += 1
+
+        if method == "getMe":
+            result = FAKE_BOT
+        elif method in ("sendMessage", "sendPhoto", "editMessageText", "editMessageReplyMarkup"):
+            result = self._message(params)
+        else:
+            # setWebhook, answerCallbackQuery, deleteMessage и прочие — просто True
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+
+def make_update(update_id: int, user_id: int) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"Test {user_id}"}
+    text = random.choice(TEXTS)
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": user,
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return {"update_id": update_id, "message": message}
+
+
+async def post_updates(args, api: FakeBotAPI):
+    webhooks = [url.strip() for url in args.webhooks.split(",") if url.strip()]
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    replicas = itertools.cycle(webhooks)
+    start_id = random.randint(1, 10**9)
+
+    # План доставки: каждый апдейт + часть повторов на другую реплику
+    deliveries = []
+    for i in range(args.updates):
+        update = make_update(start_id + i, random.randint(1, args.users))
+        deliveries.append((next(replicas), update))
+        if random.random() < args.duplicates:
+            deliveries.append((next(replicas), update))
+
+    async with ClientSession() as http:
+        async def deliver(url, update):
+            async with semaphore:
+                try:
+                    async with http.post(url, json=update, headers=headers) as resp:
+                        statuses[resp.status] += 1
+                except Exception as e:
+                    statuses[type(e).__name__] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(deliver(url, update) for url, update in deliveries))
+        elapsed = time.perf_counter() - started
+
+    # Даем репликам доделать фоновую обработку
+    await asyncio.sleep(args.settle)
+
+    print(f"📨 Доставок: {len(deliveries)} (уникальных апдейтов: {args.updates}) за {elapsed:.2f} c "
+          f"-> {len(deliveries) / elapsed if elapsed else 0:.0f} upd/s")
+    print(f"📡 HTTP статусы: {dict(statuses)}")
+    print(f"🤖 Вызовы Bot API: {dict(api.calls)}")
+    print(f"🔁 Повторов отправлено: {len(deliveries) - args.updates} "
+          f"(ожидаем, что бот ответил на каждый апдейт один раз)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Фейковый Bot API + генератор апдейтов для webhook-реплик")
+    parser.add_argument("--port", type=int, default=8081, help="Порт фейкового Bot API")
+    parser.add_argument("--webhooks", default="http://localhost:8080/webhook", help="URL реплик через запятую")
+    parser.add_argument("--secret", default=None, help="WEBHOOK_SECRET реплик")
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duplicates", type=float, default=0.1, help="Доля апдейтов, доставляемых повторно")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--settle", type=float, default=3.0, help="Пауза перед отчетом (сек)")
+    parser.add_argument("--serve-only", action="store_true", help="Только Bot API, без отправки апдейтов")
+    args = parser.parse_args()
+
+    api = FakeBotAPI()
+    runner = web.AppRunner(api.app())
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", args.port).start()
+    print(f"🧪 Fake Bot API слушает :{args.port}")
+
+    try:
+        if args.serve_only:
+            await asyncio.Event().wait()
+        else:
+            await post_updates(args, api)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import datetime
+import sys
+from collections import Counter
+from os.path import abspath, dirname
+
+# Магия путей, чтобы видеть папку src
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from aiohttp import web
+
+# Локальная проверка синхронизации анкет без Google:
+#   1) поднимаем фейковый Sheets/Drive API (таблица в памяти, версия растет при правке),
+#   2) синхронизацию запускаем с GOOGLE_API_URL=http://localhost:8082,
+#   3) правим таблицу: curl -X POST http://localhost:8082/edit
+#
+#   python -m src.scripts.fake_sheets_api --serve-only
+#   GOOGLE_API_URL=http://localhost:8082 python -m src.scripts.update_surveys
+#
+# Без --serve-only скрипт сам гоняет клиент: чтение, повтор без правок, правка, чтение — и печатает вызовы API.
+
+SHEET_ID = "stub-sheet"
+
+QUESTIONS = [
+    ["mode", "key", "type", "text", "options"],
+    ["diet", "weight", "text", "Ваш вес (кг)?"],
+    ["diet", "goal", "button", "Цель?", "Похудеть, Набрать, Держать"],
+    ["trainer", "level", "button", "Уровень подготовки?", "Новичок, Средний, Профи"],
+    ["horoscope", "birth_date", "text", "Дата рождения (ДД.ММ.ГГГГ)?"],
+]
+PROMPTS = [
+    ["mode", "prompt"],
+    ["diet", "Ты диетолог. Вес {weight}, цель {goal}."],
+    ["trainer", "Ты тренер. Уровень {level}."],
+    ["horoscope", "Ты астролог. Составь краткий гороскоп для {sign}."],
+]
+
+
+class FakeSheetsAPI:
+    """Минимальные Drive files.get, spreadsheets.get и values:batchGet; считает вызовы."""
+    def __init__(self):
+        self.calls = Counter()
+        self.version = 1
+        self.modified = datetime.datetime.now(datetime.timezone.utc)
+        self.sheets = {"Анкеты": [row[:] for row in QUESTIONS], "Prompts": [row[:] for row in PROMPTS]}
+
+    def edit(self):
+        """Правка промпта — как если бы кто-то поменял ячейку в таблице."""
+        self.sheets["Prompts"][1][1] += " Пиши кратко."
+        self.version += 1
+        self.modified = datetime.datetime.now(datetime.timezone.utc)
+
+    async def drive_file(self, request: web.Request) -> web.Response:
+        self.calls["drive.files.get"] += 1
+        return web.json_response({"version": str(self.version), "modifiedTime": self.modified.isoformat()})
+
+    async def spreadsheet(self, request: web.Request) -> web.Response:
+        self.calls["spreadsheets.get"] += 1
+        sheets = [{"properties": {"title": title, "index": i}} for i, title in enumerate(self.sheets)]
+        return web.json_response({"sheets": sheets})
+
+    async def batch_get(self, request: web.Request) -> web.Response:
+        self.calls["values.batchGet"] += 1
+        value_ranges = []
+        for a1 in request.query.getall("ranges", []):
+            title = a1.rsplit("!", 1)[0].strip("'").replace("''", "'")
+            if title not in self.sheets:
+                return web.json_response({"error": {"code": 400, "message": f"Unable to parse range: {a1}"}}, status=400)
+            value_ranges.append({"range": a1, "majorDimension": "ROWS", "values": self.sheets[title]})
+        return web.json_response({"spreadsheetId": request.match_info["sheet_id"], "valueRanges": value_ranges})
+
+    async def handle_edit(self, request: web.Request) -> web.Response:
+        self.edit()
+        return web.json_response({"version": self.version})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/drive/v3/files/{sheet_id}", self.drive_file)
+        app.router.add_get("/v4/spreadsheets/{sheet_id}", self.spreadsheet)
+        app.router.add_get("/v4/spreadsheets/{sheet_id}/values:batchGet", self.batch_get)
+        app.router.add_post("/edit", self.handle_edit)
+        return app
+
+
+async def run_check(api: FakeSheetsAPI, port: int):
+    from src.services.sheets import SheetsClient
+
+    client = SheetsClient(SHEET_ID, f"http://localhost:{port}")
+    try:
+        first = await client.fetch()
+        client.mark_synced(first.marker)
+        print(f"1️⃣ Первое чтение: анкеты {sorted(first.surveys)}, промпты {sorted(first.prompts)} | {dict(api.calls)}")
+
+        api.calls.clear()
+        second = await client.fetch()
+        print(f"2️⃣ Без правок: {'пропущено' if second is None else 'ПРОЧИТАНО ЗАНОВО'} | {dict(api.calls)}")
+
+        api.calls.clear()
+        api.edit()
+        third = await client.fetch()
+        changed = third is not None and third.prompts["diet"] != first.prompts["diet"]
+        print(f"3️⃣ После правки: {'изменение получено' if changed else 'ИЗМЕНЕНИЕ ПОТЕРЯНО'} | {dict(api.calls)}")
+    finally:
+        await client.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Фейковый Google Sheets/Drive API для проверки синхронизации анкет")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--serve-only", action="store_true", help="Только API, без прогона клиента")
+    args = parser.parse_args()
+
+    api = FakeSheetsAPI()
+    runner = web.AppRunner(api.app())
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", args.port).start()
+    print(f"🧪 Fake Sheets API слушает :{args.port} (таблица {SHEET_ID})")
+
+    try:
+        if args.serve_only:
+            await asyncio.Event().wait()
+        else:
+            await run_check(api, args.port)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import datetime
+import random
+import sys
+from os.path import abspath, dirname
+
+# Магия путей, чтобы видеть папку src
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from sqlalchemy import insert, delete
+
+from src.database.session import async_session_maker
+from src.database.models import User, UserSurvey, DatingMatch
+from src.services.geo import get_gazetteer
+
+# Синтетические пользователи живут в отдельном диапазоне ID, чтобы не пересекаться с Telegram
+SYNTHETIC_ID_START = 10 ** 12
+DATING_CONFIG_ID = 3  # См. init_configs.py
+INSERT_CHUNK = 5000
+
+# --- РАСПРЕДЕЛЕНИЯ ---
+
+# Как люди на самом деле пишут свой город (вариант ответа, вес)
+CITY_ANSWERS = [
+    (["Москва", "москва", "Мск", "г. Москва", "Москва, Россия"], 0.22),
+    (["Санкт-Петербург", "Питер", "СПб", "спб"], 0.12),
+    (["Новосибирск", "Новосиб"], 0.04),
+    (["Екатеринбург", "Екб"], 0.04),
+    (["Казань"], 0.03),
+    (["Нижний Новгород", "Нижний"], 0.03),
+    (["Краснодар"], 0.03),
+    (["Московская обл.", "Подмосковье"], 0.04),
+    (["Кукуево", "пгт Лесной", "деревня"], 0.05),
+    ([""], 0.05),
+]  # Остаток (~35%) — равномерно по справочнику
+
+SPORTS = [
+    ("Бег", 20), ("Зал", 25), ("Йога", 10), ("Плавание", 8), ("Велосипед", 7), ("Футбол", 6),
+    ("Теннис", 4), ("Бокс", 4), ("Кроссфит", 5), ("Лыжи", 3), ("Танцы", 5), ("Скалолазание", 2),
+    ("Волейбол", 3), ("Сноуборд", 2), ("Пилатес", 3),
+]
+LEVELS = ["Новичок", "Любитель", "Продвинутый", "Профи"]
+
+ABOUT_WORDS = (
+    "люблю утренние пробежки горы походы путешествия море кофе книги кино сериалы музыка концерты "
+    "собаки кошки готовить здоровое питание программист врач учитель дизайнер маркетолог студент "
+    "ищу партнера для тренировок марафон полумарафон триатлон велопрогулки турники растяжка медитация "
+    "спокойный активный веселый серьезный отношения дружба общение выходные дача рыбалка фотография"
+).split()
+
+
+def _pick_city(rng: random.Random, other_cities: list) -> str:
+    roll = rng.random()
+    acc = 0.0
+    for variants, weight in CITY_ANSWERS:
+        acc += weight
+        if roll < acc:
+            return rng.choice(variants)
+    return rng.choice(other_cities)
+
+
+def _pick_sports(rng: random.Random):
+    """Виды спорта в обоих форматах, которые понимает _normalize_list."""
+    if rng.random() < 0.05:
+        return ""
+    names, weights = zip(*SPORTS)
+    picked = list(dict.fromkeys(rng.choices(names, weights=weights, k=rng.randint(1, 3))))
+    return ", ".join(picked) if rng.random() < 0.5 else picked
+
+
+def _make_profile(rng: random.Random, idx: int, other_cities: list) -> dict:
+    is_male = rng.random() < 0.55
+    age = int(min(65, max(18, rng.gauss(31 if is_male else 28, 7 if is_male else 6))))
+
+    answers = {
+        "name": f"User{idx}",
+        "gender": "Мужской" if is_male else "Женский",
+        "age": f"{age} лет" if rng.random() < 0.2 else str(age),
+        "city": _pick_city(rng, other_cities),
+        "sports": _pick_sports(rng),
+        "level": rng.choice(LEVELS),
+        "about": " ".join(rng.choices(ABOUT_WORDS, k=rng.randint(3, 15))),
+        "photo": None,
+    }
+
+    roll = rng.random()
+    if roll < 0.05:
+        answers["partner_gender"] = "Любой"
+    elif roll < 0.9:
+        answers["partner_gender"] = "Женский" if is_male else "Мужской"
+
+    if rng.random() < 0.8:
+        answers["partner_age_min"] = str(max(18, age - rng.randint(2, 8)))
+        answers["partner_age_max"] = str(age + rng.randint(2, 10))
+
+    return answers
+
+
+def generate_population(size: int, seed: int = 42, avg_seen: int = 20) -> tuple:
+    """
+    Генерирует реалистичную популяцию анкет знакомств.
+    Возвращает (profiles, seen): {user_id: answers}, {user_id: {target_id, ...}}.
+    """
+    rng = random.Random(seed)
+    other_cities = [c["name"] for c in get_gazetteer().cities.values()]
+
+    ids = [SYNTHETIC_ID_START + i for i in range(size)]
+    profiles = {uid: _make_profile(rng, i, other_cities) for i, uid in enumerate(ids)}
+
+    # Плотность истории просмотров: у кого-то пусто, у кого-то сотни
+    seen = {}
+    if size > 1:
+        for uid in ids:
+            count = min(size - 1, int(rng.expovariate(1 / avg_seen))) if avg_seen else 0
+            if count:
+                targets = set(rng.sample(ids, count))
+                targets.discard(uid)
+                seen[uid] = targets
+
+    return profiles, seen
+
+
+# --- ЗАГРУЗКА В POSTGRES ---
+
+async def load_population(profiles: dict, seen: dict):
+    """Заливает популяцию в БД (users, user_surveys, dating_matches) пачками через Core insert."""
+    expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=30)
+
+    users = [{"user_id": uid, "full_name": a["name"], "subscription_expires_at": expires} for uid, a in profiles.items()]
+    surveys = [
+        {"user_id": uid, "mode": "dating", "survey_config_id": DATING_CONFIG_ID, "answers": a}
+        for uid, a in profiles.items()
+    ]
+    matches = [
+        {"user_id": uid, "target_user_id": target, "action": "dislike"}
+        for uid, targets in seen.items() for target in targets
+    ]
+
+    async with async_session_maker() as session:
+        for table, rows in ((User, users), (UserSurvey, surveys), (DatingMatch, matches)):
+            for start in range(0, len(rows), INSERT_CHUNK):
+                await session.execute(insert(table), rows[start:start + INSERT_CHUNK])
+        await session.commit()
+
+
+async def drop_population():
+    """Удаляет всех синтетических пользователей."""
+    async with async_session_maker() as session:
+        await session.execute(delete(DatingMatch).where(DatingMatch.user_id >= SYNTHETIC_ID_START))
+        await session.execute(delete(UserSurvey).where(UserSurvey.user_id >= SYNTHETIC_ID_START))
+        await session.execute(delete(User).where(User.user_id >= SYNTHETIC_ID_START))
+        await session.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Генератор синтетической популяции для знакомств")
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--avg-seen", type=int, default=20)
+    parser.add_argument("--drop", action="store_true", help="Только удалить синтетических пользователей")
+    args = parser.parse_args()
+
+    print("🧹 Удаляю прошлую синтетическую популяцию...")
+    await drop_population()
+    if args.drop:
+        return
+
+    profiles, seen = generate_population(args.size, args.seed, args.avg_seen)
+    print(f"🚀 Загружаю {len(profiles)} анкет и {sum(len(s) for s in seen.values())} просмотров...")
+    await load_population(profiles, seen)
+    print("💾 Готово!")
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
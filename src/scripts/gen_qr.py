@@ -1,69 +1,168 @@
+import argparse
 import asyncio
 import csv
+import os
 import secrets
 import sys
+import time
 from os.path import abspath, dirname
 
 # Магия путей, чтобы видеть папку src
 sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
 
-from sqlalchemy import insert
-from src.database.session import async_session_maker
-from src.database.models import QRCode
+from src.database.session import engine
+from src.services.qr_filter import notify_qr_batch_created
 
-# Настройки
+# Настройки по умолчанию
 BATCH_ID = "BATCH_001_TEST" # Номер партии
-COUNT = 100                 # Сколько кодов генерируем (для теста хватит 100, потом поставишь 1_000_000)
+COUNT = 100                 # Сколько кодов генерируем
 BOT_USERNAME = "Rex_te7st_bot" # Твой юзернейм бота (без @)
+CHUNK = 50_000              # Кодов за одну транзакцию COPY
+
+CSV_HEADER = ["Full Link", "Token"]
+
+# Чанк идет через временную таблицу: COPY туда, затем INSERT ... ON CONFLICT DO NOTHING.
+# Так коллизии с уже существующими кодами отсеиваются в БД, а не падают всей транзакцией.
+# ON COMMIT DROP — чтобы работать и через pgbouncer в transaction-режиме.
+CREATE_STAGE_SQL = "CREATE TEMP TABLE qr_stage (code_hash varchar(64)) ON COMMIT DROP"
+MOVE_STAGE_SQL = """
+    INSERT INTO qr_codes (code_hash, batch_id, is_active)
+    SELECT code_hash, $1, true FROM qr_stage
+    ON CONFLICT (code_hash) DO NOTHING
+    RETURNING code_hash
+"""
+# Размер партии для воронки активаций — в той же транзакции, что и сами коды
+UPSERT_BATCH_SQL = """
+    INSERT INTO qr_batches (batch_id, codes) VALUES ($1, $2)
+    ON CONFLICT (batch_id) DO UPDATE SET codes = qr_batches.codes + EXCLUDED.codes
+"""
+
+
+def make_tokens(count: int) -> set[str]:
+    """Случайные токены (8 байт = 11 символов base64, url-safe), без повторов внутри чанка."""
+    tokens = set()
+    while len(tokens) < count:
+        tokens.add(secrets.token_urlsafe(8))
+    return tokens
+
+
+def make_link(bot_username: str, token: str) -> str:
+    return f"https://t.me/{bot_username}?start={token}"
 
-async def generate_codes():
-    print(f"🚀 Начинаю генерацию {COUNT} QR-кодов для партии {BATCH_ID}...")
-    
-    codes_data = []
-    csv_rows = []
-    
-    # 1. Генерируем данные в памяти
-    for _ in range(COUNT):
-        # Генерируем случайный токен (8 байт = 11 символов base64, url-safe)
-        token = secrets.token_urlsafe(8) 
-        
-        # Данные для БД
-        codes_data.append({
-            "code_hash": token,
-            "batch_id": BATCH_ID,
-            "is_active": True
-        })
-        
-        # Данные для CSV
-        link = f"https://t.me/{BOT_USERNAME}?start={token}"
-        csv_rows.append([link, token])
-
-    print("✅ Генерация в памяти завершена. Записываю в БД...")
-
-    # 2. Массовая вставка в Postgres (Bulk Insert)
-    # Мы используем Core (insert), а не ORM, потому что это в 100 раз быстрее для больших объемов
-    async with async_session_maker() as session:
-        try:
-            stmt = insert(QRCode).values(codes_data)
-            await session.execute(stmt)
-            await session.commit()
-            print("💾 Успешно сохранено в PostgreSQL!")
-        except Exception as e:
-            print(f"❌ Ошибка при записи в БД: {e}")
-            await session.rollback()
-            return
 
-    # 3. Сохранение в CSV
-    filename = f"qr_codes_{BATCH_ID}.csv"
-    with open(filename, "w", newline="", encoding="utf-8") as f:
+async def insert_chunk(conn, batch_id: str, count: int) -> tuple[list[str], int]:
+    """
+    Вставляет ровно count новых кодов.
+    Возвращает (вставленные токены, число коллизий с уже существующими кодами).
+    """
+    inserted, collisions = [], 0
+    while len(inserted) < count:
+        tokens = make_tokens(count - len(inserted))
+        async with conn.transaction():
+            await conn.execute(CREATE_STAGE_SQL)
+            await conn.copy_records_to_table("qr_stage", records=((t,) for t in tokens), columns=["code_hash"])
+            rows = await conn.fetch(MOVE_STAGE_SQL, batch_id)
+            await conn.execute(UPSERT_BATCH_SQL, batch_id, len(rows))
+        inserted.extend(row["code_hash"] for row in rows)
+        collisions += len(tokens) - len(rows)
+    return inserted, collisions
+
+
+async def count_batch(conn, batch_id: str) -> int:
+    return await conn.fetchval("SELECT count(*) FROM qr_codes WHERE batch_id = $1", batch_id)
+
+
+def count_csv_rows(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+async def export_batch_csv(conn, batch_id: str, bot_username: str, path: str) -> int:
+    """Переписывает CSV партии из БД курсором (без загрузки партии в память)."""
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
-        writer.writerow(["Full Link", "Token"]) # Заголовки
-        writer.writerows(csv_rows)
-    
-    print(f"📄 Файл {filename} создан. Можно отправлять в типографию.")
+        writer.writerow(CSV_HEADER)
+        async with conn.transaction():
+            async for row in conn.cursor("SELECT code_hash FROM qr_codes WHERE batch_id = $1 ORDER BY created_at", batch_id, prefetch=CHUNK):
+                writer.writerow([make_link(bot_username, row["code_hash"]), row["code_hash"]])
+                written += 1
+    return written
+
+
+async def generate_codes(batch_id: str, count: int, bot_username: str, chunk: int, path: str):
+    print(f"🚀 Партия {batch_id}: цель {count} QR-кодов, чанк {chunk}")
+
+    async with engine.connect() as sa_conn:
+        raw = await sa_conn.get_raw_connection()
+        conn = raw.driver_connection  # asyncpg: нужен для COPY
+
+        # --- ВОЗОБНОВЛЕНИЕ ---
+        # Источник правды — БД: сколько кодов партии уже есть, столько и пропускаем.
+        done = await count_batch(conn, batch_id)
+        if done:
+            print(f"♻️ В БД уже {done} кодов партии — продолжаем с этого места")
+        if count_csv_rows(path) != done:
+            # CSV отстал (упали между коммитом и записью) или чужой — пересобираем из БД
+            exported = await export_batch_csv(conn, batch_id, bot_username, path)
+            print(f"📄 CSV {path} пересобран из БД: {exported} строк")
+        elif not os.path.exists(path):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(CSV_HEADER)
+
+        if done >= count:
+            print("✅ Партия уже полностью сгенерирована.")
+            return
+
+        # --- ГЕНЕРАЦИЯ ЧАНКАМИ ---
+        started = time.perf_counter()
+        generated = collisions_total = 0
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            while done < count:
+                size = min(chunk, count - done)
+                tokens, collisions = await insert_chunk(conn, batch_id, size)
+
+                # CSV дописываем только после коммита чанка
+                writer.writerows([make_link(bot_username, t), t] for t in tokens)
+                f.flush()
+
+                done += len(tokens)
+                generated += len(tokens)
+                collisions_total += collisions
+                elapsed = time.perf_counter() - started
+                rate = generated / elapsed if elapsed else 0
+                eta = (count - done) / rate if rate else 0
+                print(
+                    f"   {done}/{count} ({done / count:.1%}) | {rate:,.0f} rows/s | "
+                    f"коллизий {collisions_total} | осталось ~{eta:.0f} c"
+                )
+
+    elapsed = time.perf_counter() - started
+    print(f"💾 Сохранено в PostgreSQL: {generated} кодов за {elapsed:.1f} c ({generated / elapsed if elapsed else 0:,.0f} rows/s)")
+    print(f"📄 Файл {path} готов. Можно отправлять в типографию.")
+
+    # Боты перестроят фильтр кодов и начнут принимать новую партию
+    await notify_qr_batch_created()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация партии QR-кодов (COPY в Postgres + CSV)")
+    parser.add_argument("--batch", default=BATCH_ID, help="Номер партии (повторный запуск — докачка)")
+    parser.add_argument("--count", type=int, default=COUNT, help="Сколько кодов должно быть в партии")
+    parser.add_argument("--bot-username", default=BOT_USERNAME)
+    parser.add_argument("--chunk", type=int, default=CHUNK)
+    parser.add_argument("--out", help="CSV файл (по умолчанию qr_codes_<batch>.csv)")
+    args = parser.parse_args()
+
+    path = args.out or f"qr_codes_{args.batch}.csv"
+    asyncio.run(generate_codes(args.batch, args.count, args.bot_username, args.chunk, path))
+
 
 if __name__ == "__main__":
     # Запуск асинхронной функции
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    asyncio.run(generate_codes())
\ No newline at end of file
+    main()
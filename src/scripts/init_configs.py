@@ -4,27 +4,26 @@ from os.path import abspath, dirname
 
 sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
 
+from sqlalchemy import select
+
 from src.database.session import async_session_maker
 from src.database.models import SurveyConfig
 
+MODES = ['diet', 'trainer', 'dating', 'horoscope', 'natal_chart']
+
 async def init_configs():
     print("⚙️ Создание базовых конфигураций...")
     
     async with async_session_maker() as session:
-        # Создаем заглушки для всех режимов
-        configs = [
-            SurveyConfig(id=1, mode='diet', version='v1', structure={}, is_current=True),
-            SurveyConfig(id=2, mode='trainer', version='v1', structure={}, is_current=True),
-            SurveyConfig(id=3, mode='dating', version='v1', structure={}, is_current=True),
-            SurveyConfig(id=4, mode='horoscope', version='v1', structure={}, is_current=True),
-            SurveyConfig(id=5, mode='natal_chart', version='v1', structure={}, is_current=True),
-        ]
-        
-        for conf in configs:
-            await session.merge(conf) # merge создаст или обновит
+        # Заглушки только для режимов без единой версии; id выдает последовательность
+        # (явные id оставляли ее на старте, и синхронизация падала на дубле ключа)
+        existing = set(await session.scalars(select(SurveyConfig.mode).distinct()))
+        created = [mode for mode in MODES if mode not in existing]
+        for mode in created:
+            session.add(SurveyConfig(mode=mode, version='v1', structure={}, is_current=True))
         
         await session.commit()
-        print("💾 Конфигурации (ID 1-5) успешно сохранены!")
+        print(f"💾 Конфигурации созданы: {', '.join(created) or 'все режимы уже есть'}")
 
 if __name__ == "__main__":
     if sys.platform == 'win32':
@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os.path import abspath, dirname
+
+# Магия путей, чтобы видеть папку src
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from sqlalchemy import select
+
+from src.database.models import QRCode
+from src.services.broadcast import stream_rows
+from src.services.qr_render import render_png, render_svg, render_pdf_sheet
+from src.scripts.gen_qr import BOT_USERNAME, make_link
+
+# Сколько картинок отдаем процессу за раз (меньше — ровнее загрузка, больше — меньше накладных)
+TASK_SIZE = 500
+# Файлов в одной подпапке: 1M файлов в одном каталоге не открыть ни одним проводником
+FILES_PER_DIR = 10_000
+PROGRESS_EVERY = 5.0
+
+
+# --- ИСТОЧНИКИ (токены читаются лениво, партия целиком в память не попадает) ---
+
+async def tokens_from_db(batch_id: str):
+    async for row in stream_rows(select(QRCode.code_hash).where(QRCode.batch_id == batch_id)):
+        yield row.code_hash
+
+
+async def tokens_from_csv(path: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield row["Token"]
+
+
+# --- ПРИЕМНИКИ ---
+
+class DirSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, name: str, data: bytes):
+        full = os.path.join(self.path, name)
+        os.makedirs(dirname(full), exist_ok=True)
+        with open(full, "wb") as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+
+class ZipSink:
+    def __init__(self, path: str):
+        # PNG/PDF уже сжаты — храним без повторного сжатия, это в разы быстрее
+        self.zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    def write(self, name: str, data: bytes):
+        self.zip.writestr(name, data)
+
+    def close(self):
+        self.zip.close()
+
+
+# --- НАРЕЗКА НА ЗАДАЧИ ---
+
+async def make_tasks(tokens, fmt: str, bot_username: str, per_sheet: int):
+    """Группирует токены в задачи для пула: пачки картинок или листы PDF."""
+    size = per_sheet if fmt == "pdf" else TASK_SIZE
+    chunk, index, task_no = [], 0, 0
+    async for token in tokens:
+        if fmt == "pdf":
+            name = token
+        else:
+            name = f"{index // FILES_PER_DIR:03d}/{token}.{fmt}"
+        chunk.append((name, token, make_link(bot_username, token)))
+        index += 1
+        if len(chunk) == size:
+            yield task_no, chunk
+            chunk, task_no = [], task_no + 1
+    if chunk:
+        yield task_no, chunk
+
+
+def task_callable(fmt: str, task_no: int, chunk: list, args):
+    if fmt == "pdf":
+        # Лист = один файл: раскладываем по подпапкам так же, как картинки
+        name = f"{task_no // FILES_PER_DIR:03d}/sheet_{task_no:06d}.pdf"
+        return partial(render_pdf_sheet, name, chunk, args.cols, args.rows, not args.no_caption)
+    render = render_png if fmt == "png" else render_svg
+    return partial(render, chunk, args.box_size, args.border, not args.no_caption)
+
+
+async def render_batch(args):
+    source = tokens_from_csv(args.csv) if args.csv else tokens_from_db(args.batch)
+    sink = ZipSink(args.out) if args.out.endswith(".zip") else DirSink(args.out)
+    workers = args.workers or os.cpu_count()
+    # Держим в полете ограниченное число задач: память не растет с размером партии
+    max_in_flight = workers * 2
+
+    loop = asyncio.get_running_loop()
+    started = last_report = time.perf_counter()
+    images = files = 0
+    pending = set()
+    sizes = {}  # future -> кодов в задаче
+
+    def drain(done):
+        nonlocal images, files
+        for fut in done:
+            for name, data in fut.result():
+                sink.write(name, data)
+                files += 1
+            images += sizes.pop(fut)
+
+    print(f"🖨 Рендер {args.format.upper()} -> {args.out} | процессов: {workers}")
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            async for task_no, chunk in make_tasks(source, args.format, args.bot_username, args.cols * args.rows):
+                fut = loop.run_in_executor(pool, task_callable(args.format, task_no, chunk, args))
+                sizes[fut] = len(chunk)
+                pending.add(fut)
+
+                if len(pending) >= max_in_flight:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    drain(done)
+
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_EVERY:
+                    last_report = now
+                    print(f"   {images:,} кодов | {images / (now - started):,.0f} img/s")
+
+            if pending:
+                done, _ = await asyncio.wait(pending)
+                drain(done)
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Готово: {images:,} кодов в {files:,} файлах за {elapsed:.1f} c ({images / elapsed if elapsed else 0:,.0f} img/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Рендер партии QR-кодов для печати (PNG/SVG/PDF-листы)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--batch", help="Партия из БД (qr_codes.batch_id)")
+    source.add_argument("--csv", help="CSV, созданный gen_qr.py")
+    parser.add_argument("--format", choices=["png", "svg", "pdf"], default="png")
+    parser.add_argument("--out", required=True, help="Каталог или .zip")
+    parser.add_argument("--bot-username", default=BOT_USERNAME)
+    parser.add_argument("--workers", type=int, default=None, help="Процессов (по умолчанию — число ядер)")
+    parser.add_argument("--box-size", type=int, default=10, help="Пикселей на модуль QR (PNG/SVG)")
+    parser.add_argument("--border", type=int, default=4, help="Поле вокруг кода в модулях")
+    parser.add_argument("--cols", type=int, default=4, help="Кодов в ряду на листе PDF")
+    parser.add_argument("--rows", type=int, default=6, help="Рядов на листе PDF")
+    parser.add_argument("--no-caption", action="store_true", help="Без подписи токена под кодом")
+    args = parser.parse_args()
+
+    asyncio.run(render_batch(args))
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    main()
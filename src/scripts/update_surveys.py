@@ -6,22 +6,22 @@ from os.path import abspath, dirname
 # Магия путей
 sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
 
-from src.services.redis import redis_service
 from src.config import settings
-from src.services.sheets import fetch_all_data
+from src.services.sheets import fetch_all_data, sheets_client
+from src.services.config_sync import sync_configs
 
 # --- OBSERVABILITY ---
 from src.utils.logger import logger
 from src.utils.alerting import send_alert
 
-async def update_surveys():
+async def update_surveys(force: bool = False):
     # Создаем контекстный логгер
     log = logger.bind(task="update_surveys", worker="script")
     log.info("google_sync_started")
 
     try:
-        # Скачиваем данные
-        surveys, prompts = await fetch_all_data()
+        # Скачиваем данные (если таблица менялась с прошлой синхронизации)
+        snapshot = await fetch_all_data(force=force)
     except Exception as e:
         # Логируем ошибку
         log.error("google_sync_failed", error=str(e))
@@ -33,23 +33,21 @@ async def update_surveys():
         # тоже зафиксировал сбой в метриках
         raise e
 
-    # 1. Сохраняем анкеты
-    count_surveys = 0
-    for mode, questions in surveys.items():
-        await redis_service.set_survey_config(mode, questions)
-        count_surveys += 1
-    
-    # 2. Сохраняем промпты
-    count_prompts = 0
-    for mode, text in prompts.items():
-        await redis_service.set_prompt(mode, text)
-        count_prompts += 1
-    
+    # Пишем только изменившиеся режимы (хэш содержимого); новые версии анкет — в survey_configs,
+    # боты и воркеры сбрасывают кэши по событию. Начатые анкеты дочитывают свою версию.
+    if snapshot is None:
+        log.info("google_sync_skipped", reason="not_modified")
+        return
+
+    result = await sync_configs(snapshot.surveys, snapshot.prompts, force=force, marker=snapshot.marker)
+    sheets_client.mark_synced(snapshot.marker)
+
     log.info(
         "google_sync_completed", 
-        surveys_updated=count_surveys, 
-        prompts_updated=count_prompts,
-        modes=list(surveys.keys())
+        surveys_updated=len(result.surveys), 
+        prompts_updated=len(result.prompts),
+        unchanged=result.unchanged,
+        versions=result.surveys
     )
 
 if __name__ == "__main__":
@@ -57,7 +55,7 @@ if __name__ == "__main__":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
     
     try:
-        asyncio.run(update_surveys())
+        asyncio.run(update_surveys(force='--force' in sys.argv))
     except Exception as e:
         # Если запускаем руками и скрипт упал - логируем фатал
         # (Логгер уже настроен внутри send_alert/logger импортов)
@@ -0,0 +1,59 @@
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from src.database.session import async_session_maker
+from src.database.models import AdminCounter, User
+
+ACTIVE_SUBS = "active_subs"
+
+
+@dataclass(frozen=True, slots=True)
+class AdminStats:
+    users: int
+    active_subs: int
+    qr_activated: int
+    qr_total: int
+    surveys: int
+    matches: int
+    # Когда пересчитывались активные подписки (остальные счетчики живые — ведутся триггерами)
+    refreshed_at: Optional[datetime.datetime]
+
+
+async def read_admin_stats() -> AdminStats:
+    """Все метрики одним запросом по маленькой таблице счетчиков (десятки строк)."""
+    stmt = (
+        select(AdminCounter.metric, func.sum(AdminCounter.value), func.max(AdminCounter.updated_at))
+        .group_by(AdminCounter.metric)
+    )
+    async with async_session_maker() as session:
+        rows = (await session.execute(stmt)).all()
+
+    values = {metric: int(total or 0) for metric, total, _ in rows}
+    refreshed_at = next((updated for metric, _, updated in rows if metric == ACTIVE_SUBS), None)
+    return AdminStats(
+        users=values.get("users", 0),
+        active_subs=values.get(ACTIVE_SUBS, 0),
+        qr_activated=values.get("qr_activated", 0),
+        qr_total=values.get("qr_total", 0),
+        surveys=values.get("surveys", 0),
+        matches=values.get("matches", 0),
+        refreshed_at=refreshed_at,
+    )
+
+
+async def refresh_active_subscriptions():
+    """Пересчет активных подписок (диапазон по ix_users_subscription_expires_at)."""
+    async with async_session_maker() as session:
+        active = select(func.count()).select_from(User).where(User.subscription_expires_at > func.now())
+        stmt = pg_insert(AdminCounter).values(
+            metric=ACTIVE_SUBS, shard=0, value=active.scalar_subquery(), updated_at=func.now()
+        )
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[AdminCounter.metric, AdminCounter.shard],
+            set_={"value": stmt.excluded.value, "updated_at": stmt.excluded.updated_at},
+        ))
+        await session.commit()
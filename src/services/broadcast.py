@@ -0,0 +1,106 @@
+import json
+import time
+from typing import AsyncIterator, Callable, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from src.database.session import async_session_maker
+from src.services.rabbit import QueuePublisher
+
+# --- OBSERVABILITY ---
+from src.utils.logger import logger
+
+# --- МЕТРИКИ ---
+BROADCAST_MESSAGES = Counter('rex_broadcast_messages_total', 'Messages published by broadcasts', ['broadcast'])
+BROADCAST_PROGRESS = Gauge('rex_broadcast_progress', 'Messages published in the current broadcast run', ['broadcast'])
+BROADCAST_THROUGHPUT = Gauge('rex_broadcast_throughput_per_sec', 'Publish rate of the last broadcast run', ['broadcast'])
+BROADCAST_DURATION = Histogram('rex_broadcast_duration_seconds', 'Broadcast run duration', ['broadcast'])
+
+DEFAULT_QUEUE = "q_notifications"
+PUBLISH_BATCH = 500    # Сообщений в одной пачке публикации
+STREAM_CHUNK = 2000    # Строк за один fetch серверного курсора
+
+
+class MessageTemplate:
+    """
+    Общий шаблон рассылки: текст и клавиатура сериализуются один раз,
+    на каждого получателя только подставляется user_id.
+    """
+    def __init__(self, text: str, keyboard: Optional[dict] = None):
+        payload = {"text": text}
+        if keyboard:
+            payload["keyboard"] = keyboard
+        # '{"text": ...}' -> ', "text": ...}' — хвост, к которому приклеиваем user_id
+        self._tail = (", " + json.dumps(payload)[1:]).encode()
+
+    def render(self, row) -> bytes:
+        return b'{"user_id": %d' % row.user_id + self._tail
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+async def publish_stream(name: str, payloads, queue: str = DEFAULT_QUEUE, batch_size: int = PUBLISH_BATCH) -> int:
+    """
+    Публикует поток готовых сообщений (async или обычный итератор) пачками через одно соединение.
+    В памяти держится только текущая пачка.
+    """
+    log = logger.bind(broadcast=name, queue=queue)
+    if not hasattr(payloads, "__aiter__"):
+        payloads = _aiter(payloads)
+    started = time.perf_counter()
+    sent = 0
+    BROADCAST_PROGRESS.labels(broadcast=name).set(0)
+
+    # Пустая аудитория — не открываем соединение с брокером вовсе
+    try:
+        first = await payloads.__anext__()
+    except StopAsyncIteration:
+        log.info("broadcast_completed", sent_count=0)
+        return 0
+
+    async with QueuePublisher(queue) as publisher:
+        batch = [first]
+        async for payload in payloads:
+            batch.append(payload)
+            if len(batch) >= batch_size:
+                await publisher.publish_batch(batch)
+                sent += len(batch)
+                batch = []
+                BROADCAST_PROGRESS.labels(broadcast=name).set(sent)
+        if batch:
+            await publisher.publish_batch(batch)
+            sent += len(batch)
+
+    duration = time.perf_counter() - started
+    BROADCAST_PROGRESS.labels(broadcast=name).set(sent)
+    BROADCAST_MESSAGES.labels(broadcast=name).inc(sent)
+    BROADCAST_THROUGHPUT.labels(broadcast=name).set(sent / duration if duration else 0)
+    BROADCAST_DURATION.labels(broadcast=name).observe(duration)
+    log.info("broadcast_completed", sent_count=sent, duration=round(duration, 2))
+    return sent
+
+
+async def stream_rows(stmt, chunk: int = STREAM_CHUNK) -> AsyncIterator:
+    """Строки запроса через серверный курсор (yield_per), без материализации всего результата."""
+    async with async_session_maker() as session:
+        result = await session.stream(stmt.execution_options(yield_per=chunk))
+        async for row in result:
+            yield row
+
+
+async def fan_out(name: str, audience_stmt, render: Callable, queue: str = DEFAULT_QUEUE, batch_size: int = PUBLISH_BATCH) -> int:
+    """
+    Рассылка по аудитории.
+    audience_stmt — select только нужных колонок (минимум user_id), не ORM объекты.
+    render(row) -> dict/bytes сообщения или None, чтобы пропустить получателя.
+    """
+    async def payloads():
+        async for row in stream_rows(audience_stmt):
+            payload = render(row)
+            if payload is not None:
+                yield payload
+
+    return await publish_stream(name, payloads(), queue, batch_size)
@@ -0,0 +1,283 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.session import async_session_maker
+from src.database.models import ConfigSnapshot, SurveyConfig
+from src.services.redis import redis_client, redis_service, survey_config_version, CONFIG_CHANNEL
+
+# --- OBSERVABILITY ---
+from src.utils.logger import logger
+
+# Страховка на случай потерянного события (обрыв подписки): кэши живут не дольше этого
+CACHE_TTL = 300
+RESUBSCRIBE_DELAY = 5
+SNAPSHOTS_KEPT = 50
+
+log = logger.bind(service="config_sync")
+
+
+# --- СИНХРОНИЗАЦИЯ (scheduler) ---
+
+@dataclass
+class SyncResult:
+    surveys: dict = field(default_factory=dict)  # mode -> новая версия
+    prompts: list = field(default_factory=list)   # режимы с новым промптом
+    unchanged: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.surveys or self.prompts)
+
+
+async def _record_survey_versions(surveys: dict):
+    """Новые версии анкет в survey_configs: ровно одна is_current на режим."""
+    async with async_session_maker() as session:
+        for mode, (version, questions) in surveys.items():
+            await session.execute(
+                update(SurveyConfig)
+                .where(SurveyConfig.mode == mode, SurveyConfig.is_current.is_(True), SurveyConfig.version != version)
+                .values(is_current=False)
+            )
+            stmt = pg_insert(SurveyConfig).values(mode=mode, version=version, structure=questions, is_current=True)
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[SurveyConfig.mode, SurveyConfig.version],
+                set_={"is_current": True},
+            ))
+        await session.commit()
+
+
+def _hashes(surveys: dict, prompts: dict) -> dict:
+    hashes = {f"survey:{mode}": survey_config_version(questions) for mode, questions in surveys.items()}
+    hashes.update({f"prompt:{mode}": survey_config_version(text) for mode, text in prompts.items()})
+    return hashes
+
+
+async def _write_redis(surveys: dict, prompts: dict, hashes: dict) -> SyncResult:
+    """Запись в Redis + событие для кэшей. surveys: {mode: (version, questions)}."""
+    result = SyncResult(surveys={mode: version for mode, (version, _) in surveys.items()}, prompts=list(prompts))
+    await redis_service.apply_config_changes(
+        surveys, prompts, hashes, event={"surveys": result.surveys, "prompts": result.prompts},
+    )
+    return result
+
+
+async def sync_configs(surveys: dict, prompts: dict, force: bool = False, marker: Optional[str] = None) -> SyncResult:
+    """
+    Пишет только изменившиеся анкеты и промпты (сравнение по хэшу содержимого).
+    Порядок: Postgres (версия анкеты) -> Redis (данные + хэши) -> событие для кэшей -> снимок.
+    force — переписать все, даже если хэши в Redis совпадают.
+    """
+    hashes = _hashes(surveys, prompts)
+    known = {} if force else await redis_service.get_config_hashes()
+    changed = {key: digest for key, digest in hashes.items() if known.get(key) != digest}
+
+    changed_surveys = {
+        mode: (hashes[f"survey:{mode}"], questions) for mode, questions in surveys.items() if f"survey:{mode}" in changed
+    }
+    changed_prompts = {mode: text for mode, text in prompts.items() if f"prompt:{mode}" in changed}
+
+    result = SyncResult()
+    if changed:
+        if changed_surveys:
+            await _record_survey_versions(changed_surveys)
+        result = await _write_redis(changed_surveys, changed_prompts, changed)
+    result.unchanged = len(hashes) - len(changed)
+
+    # Снимок пишем и без изменений: после деплоя таблица снимков может быть пустой
+    await save_snapshot(surveys, prompts, marker)
+    return result
+
+
+# --- СНИМОК (старт без Google и без Redis) ---
+
+_snapshot: dict = {"surveys": {}, "prompts": {}}  # Последний известный процессу снимок
+
+
+async def save_snapshot(surveys: dict, prompts: dict, marker: Optional[str] = None) -> str:
+    version = survey_config_version({"surveys": surveys, "prompts": prompts})
+    async with async_session_maker() as session:
+        stmt = pg_insert(ConfigSnapshot).values(version=version, marker=marker, surveys=surveys, prompts=prompts)
+        # Вернулись к старому содержимому — тот же снимок снова становится последним
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[ConfigSnapshot.version],
+            set_={"marker": stmt.excluded.marker, "created_at": func.now()},
+        ))
+        keep = select(ConfigSnapshot.id).order_by(ConfigSnapshot.created_at.desc()).limit(SNAPSHOTS_KEPT)
+        await session.execute(delete(ConfigSnapshot).where(ConfigSnapshot.id.not_in(keep)))
+        await session.commit()
+    _snapshot.update(surveys=surveys, prompts=prompts)
+    return version
+
+
+async def load_snapshot() -> Optional[ConfigSnapshot]:
+    async with async_session_maker() as session:
+        return await session.scalar(select(ConfigSnapshot).order_by(ConfigSnapshot.created_at.desc()).limit(1))
+
+
+async def warm_start():
+    """
+    Вызывать при старте любого сервиса, до обращения к Google.
+    Снимок из БД -> память процесса (запасной источник), недостающие в Redis режимы -> Redis.
+    То, что в Redis уже есть, не трогаем: там может быть версия новее снимка.
+    """
+    try:
+        snapshot = await load_snapshot()
+    except Exception as e:
+        log.error("config_snapshot_load_failed", error=str(e))
+        return
+    if snapshot is None:
+        log.warning("config_snapshot_missing")
+        return
+
+    _snapshot.update(surveys=snapshot.surveys, prompts=snapshot.prompts)
+    try:
+        missing_surveys, missing_prompts = await redis_service.missing_config_modes(
+            list(snapshot.surveys), list(snapshot.prompts)
+        )
+        surveys = {mode: snapshot.surveys[mode] for mode in missing_surveys}
+        prompts = {mode: snapshot.prompts[mode] for mode in missing_prompts}
+        if surveys or prompts:
+            hashes = _hashes(surveys, prompts)
+            await _write_redis(
+                {mode: (hashes[f"survey:{mode}"], questions) for mode, questions in surveys.items()}, prompts, hashes
+            )
+    except RedisError as e:
+        log.error("config_snapshot_restore_failed", error=str(e))
+        return
+
+    log.info(
+        "config_warm_start", snapshot=snapshot.version, created_at=str(snapshot.created_at),
+        restored_surveys=missing_surveys, restored_prompts=missing_prompts,
+    )
+
+
+def snapshot_survey(mode: str) -> Optional[list]:
+    return _snapshot["surveys"].get(mode)
+
+
+# --- ID ВЕРСИИ АНКЕТЫ (для user_surveys.survey_config_id) ---
+
+_config_ids: dict = {}  # (mode, version) -> id; пара неизменяема, кэш без инвалидации
+
+
+async def survey_config_id(session: AsyncSession, mode: str, version: Optional[str]) -> Optional[int]:
+    key = (mode, version)
+    if key in _config_ids:
+        return _config_ids[key]
+
+    config_id = None
+    if version is not None:
+        config_id = await session.scalar(
+            select(SurveyConfig.id).where(SurveyConfig.mode == mode, SurveyConfig.version == version)
+        )
+    if config_id is None:
+        # Версия еще не записана синхронизацией (данные в Redis старше survey_configs) — берем текущую
+        config_id = await session.scalar(
+            select(SurveyConfig.id).where(SurveyConfig.mode == mode, SurveyConfig.is_current.is_(True))
+        )
+        if config_id is not None:
+            log.warning("survey_config_version_unknown", mode=mode, version=version, fallback_id=config_id)
+        return config_id
+
+    _config_ids[key] = config_id
+    return config_id
+
+
+# --- КЭШ ПРОМПТОВ (воркеры) ---
+
+_prompts: dict = {}  # mode -> (текст, время загрузки)
+
+
+async def get_prompt(mode: str) -> Optional[str]:
+    """Промпт из памяти процесса; Redis — только после события об изменении (или раз в CACHE_TTL)."""
+    cached = _prompts.get(mode)
+    if cached is not None and time.monotonic() - cached[1] < CACHE_TTL:
+        return cached[0]
+    text = await redis_service.get_prompt(mode)
+    if text is None:
+        # Redis пуст — промпт из снимка (не кэшируем: Redis проверим снова при следующей задаче)
+        return _snapshot["prompts"].get(mode)
+    _prompts[mode] = (text, time.monotonic())
+    return text
+
+
+def _drop_prompts(event: dict):
+    if event.get("reset"):
+        _prompts.clear()
+        return
+    for mode in event.get("prompts", []):
+        _prompts.pop(mode, None)
+
+
+# --- ПОДПИСКА НА СОБЫТИЯ ---
+
+Handler = Callable[[dict], Optional[Awaitable[None]]]
+
+
+class ConfigWatcher:
+    """
+    Слушает канал config_changed и раздает событие подписчикам (сброс кэшей процесса).
+    После переподключения события могли потеряться — подписчики получают "сбросить все".
+    """
+    def __init__(self):
+        self._handlers: list[Handler] = [_drop_prompts]
+        self._task: Optional[asyncio.Task] = None
+
+    def on_change(self, handler: Handler):
+        self._handlers.append(handler)
+
+    async def _dispatch(self, event: dict):
+        for handler in self._handlers:
+            try:
+                result = handler(event)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                log.error("config_handler_failed", handler=getattr(handler, "__name__", str(handler)), error=str(e))
+
+    async def _listen(self):
+        resubscribed = False
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(CONFIG_CHANNEL)
+                if resubscribed:
+                    await self._dispatch({"reset": True})
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    event = json.loads(message["data"])
+                    log.info("config_change_received", surveys=event.get("surveys"), prompts=event.get("prompts"))
+                    await self._dispatch(event)
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, ValueError) as e:
+                log.warning("config_subscription_lost", error=str(e))
+            finally:
+                await pubsub.reset()
+            resubscribed = True
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+config_watcher = ConfigWatcher()
@@ -0,0 +1,188 @@
+import bisect
+import json
+import math
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+# --- OBSERVABILITY ---
+from src.utils.logger import logger
+
+# Встроенный справочник городов (работает офлайн)
+CITIES_FILE = Path(__file__).resolve().parent.parent / "data" / "cities.json"
+
+EARTH_RADIUS_KM = 6371.0
+GRID_CELL_DEG = 1.0          # Размер ячейки пространственной сетки (градусы)
+FUZZY_MIN_SIMILARITY = 0.6   # Порог похожести по триграммам
+FUZZY_MIN_MARGIN = 0.05      # Отрыв лучшего города от второго, иначе совпадение неоднозначно
+PREFIX_MIN_LEN = 4           # Минимальная длина ввода для поиска по префиксу
+
+# Слова, которые означают регион, а не город ("Московская обл." != "Москва")
+_REGION_WORDS = {"обл", "область", "край", "республика", "респ", "округ", "район", "р-н"}
+_CITY_PREFIXES = ("город ", "гор. ", "г. ", "г ")
+
+
+def normalize_city_text(text: str) -> str:
+    """'г. Санкт–Петербург ' -> 'санкт-петербург'."""
+    value = str(text or "").lower().replace("ё", "е").strip()
+    value = re.sub(r"[–—]", "-", value)
+    value = re.sub(r"[^\w\s.,-]", " ", value)
+    value = re.sub(r"\s+", " ", value).strip(" .")
+    for prefix in _CITY_PREFIXES:
+        if value.startswith(prefix):
+            value = value[len(prefix):]
+    return value
+
+
+def _trigrams(value: str) -> set:
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по поверхности Земли в километрах."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class Gazetteer:
+    """
+    Справочник городов с каноническими ID.
+    - resolve(): свободный текст -> city_id (точный алиас, префикс, триграммы)
+    - within(): ID городов в радиусе N км (через пространственную сетку)
+    """
+    def __init__(self, cities: list[dict]):
+        self.cities = {c["id"]: c for c in cities}
+
+        # 1. Точные алиасы
+        self._aliases = {}
+        for city in cities:
+            for alias in [city["name"], *city.get("aliases", [])]:
+                self._aliases[normalize_city_text(alias)] = city["id"]
+
+        # 2. Отсортированные алиасы (поиск по префиксу через bisect, как по trie)
+        self._sorted_aliases = sorted(self._aliases)
+
+        # 3. Триграммный индекс для опечаток
+        self._trigram_index = {}
+        self._alias_trigrams = {}
+        for alias in self._aliases:
+            grams = _trigrams(alias)
+            self._alias_trigrams[alias] = grams
+            for gram in grams:
+                self._trigram_index.setdefault(gram, set()).add(alias)
+
+        # 4. Пространственная сетка: (ячейка lat, ячейка lon) -> [city_id]
+        self._grid = {}
+        for city in cities:
+            self._grid.setdefault(self._cell(city["lat"], city["lon"]), []).append(city["id"])
+
+    @staticmethod
+    def _cell(lat: float, lon: float) -> tuple:
+        return int(math.floor(lat / GRID_CELL_DEG)), int(math.floor(lon / GRID_CELL_DEG))
+
+    def _by_prefix(self, value: str) -> Optional[int]:
+        if len(value) < PREFIX_MIN_LEN:
+            return None
+        ids = set()
+        pos = bisect.bisect_left(self._sorted_aliases, value)
+        while pos < len(self._sorted_aliases) and self._sorted_aliases[pos].startswith(value):
+            ids.add(self._aliases[self._sorted_aliases[pos]])
+            pos += 1
+        # Префикс засчитываем только если он однозначен
+        return ids.pop() if len(ids) == 1 else None
+
+    def _by_trigrams(self, value: str) -> Optional[int]:
+        grams = _trigrams(value)
+        candidates = set()
+        for gram in grams:
+            candidates |= self._trigram_index.get(gram, set())
+
+        # Лучшая оценка по каждому городу (алиасы одного города друг другу не конкуренты)
+        scores = {}
+        for alias in candidates:
+            other = self._alias_trigrams[alias]
+            city_id = self._aliases[alias]
+            scores[city_id] = max(scores.get(city_id, 0.0), len(grams & other) / len(grams | other))
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < FUZZY_MIN_SIMILARITY:
+            return None
+        # "Н.овгород" почти одинаково похож на Нижний и Великий — не угадываем
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < FUZZY_MIN_MARGIN:
+            return None
+        return ranked[0][0]
+
+    def resolve(self, text: str) -> Optional[int]:
+        """Возвращает city_id или None, если город не распознан."""
+        value = normalize_city_text(text)
+        if not value:
+            return None
+
+        if value in self._aliases:
+            return self._aliases[value]
+
+        # Регион — это не город, не угадываем
+        if set(re.split(r"[\s.,]+", value)) & _REGION_WORDS:
+            return None
+
+        # "Москва, Россия" -> пробуем первую часть
+        head = value.split(",")[0].strip()
+        if head != value and head in self._aliases:
+            return self._aliases[head]
+
+        return self._by_prefix(value) or self._by_trigrams(value)
+
+    def within(self, city_id: int, radius_km: float) -> frozenset:
+        """ID всех городов в радиусе radius_km от города city_id (включая его самого)."""
+        city = self.cities.get(city_id)
+        if not city:
+            return frozenset()
+
+        lat, lon = city["lat"], city["lon"]
+        lat_span = radius_km / 111.0
+        lon_span = radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+        lat_min, lon_min = self._cell(lat - lat_span, lon - lon_span)
+        lat_max, lon_max = self._cell(lat + lat_span, lon + lon_span)
+
+        result = set()
+        for cell_lat in range(lat_min, lat_max + 1):
+            for cell_lon in range(lon_min, lon_max + 1):
+                for other_id in self._grid.get((cell_lat, cell_lon), []):
+                    other = self.cities[other_id]
+                    if haversine_km(lat, lon, other["lat"], other["lon"]) <= radius_km:
+                        result.add(other_id)
+        return frozenset(result)
+
+    def name(self, city_id: int) -> Optional[str]:
+        city = self.cities.get(city_id)
+        return city["name"] if city else None
+
+    def timezone(self, city_id: int) -> Optional[str]:
+        city = self.cities.get(city_id)
+        return city.get("tz") if city else None
+
+    def timezones(self) -> frozenset:
+        return frozenset(c["tz"] for c in self.cities.values() if c.get("tz"))
+
+
+@lru_cache(maxsize=1)
+def get_gazetteer() -> Gazetteer:
+    """Загружает справочник один раз на процесс."""
+    with open(CITIES_FILE, encoding="utf-8") as f:
+        cities = json.load(f)
+    logger.info("gazetteer_loaded", cities=len(cities))
+    return Gazetteer(cities)
+
+
+def resolve_city(text: str) -> Optional[int]:
+    return get_gazetteer().resolve(text)
+
+
+@lru_cache(maxsize=4096)
+def cities_within(city_id: int, radius_km: float) -> frozenset:
+    return get_gazetteer().within(city_id, radius_km)
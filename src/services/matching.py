@@ -1,11 +1,18 @@
 import asyncio
 import re
-from sqlalchemy import select, and_, func
-from prometheus_client import Counter
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import select, and_, or_, func
+from prometheus_client import Counter, Histogram, Gauge
 
 from src.database.session import async_session_maker
 from src.database.models import UserSurvey, DatingMatch, User
-from src.services.rabbit import send_to_queue
+from src.config import settings
+from src.services.broadcast import publish_stream
+from src.services.redis import redis_service
+from src.services.geo import resolve_city, cities_within
+from src.services.text_similarity import AboutSimilarityIndex
 from src.bot.keyboards.dating import get_dating_kb
 
 # --- OBSERVABILITY ---
@@ -14,6 +21,29 @@ from src.utils.alerting import send_alert
 
 # Метрика
 MATCHES_GENERATED = Counter('rex_dating_matches_total', 'Total matches generated by algorithm')
+FEED_REFRESHES = Counter('rex_dating_feed_refresh_total', 'Total candidate queue rebuilds', ['source'])
+FEED_CARDS_SERVED = Counter('rex_dating_feed_served_total', 'Total cards served from candidate queues', ['result'])
+SHARD_DURATION = Histogram('rex_dating_shard_duration_seconds', 'Time spent matching one city shard', ['kind'])
+SHARD_SIZE = Gauge('rex_dating_shard_last_size', 'Seekers in the largest shard of the last run')
+SHARDS_LAST_RUN = Gauge('rex_dating_shards_last_run', 'Number of shards in the last matching run')
+
+# Настройки очереди кандидатов
+FEED_SIZE = 20            # Сколько кандидатов держим в очереди на пользователя
+FEED_LOW_WATERMARK = 3    # Если осталось меньше — ставим очередь на пересчет
+CANDIDATE_POOL = 500      # Сколько анкет берем из БД при точечном пересчете
+DIRTY_BATCH = 100         # Сколько "грязных" очередей пересчитываем за один проход
+SIMILAR_TOP_K = 50        # Сколько соседей по тексту 'О себе' храним на пользователя
+TEXT_SIMILARITY_WEIGHT = 2.0  # Вес косинусной близости 'О себе' в рейтинге
+
+# TF-IDF индекс по полю 'about' (живет в процессе планировщика).
+# Читается и меняется только в потоках executor'а под блокировкой;
+# полная пересборка собирает новый объект и подменяет ссылку.
+about_index = AboutSimilarityIndex()
+_about_index_lock = threading.Lock()
+last_similarity_run: dict = {}  # Тайминги последней полной пересборки (для логов и бенчмарка)
+
+CARD_TITLE = "🎯 <b>Вам подобрана пара!</b>\n\n"
+UNKNOWN_CITY_SHARD = ""   # Общий шард для анкет без города
 
 def _normalize_list(data):
     """Превращает строку 'Бег, Зал' или список ['Бег', 'Зал'] в set({'бег', 'зал'})."""
@@ -36,144 +66,508 @@ def _parse_int(value, default=0):
             return int(nums[0])
     return default
 
-async def run_daily_matching():
+def _profile_features(answers: dict) -> dict:
+    """
+    Разбирает анкету один раз: кто я (город, пол, возраст, спорт) и кого ищу.
+    Результат — обычный dict, чтобы его можно было передавать между процессами.
+    """
+    data = answers or {}
+    gender = str(data.get('gender', '')).lower()
+
+    # Кого ищу? (Если в анкете есть partner_gender, берем его, иначе простая логика М<->Ж)
+    pref_gender = str(data.get('partner_gender', '')).lower()
+    if not pref_gender or pref_gender == 'любой':
+        # Фолбэк: М ищет Ж, Ж ищет М
+        pref_gender = 'женский' if 'муж' in gender else 'мужской'
+
+    # Канонический город: берем сохраненный при анкетировании ID, для старых анкет — распознаем текст
+    city = str(data.get('city', '')).strip().lower()
+    city_id = data.get('city_id') or (resolve_city(city) if city else None)
+
+    return {
+        "city": city,
+        "city_id": city_id,
+        "nearby": cities_within(city_id, settings.DATING_RADIUS_KM) if city_id else frozenset(),
+        "gender": gender,
+        "age": _parse_int(data.get('age')),
+        "sports": _normalize_list(data.get('sports')),
+        "pref_gender": pref_gender,
+        "pref_age_min": _parse_int(data.get('partner_age_min'), 18),
+        "pref_age_max": _parse_int(data.get('partner_age_max'), 99),
+    }
+
+def _is_compatible(me: dict, cand: dict) -> bool:
+    """Жесткие фильтры: город, пол, возраст, хотя бы один общий вид спорта."""
+    # 1. Город: по справочнику — в радиусе DATING_RADIUS_KM, иначе сравнение текста
+    if me['city_id'] and cand['city_id']:
+        if cand['city_id'] not in me['nearby']:
+            return False
+    elif me['city'] and cand['city'] and me['city'] not in cand['city'] and cand['city'] not in me['city']:
+        return False
+
+    # 2. Пол (Строгое совпадение)
+    if me['pref_gender'] and me['pref_gender'] not in cand['gender']:
+        return False
+
+    # 3. Возраст (Диапазон)
+    if not (me['pref_age_min'] <= cand['age'] <= me['pref_age_max']):
+        return False
+
+    # 4. Спорт (Есть ли хоть одно совпадение?)
+    # Если пользователь не указал спорт, считаем что ему всё равно
+    if me['sports'] and cand['sports'] and not (me['sports'] & cand['sports']):
+        return False
+
+    return True
+
+def _score_candidate(me: dict, cand: dict, text_score: float = 0.0) -> float:
+    """
+    Мягкий рейтинг среди подходящих: общие виды спорта
+    плюс близость текстов 'О себе' (косинус TF-IDF).
+    """
+    return len(me['sports'] & cand['sports']) + TEXT_SIMILARITY_WEIGHT * text_score
+
+def rank_candidates(my_id: int, me: dict, candidates: dict, seen: set, limit: int = FEED_SIZE, similar: dict = None) -> list[int]:
+    """
+    Возвращает ID лучших кандидатов для одного пользователя.
+    candidates: {user_id: features}, similar: {cand_id: косинус по 'О себе'}
+    """
+    similar = similar or {}
+    scored = []
+    for cand_id, cand in candidates.items():
+        if cand_id == my_id or cand_id in seen:
+            continue
+        if not _is_compatible(me, cand):
+            continue
+        scored.append((_score_candidate(me, cand, similar.get(cand_id, 0.0)), cand_id))
+
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [cand_id for _, cand_id in scored[:limit]]
+
+def build_feeds(profiles: dict, seen: dict, limit: int = FEED_SIZE, similar: dict = None) -> dict:
+    """
+    Чистая функция пакетного подбора: {user_id: answers} -> {user_id: [candidate_id, ...]}.
+    Не ходит ни в БД, ни в Redis.
+    """
+    similar = similar or {}
+    features = {uid: _profile_features(answers) for uid, answers in profiles.items()}
+    return {
+        uid: rank_candidates(uid, me, features, seen.get(uid, set()), limit, similar.get(uid))
+        for uid, me in features.items()
+    }
+
+def rebuild_similarity(texts: dict, blocks: list = None) -> dict:
+    """
+    Полная пересборка TF-IDF по 'О себе' и top-k соседей (CPU, без I/O).
+    blocks — [(seekers, pool)] по шардам: соседей ищем только в пуле шарда,
+    без них — среди всех анкет.
+    """
+    global about_index
+    started = time.perf_counter()
+    index = AboutSimilarityIndex()
+    index.build(texts)
+    with _about_index_lock:
+        about_index = index
+    built = time.perf_counter()
+
+    if blocks is None:
+        similar = index.top_k(k=SIMILAR_TOP_K)
+    else:
+        similar = {}
+        for seekers, pool in blocks:
+            similar.update(index.top_k(list(seekers), SIMILAR_TOP_K, candidates=list(pool)))
+
+    last_similarity_run.update(
+        build_sec=built - started, top_k_sec=time.perf_counter() - built, vocabulary=index.vocabulary_size,
+    )
+    return similar
+
+def _apply_similarity_changes(texts: dict, gone: list, blocks: list) -> dict:
+    """
+    Точечные изменения индекса и соседи изменившихся анкет (в executor'е).
+    blocks — [(seekers, pool)]: как и при полной сборке, соседей ищем в пуле
+    ближайших городов; pool=None — среди всех анкет.
+    """
+    with _about_index_lock:
+        about_index.remove(gone)
+        about_index.update(texts)
+        similar = {}
+        for seekers, pool in blocks:
+            candidates = None if pool is None else list(pool)
+            similar.update(about_index.top_k(list(seekers), SIMILAR_TOP_K, candidates=candidates))
+        return similar
+
+def _about_texts(profiles: dict) -> dict:
+    return {uid: str((answers or {}).get('about') or '') for uid, answers in profiles.items()}
+
+def build_card(answers: dict) -> dict:
+    """Формирует карточку анкеты (текст + фото) для показа другим."""
+    cand_data = answers or {}
+
+    # Имя, Возраст | Вид спорта | Уровень
+    info_line = f"{cand_data.get('name', 'Аноним')}, {cand_data.get('age', '??')}"
+
+    sports_str = ", ".join(cand_data.get('sports', '').split(',')) if isinstance(cand_data.get('sports'), str) else "Спорт"
+    level = cand_data.get('level', 'Любитель')
+
+    text = (
+        f"👤 <b>{info_line}</b>\n"
+        f"📍 {cand_data.get('city', 'Город')}\n"
+        f"🏅 {sports_str} ({level})\n\n"
+        f"ℹ️ {cand_data.get('about', '')}"
+    )
+    return {"text": text, "photo": cand_data.get('photo')}
+
+def _active_profiles_stmt():
+    """Последняя анкета знакомств каждого пользователя с активной подпиской."""
+    return (
+        select(UserSurvey.user_id, UserSurvey.answers)
+        .join(User)
+        .where(
+            and_(
+                UserSurvey.mode == 'dating',
+                User.subscription_expires_at > func.now()
+            )
+        )
+        .distinct(UserSurvey.user_id)
+        .order_by(UserSurvey.user_id, UserSurvey.created_at.desc())
+    )
+
+def _nearby(stmt, me: dict):
+    """Город известен — только анкеты из ближайших городов (и анкеты без city_id)."""
+    if not me['nearby']:
+        return stmt
+    cand_city = UserSurvey.answers['city_id'].as_integer()
+    return stmt.where(or_(cand_city.in_(me['nearby']), cand_city.is_(None)))
+
+# --- ИНКРЕМЕНТАЛЬНЫЙ ДВИЖОК (очередь кандидатов в Redis) ---
+
+async def refresh_feed(user_id: int, source: str = "on_demand") -> int:
+    """
+    Пересчитывает очередь кандидатов одного пользователя.
+    Возвращает длину новой очереди.
+    """
+    async with async_session_maker() as session:
+        my_answers = await session.scalar(
+            select(UserSurvey.answers)
+            .where(and_(UserSurvey.user_id == user_id, UserSurvey.mode == 'dating'))
+            .order_by(UserSurvey.created_at.desc())
+            .limit(1)
+        )
+        if my_answers is None:
+            await redis_service.set_dating_feed(user_id, [])
+            return 0
+
+        me = _profile_features(my_answers)
+
+        # Кого я уже видел?
+        subq_seen = select(DatingMatch.target_user_id).where(DatingMatch.user_id == user_id)
+        stmt = _active_profiles_stmt().where(
+            and_(
+                UserSurvey.user_id != user_id,
+                UserSurvey.user_id.not_in(subq_seen)
+            )
+        )
+        stmt = _nearby(stmt, me).limit(CANDIDATE_POOL)
+        rows = (await session.execute(stmt)).all()
+
+    answers_by_id = {row.user_id: row.answers for row in rows}
+    features = {uid: _profile_features(answers) for uid, answers in answers_by_id.items()}
+    similar = await redis_service.get_dating_similarity(user_id)
+    ranked = rank_candidates(user_id, me, features, set(), similar=similar)
+
+    # Карточки кладем заранее, чтобы показ шел только из Redis
+    for cand_id in ranked:
+        await redis_service.set_dating_card(cand_id, build_card(answers_by_id[cand_id]))
+    await redis_service.set_dating_feed(user_id, ranked)
+
+    FEED_REFRESHES.labels(source=source).inc()
+    return len(ranked)
+
+async def on_profile_saved(user_id: int, answers: dict):
+    """
+    Анкета создана/обновлена: обновляем карточку и сразу собираем очередь.
+    Пометка "dirty" — чтобы планировщик пересчитал TF-IDF соседей и очередь с их учетом.
+    Соседям по шарду с неполной очередью новая анкета тоже может подойти — их очереди пересчитываем.
+    """
+    await redis_service.set_dating_card(user_id, build_card(answers))
+    await refresh_feed(user_id, source="profile_saved")
+    await redis_service.mark_dating_dirty(user_id, *await _affected_users(user_id, answers))
+
+async def _affected_users(user_id: int, answers: dict) -> list[int]:
+    """Активные анкеты рядом, которым подходит новая анкета и у кого очередь короче FEED_SIZE."""
+    me = _profile_features(answers)
+    async with async_session_maker() as session:
+        stmt = _nearby(_active_profiles_stmt().where(UserSurvey.user_id != user_id), me).limit(CANDIDATE_POOL)
+        rows = (await session.execute(stmt)).all()
+
+    compatible = [row.user_id for row in rows if _is_compatible(_profile_features(row.answers), me)]
+    lengths = await redis_service.get_dating_feed_lengths(compatible)
+    return [uid for uid in compatible if lengths.get(uid, 0) < FEED_SIZE]
+
+async def _pop_card(user_id: int):
+    # Пропускаем кандидатов, чьи карточки успели протухнуть
+    for _ in range(FEED_SIZE):
+        cand_id = await redis_service.pop_dating_candidate(user_id)
+        if cand_id is None:
+            return None
+        card = await redis_service.get_dating_card(cand_id)
+        if card:
+            return {**card, "target_user_id": cand_id}
+    return None
+
+async def next_card(user_id: int):
+    """
+    Отдает следующую анкету из очереди пользователя.
+    В обычном случае это только Redis; БД трогаем, лишь если очередь пуста.
+    """
+    card = await _pop_card(user_id)
+    if card is None and await refresh_feed(user_id):
+        card = await _pop_card(user_id)
+
+    if card is None:
+        FEED_CARDS_SERVED.labels(result="empty").inc()
+        return None
+
+    if await redis_service.get_dating_feed_length(user_id) < FEED_LOW_WATERMARK:
+        await redis_service.mark_dating_dirty(user_id)
+
+    FEED_CARDS_SERVED.labels(result="served").inc()
+    return card
+
+async def _update_similarity(user_ids: list[int]):
+    """
+    Инкрементально обновляет TF-IDF строки для изменившихся анкет
+    и пересчитывает их соседей. Анкеты, которых больше нет среди активных
+    (истекли или удалены), убираем из индекса.
+    Индекс собирается с нуля, если процесс только стартовал.
+    """
+    loop = asyncio.get_running_loop()
+    async with async_session_maker() as session:
+        if not len(about_index):
+            rows = (await session.execute(_active_profiles_stmt())).all()
+            profiles = {row.user_id: row.answers for row in rows}
+            blocks = [(seekers, pool) for _, seekers, pool in _shard_pools(profiles)]
+            similar = await loop.run_in_executor(None, rebuild_similarity, _about_texts(profiles), blocks)
+            await redis_service.set_dating_similarity_bulk(similar)
+            return
+
+        rows = (await session.execute(_active_profiles_stmt().where(UserSurvey.user_id.in_(user_ids)))).all()
+        changed = {row.user_id: row.answers for row in rows}
+
+        # Пул соседей — анкеты ближайших городов, один запрос на группу с одинаковым радиусом
+        groups = {}
+        for uid, answers in changed.items():
+            me = _profile_features(answers)
+            groups.setdefault(tuple(sorted(me['nearby'])), (me, []))[1].append(uid)
+        blocks = []
+        for nearby, (me, seekers) in groups.items():
+            if not nearby:
+                blocks.append((seekers, None))
+                continue
+            pool = (await session.execute(_nearby(_active_profiles_stmt(), me))).all()
+            blocks.append((seekers, [row.user_id for row in pool]))
+
+    texts = _about_texts(changed)
+    gone = [uid for uid in user_ids if uid not in texts]
+    similar = await loop.run_in_executor(None, _apply_similarity_changes, texts, gone, blocks)
+    await redis_service.set_dating_similarity_bulk(similar)
+
+async def refresh_dirty_feeds():
+    """Фоновый пересчет очередей, помеченных как устаревшие (запускается часто и понемногу)."""
+    log = logger.bind(task="dating_feed_refresh")
+    refreshed = 0
+
+    while True:
+        user_ids = await redis_service.pop_dating_dirty(DIRTY_BATCH)
+        if not user_ids:
+            break
+        try:
+            await _update_similarity(user_ids)
+        except Exception as e:
+            log.error("similarity_update_failed", error=str(e))
+        for user_id in user_ids:
+            try:
+                await refresh_feed(user_id, source="dirty")
+                refreshed += 1
+            except Exception as e:
+                log.error("feed_refresh_failed", user_id=user_id, error=str(e))
+
+    if refreshed:
+        log.info("feed_refresh_completed", refreshed=refreshed)
+
+# --- ПАКЕТНЫЙ ПОДБОР (раз в день) ---
+
+def _shard_key(answers: dict) -> str:
+    """
+    Ключ шарда — канонический город ('id:1'), для нераспознанных — текст,
+    пусто = общий шард.
+    """
+    data = answers or {}
+    city = str(data.get('city', '')).strip().lower()
+    city_id = data.get('city_id') or (resolve_city(city) if city else None)
+    return f"id:{city_id}" if city_id else city
+
+def split_into_shards(profiles: dict) -> dict:
+    """{user_id: answers} -> {shard_key: {user_id: answers}}."""
+    shards = {}
+    for uid, answers in profiles.items():
+        shards.setdefault(_shard_key(answers), {})[uid] = answers
+    return shards
+
+def match_shard(shard_key: str, seekers: dict, pool: dict, seen: dict, similar: dict) -> tuple:
+    """
+    Подбор внутри одного шарда. Вызывается в дочернем процессе,
+    поэтому принимает и возвращает только простые (pickle-friendly) объекты.
+    seekers — кого подбираем, pool — среди кого ищем.
+    """
+    started = time.perf_counter()
+    features = {uid: _profile_features(answers) for uid, answers in pool.items()}
+    feeds = {
+        uid: rank_candidates(uid, features[uid], features, seen.get(uid, set()), similar=similar.get(uid))
+        for uid in seekers
+    }
+    return shard_key, feeds, time.perf_counter() - started
+
+def _shard_pools(profiles: dict) -> list:
+    """
+    Раскладывает население по шардам: [(key, seekers, pool)].
+    В пул городского шарда добавляем анкеты без города (им подходит любой город),
+    а общий шард ищет по всем анкетам.
+    """
+    shards = split_into_shards(profiles)
+    unknown = shards.get(UNKNOWN_CITY_SHARD, {})
+
+    pools = []
+    for key, seekers in shards.items():
+        if key == UNKNOWN_CITY_SHARD:
+            pool = profiles
+        elif key.startswith("id:"):
+            # Городской шард ищет во всех городах в радиусе
+            pool = {**unknown}
+            for city_id in cities_within(int(key[3:]), settings.DATING_RADIUS_KM):
+                pool.update(shards.get(f"id:{city_id}", {}))
+        else:
+            pool = {**seekers, **unknown}
+        pools.append((key, seekers, pool))
+    return pools
+
+def _shard_tasks(profiles: dict, seen: dict, similar: dict) -> list:
+    """Задачи для пула процессов: шард + его просмотры и соседи по тексту."""
+    tasks = []
+    for key, seekers, pool in _shard_pools(profiles):
+        shard_seen = {uid: seen[uid] for uid in seekers if uid in seen}
+        shard_similar = {uid: similar[uid] for uid in seekers if uid in similar}
+        tasks.append((key, seekers, pool, shard_seen, shard_similar))
+    return tasks
+
+async def _build_feeds_sharded(profiles: dict, seen: dict, similar: dict, log) -> dict:
+    """Запускает шарды в пуле процессов и склеивает результат."""
+    tasks = _shard_tasks(profiles, seen, similar)
+    SHARDS_LAST_RUN.set(len(tasks))
+    SHARD_SIZE.set(max((len(t[1]) for t in tasks), default=0))
+
+    loop = asyncio.get_running_loop()
+    feeds = {}
+    with ProcessPoolExecutor(max_workers=settings.MATCHING_PROCESSES) as pool:
+        futures = [loop.run_in_executor(pool, match_shard, *task) for task in tasks]
+        for shard_key, shard_feeds, duration in await asyncio.gather(*futures):
+            kind = "unknown_city" if shard_key == UNKNOWN_CITY_SHARD else "city"
+            SHARD_DURATION.labels(kind=kind).observe(duration)
+            log.info("shard_matched", shard=shard_key or "*", seekers=len(shard_feeds), duration=duration)
+            feeds.update(shard_feeds)
+    return feeds
+
+async def compute_feeds(profiles: dict, seen: dict, log=logger) -> tuple:
+    """
+    Вычислительная часть пакетного подбора (без БД и очередей):
+    TF-IDF соседи по 'О себе' + ранжированные очереди кандидатов.
+    Возвращает (feeds, similar).
+    """
+    # Близость текстов 'О себе' (TF-IDF, полная пересборка раз в день)
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    # Соседи нужны только внутри пула шарда: блочные произведения вместо всей матрицы
+    blocks = [(seekers, pool) for _, seekers, pool in _shard_pools(profiles)]
+    similar = await loop.run_in_executor(None, rebuild_similarity, _about_texts(profiles), blocks)
+    log.info("similarity_built", duration=time.perf_counter() - started, **last_similarity_run)
+
+    # Подбор
+    started = time.perf_counter()
+    if settings.MATCHING_SHARDED and profiles:
+        feeds = await _build_feeds_sharded(profiles, seen, similar, log)
+    else:
+        feeds = build_feeds(profiles, seen, similar=similar)
+    log.info("feeds_built", duration=time.perf_counter() - started)
+
+    return feeds, similar
+
+async def run_daily_matching(dry_run: bool = False) -> dict:
     """
     Интеллектуальный алгоритм подбора пар.
     Учитывает город, пол, возраст и пересечение по видам спорта.
+    Пересобирает очереди кандидатов всем и отправляет первую анкету из очереди.
+    В шардированном режиме города считаются параллельно в пуле процессов.
+    dry_run=True — только посчитать (для бенчмарков): без записи в Redis и RabbitMQ.
+    Возвращает {user_id: [candidate_id, ...]}.
     """
     log = logger.bind(task="dating_matching")
-    log.info("matching_started")
+    log.info("matching_started", sharded=settings.MATCHING_SHARDED, dry_run=dry_run)
     
     try:
         async with async_session_maker() as session:
-            # 1. Берем всех АКТИВНЫХ пользователей, которые ищут пару
-            stmt_users = select(UserSurvey).join(User).where(
-                and_(
-                    UserSurvey.mode == 'dating',
-                    User.subscription_expires_at > func.now()
+            # 1. Берем всех АКТИВНЫХ пользователей, которые ищут пару (одним запросом)
+            rows = (await session.execute(_active_profiles_stmt())).all()
+            profiles = {row.user_id: row.answers or {} for row in rows}
+
+            # 2. Кого кто уже видел (тоже одним запросом)
+            seen = {}
+            if profiles:
+                seen_rows = await session.execute(
+                    select(DatingMatch.user_id, DatingMatch.target_user_id)
+                    .join(User, User.user_id == DatingMatch.user_id)
+                    .where(User.subscription_expires_at > func.now())
                 )
-            )
-            result = await session.execute(stmt_users)
-            seekers = result.scalars().all()
-            
-            log.info("profiles_fetched", count=len(seekers))
-            matches_count = 0
-
-            for me in seekers:
-                try:
-                    my_id = me.user_id
-                    my_data = me.answers or {}
-                    
-                    # --- Извлекаем предпочтения Ищущего ---
-                    my_city = str(my_data.get('city', '')).strip().lower()
-                    my_gender = str(my_data.get('gender', '')).lower() # Мой пол
-                    
-                    # Кого ищу? (Если в анкете есть partner_pref_gender, берем его, иначе простая логика М<->Ж)
-                    # Предполагаем, что в анкете есть поля: partner_gender, partner_age_min, partner_age_max
-                    pref_gender = str(my_data.get('partner_gender', '')).lower()
-                    if not pref_gender or pref_gender == 'любой':
-                        # Фолбэк: М ищет Ж, Ж ищет М
-                        pref_gender = 'женский' if 'муж' in my_gender else 'мужской'
-
-                    pref_age_min = _parse_int(my_data.get('partner_age_min'), 18)
-                    pref_age_max = _parse_int(my_data.get('partner_age_max'), 99)
-                    
-                    # Мои виды спорта (для поиска пересечений)
-                    my_sports = _normalize_list(my_data.get('sports'))
-
-                    # --- Поиск Кандидатов ---
-                    
-                    # Кого я уже видел?
-                    subq_seen = select(DatingMatch.target_user_id).where(DatingMatch.user_id == my_id)
-                    
-                    # Запрашиваем батч потенциальных кандидатов (чтобы не тянуть всю базу)
-                    # Фильтруем на уровне SQL самое простое: режим + подписка + не видел + не я сам
-                    stmt_candidates = select(UserSurvey).join(User).where(
-                        and_(
-                            UserSurvey.mode == 'dating',
-                            User.subscription_expires_at > func.now(),
-                            UserSurvey.user_id != my_id,
-                            UserSurvey.user_id.not_in(subq_seen)
-                        )
-                    ).limit(50) # Берем 50 ближайших, фильтруем питоном
-                    
-                    candidates_res = await session.execute(stmt_candidates)
-                    candidates = candidates_res.scalars().all()
-                    
-                    best_match = None
-                    
-                    for cand in candidates:
-                        cand_data = cand.answers or {}
-                        
-                        # 1. Город (Строгое совпадение)
-                        cand_city = str(cand_data.get('city', '')).strip().lower()
-                        if my_city and cand_city and my_city not in cand_city and cand_city not in my_city:
-                            continue # Не тот город
-
-                        # 2. Пол (Строгое совпадение)
-                        cand_gender = str(cand_data.get('gender', '')).lower()
-                        if pref_gender and pref_gender not in cand_gender:
-                            continue
-
-                        # 3. Возраст (Диапазон)
-                        cand_age = _parse_int(cand_data.get('age'))
-                        if not (pref_age_min <= cand_age <= pref_age_max):
-                            continue
-
-                        # 4. Спорт (Есть ли хоть одно совпадение?)
-                        # Если пользователь не указал спорт, считаем что ему всё равно
-                        cand_sports = _normalize_list(cand_data.get('sports'))
-                        if my_sports and cand_sports:
-                            # Проверяем пересечение множеств (intersection)
-                            if not (my_sports & cand_sports):
-                                continue # Нет общих интересов
-
-                        # Если дошли сюда — кандидат подходит!
-                        best_match = cand
-                        break # Нашли одного, хватит
-                    
-                    if not best_match:
-                        continue # Нет подходящих пар сегодня
-
-                    # --- Отправка Анкеты ---
-                    cand_data = best_match.answers or {}
-                    
-                    # Формируем красивый текст
-                    # Имя, Возраст | Вид спорта | Уровень
-                    info_line = f"{cand_data.get('name', 'Аноним')}, {cand_data.get('age', '??')}"
-                    
-                    sports_str = ", ".join(cand_data.get('sports', '').split(',')) if isinstance(cand_data.get('sports'), str) else "Спорт"
-                    level = cand_data.get('level', 'Любитель')
-                    
-                    caption = (
-                        f"🎯 <b>Вам подобрана пара!</b>\n\n"
-                        f"👤 <b>{info_line}</b>\n"
-                        f"📍 {cand_data.get('city', 'Город')}\n"
-                        f"🏅 {sports_str} ({level})\n\n"
-                        f"ℹ️ {cand_data.get('about', '')}"
-                    )
-                    
-                    msg_data = {
-                        "user_id": my_id,
-                        "text": caption,
-                        "photo": cand_data.get('photo'),
-                        "keyboard": get_dating_kb(best_match.user_id).model_dump()
-                    }
-                    
-                    await send_to_queue("q_notifications", msg_data)
-                    
-                    MATCHES_GENERATED.inc()
-                    matches_count += 1
-                    
-                    await asyncio.sleep(0.05)
-
-                except Exception as loop_e:
-                    log.error("error_processing_user", user_id=me.user_id, error=str(loop_e))
-                    continue
-
-            log.info("matching_completed", matches_created=matches_count)
+                for user_id, target_id in seen_rows:
+                    seen.setdefault(user_id, set()).add(target_id)
+
+        log.info("profiles_fetched", count=len(profiles))
+
+        # 3. Близость текстов и подбор
+        feeds, similar = await compute_feeds(profiles, seen, log)
+        if dry_run:
+            log.info("matching_completed", dry_run=True, seekers_with_matches=sum(1 for f in feeds.values() if f))
+            return feeds
+        await redis_service.set_dating_similarity_bulk(similar)
+
+        # 4. Первую анкету отправляем сразу, остальные ждут кнопки "Следующая"
+        cards = {uid: build_card(answers) for uid, answers in profiles.items()}
+        queues = {}
+        messages = []
+        for my_id, ranked in feeds.items():
+            queues[my_id] = ranked[1:]
+            if not ranked:
+                continue # Нет подходящих пар сегодня
+
+            best_card = cards[ranked[0]]
+            messages.append({
+                "user_id": my_id,
+                "text": CARD_TITLE + best_card['text'],
+                "photo": best_card['photo'],
+                "keyboard": get_dating_kb(ranked[0]).model_dump()
+            })
+
+        await redis_service.set_dating_bulk(queues, cards)
+        FEED_REFRESHES.labels(source="daily").inc(len(queues))
+
+        # 5. Одна пакетная публикация вместо сообщения на каждого
+        await publish_stream("dating", messages)
+        MATCHES_GENERATED.inc(len(messages))
+
+        log.info("matching_completed", matches_created=len(messages))
+        return feeds
 
     except Exception as e:
         log.error("matching_critical_failure", error=str(e))
         await send_alert(e, context="Dating Matching Service")
-        raise e
\ No newline at end of file
+        raise e
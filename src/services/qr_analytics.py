@@ -0,0 +1,112 @@
+import csv
+import datetime
+import html
+import io
+
+from sqlalchemy import BigInteger, cast, func, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.session import async_session_maker
+from src.database.models import QRCode, QRBatch, QRBatchHourly
+
+FIFTH_ACTIVATION = 5
+COUNTERS = ("activations", "first_activations", "repeat_activations", "fifth_activations", "seconds_to_fifth")
+
+
+# --- ЗАПИСЬ (в транзакции активации) ---
+
+async def record_activation(
+    session: AsyncSession, batch_id: str, user_id: int, activation_count: int, now: datetime.datetime
+):
+    """+1 активация в почасовую строку партии. Коммит — вместе с самой активацией."""
+    if activation_count == FIFTH_ACTIVATION:
+        # Время от первой активации юзера до пятой (по индексу activated_by_id, пара строк)
+        first_at = select(func.min(QRCode.activated_at)).where(QRCode.activated_by_id == user_id).scalar_subquery()
+        to_fifth = cast(func.coalesce(func.extract("epoch", literal(now) - first_at), 0), BigInteger)
+    else:
+        to_fifth = 0
+
+    stmt = pg_insert(QRBatchHourly).values(
+        batch_id=batch_id,
+        hour=now.replace(minute=0, second=0, microsecond=0),
+        activations=1,
+        first_activations=int(activation_count == 1),
+        repeat_activations=int(activation_count > 1),
+        fifth_activations=int(activation_count == FIFTH_ACTIVATION),
+        seconds_to_fifth=to_fifth,
+    )
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[QRBatchHourly.batch_id, QRBatchHourly.hour],
+        set_={col: getattr(QRBatchHourly, col) + getattr(stmt.excluded, col) for col in COUNTERS},
+    ))
+
+
+# --- ЧТЕНИЕ (только роллапы: часы x партии, без скана qr_codes) ---
+
+def _totals():
+    return [func.coalesce(func.sum(getattr(QRBatchHourly, col)), 0).label(col) for col in COUNTERS]
+
+
+async def batch_summaries(limit: int = 20) -> list:
+    stmt = (
+        select(
+            QRBatch.batch_id, QRBatch.codes, QRBatch.created_at, *_totals(),
+            func.min(QRBatchHourly.hour).label("first_hour"),
+            func.max(QRBatchHourly.hour).label("last_hour"),
+        )
+        .outerjoin(QRBatchHourly, QRBatchHourly.batch_id == QRBatch.batch_id)
+        .group_by(QRBatch.batch_id)
+        .order_by(QRBatch.created_at.desc())
+        .limit(limit)
+    )
+    async with async_session_maker() as session:
+        return (await session.execute(stmt)).all()
+
+
+async def batch_timeline(batch_id: str, days: int = 14) -> list:
+    """Активации партии по дням за последние days дней (свертка почасовых строк)."""
+    day = func.date_trunc("day", QRBatchHourly.hour).label("day")
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+    stmt = (
+        select(day, *_totals())
+        .where(QRBatchHourly.batch_id == batch_id, QRBatchHourly.hour >= since)
+        .group_by(day)
+        .order_by(day)
+    )
+    async with async_session_maker() as session:
+        return (await session.execute(stmt)).all()
+
+
+async def export_batch_csv(batch_id: str) -> bytes:
+    """Почасовая воронка партии целиком в CSV (для маркетинга)."""
+    stmt = (
+        select(QRBatchHourly.hour, *(getattr(QRBatchHourly, col) for col in COUNTERS))
+        .where(QRBatchHourly.batch_id == batch_id)
+        .order_by(QRBatchHourly.hour)
+    )
+    async with async_session_maker() as session:
+        rows = (await session.execute(stmt)).all()
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["hour", *COUNTERS])
+    for row in rows:
+        writer.writerow([row.hour.isoformat(), *row[1:]])
+    return buf.getvalue().encode("utf-8")
+
+
+# --- ФОРМАТИРОВАНИЕ ---
+
+def avg_hours_to_fifth(row) -> float | None:
+    return round(row.seconds_to_fifth / row.fifth_activations / 3600, 1) if row.fifth_activations else None
+
+
+def format_summary(row) -> str:
+    conversion = row.activations / row.codes if row.codes else 0
+    to_fifth = avg_hours_to_fifth(row)
+    return (
+        f"🎫 <b>{html.escape(str(row.batch_id))}</b>: {row.activations} / {row.codes} ({conversion:.1%})\n"
+        f"   новых: {row.first_activations}, повторных: {row.repeat_activations}, "
+        f"до 5-й: {row.fifth_activations}" + (f" (в ср. {to_fifth} ч)" if to_fifth is not None else "")
+    )
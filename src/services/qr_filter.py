@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import math
+import time
+from typing import Optional
+
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+from sqlalchemy import func, select
+
+from src.database.session import async_session_maker
+from src.database.models import QRCode
+from src.services.broadcast import stream_rows
+from src.services.redis import redis_service
+
+# --- OBSERVABILITY ---
+from src.utils.logger import logger
+
+QR_FILTER_LOOKUPS = Counter('rex_qr_filter_lookups_total', 'QR code pre-checks by Bloom filter', ['result']) # rejected, passed, unbuilt
+
+FALSE_POSITIVE_RATE = 0.001
+# Как часто сверяем версию фильтра с Redis перед тем как поверить отрицательному ответу
+VERSION_CHECK_INTERVAL = 30
+
+
+class BloomFilter:
+    """Битовый массив + k хэшей (двойное хэширование blake2b). Ложных отрицаний нет."""
+    def __init__(self, capacity: int, error_rate: float = FALSE_POSITIVE_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class QRCodeFilter:
+    """
+    Фильтр существующих code_hash в памяти процесса.
+    Несуществующий код отсекается без запроса в БД; "возможно есть" -> идем в БД.
+    Новая партия поднимает версию в Redis, и реплики перестраивают фильтр.
+    """
+    def __init__(self):
+        self._bloom: Optional[BloomFilter] = None
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.log = logger.bind(service="qr_filter")
+
+    async def rebuild(self):
+        async with self._lock:
+            started = time.monotonic()
+            version = await redis_service.get_qr_filter_version()
+            async with async_session_maker() as session:
+                total = await session.scalar(select(func.count()).select_from(QRCode))
+
+            # Запас на коды, добавленные между count и чтением
+            bloom = BloomFilter(int(total * 1.1) + 1000)
+            async for row in stream_rows(select(QRCode.code_hash)):
+                bloom.add(row.code_hash)
+
+            self._bloom, self._version, self._checked_at = bloom, version, time.monotonic()
+            self.log.info(
+                "qr_filter_rebuilt", codes=total, size_bytes=len(bloom.bits),
+                hashes=bloom.hashes, version=version, duration=round(time.monotonic() - started, 2)
+            )
+
+    async def refresh(self):
+        """rebuild без исключений: при сбое фильтр остается прежним (или пустым — тогда все идет в БД)."""
+        try:
+            await self.rebuild()
+        except Exception as e:
+            self.log.error("qr_filter_rebuild_failed", error=str(e))
+
+    async def _is_current(self) -> bool:
+        """Фильтр не старее последней партии (сверка с Redis не чаще раза в VERSION_CHECK_INTERVAL)."""
+        if time.monotonic() - self._checked_at < VERSION_CHECK_INTERVAL:
+            return True
+        try:
+            version = await redis_service.get_qr_filter_version()
+        except RedisError:
+            return False
+        if version != self._version:
+            # Появилась новая партия: перестраиваем в фоне, пока доверяем только БД
+            if self._task is None or self._task.done():
+                self._task = asyncio.create_task(self.refresh())
+            return False
+        self._checked_at = time.monotonic()
+        return True
+
+    async def may_exist(self, code_hash: str) -> bool:
+        if self._bloom is None:
+            QR_FILTER_LOOKUPS.labels(result="unbuilt").inc()
+            return True
+        if code_hash in self._bloom or not await self._is_current():
+            QR_FILTER_LOOKUPS.labels(result="passed").inc()
+            return True
+        QR_FILTER_LOOKUPS.labels(result="rejected").inc()
+        return False
+
+
+qr_filter = QRCodeFilter()
+
+
+async def notify_qr_batch_created():
+    """Вызывать после вставки партии кодов: реплики бота перестроят фильтр."""
+    await redis_service.bump_qr_filter_version()
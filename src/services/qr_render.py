@@ -0,0 +1,81 @@
+import io
+
+import qrcode
+import qrcode.image.svg
+from PIL import Image, ImageDraw, ImageFont
+
+# Печатные параметры: A4 при 300 dpi
+DPI = 300
+A4_PX = (2480, 3508)
+SHEET_MARGIN_PX = 120
+CAPTION_PX = 40
+
+# Функции модуля выполняются в процессах пула: только чистые данные на входе и байты на выходе
+
+
+def _make_qr(link: str, box_size: int, border: int) -> qrcode.QRCode:
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=box_size, border=border)
+    qr.add_data(link)
+    qr.make(fit=True)
+    return qr
+
+
+def _qr_image(link: str, box_size: int, border: int) -> Image.Image:
+    return _make_qr(link, box_size, border).make_image(fill_color="black", back_color="white").get_image().convert("L")
+
+
+def _with_caption(img: Image.Image, caption: str) -> Image.Image:
+    """Подпись с токеном под кодом — чтобы на производстве можно было сверить вручную."""
+    canvas = Image.new("L", (img.width, img.height + CAPTION_PX), 255)
+    canvas.paste(img, (0, 0))
+    draw = ImageDraw.Draw(canvas)
+    font = ImageFont.load_default()
+    text_width = draw.textlength(caption, font=font)
+    draw.text(((img.width - text_width) / 2, img.height + 8), caption, fill=0, font=font)
+    return canvas
+
+
+def render_png(items: list, box_size: int = 10, border: int = 4, caption: bool = True) -> list:
+    """items: [(имя файла, токен, ссылка)] -> [(имя файла, PNG байты)]"""
+    out = []
+    for name, token, link in items:
+        img = _qr_image(link, box_size, border)
+        if caption:
+            img = _with_caption(img, token)
+        buf = io.BytesIO()
+        img.save(buf, "PNG", optimize=True, dpi=(DPI, DPI))
+        out.append((name, buf.getvalue()))
+    return out
+
+
+def render_svg(items: list, box_size: int = 10, border: int = 4, caption: bool = True) -> list:
+    """Вектор для типографии; подпись в SVG не встраиваем — она не нужна плоттеру."""
+    out = []
+    for name, token, link in items:
+        img = _make_qr(link, box_size, border).make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        out.append((name, img.to_string(encoding="unicode").encode()))
+    return out
+
+
+def render_pdf_sheet(name: str, items: list, cols: int, rows: int, caption: bool = True) -> list:
+    """Один лист A4 с сеткой cols x rows кодов -> [(имя файла, PDF байты)]"""
+    page = Image.new("L", A4_PX, 255)
+    cell_w = (A4_PX[0] - 2 * SHEET_MARGIN_PX) // cols
+    cell_h = (A4_PX[1] - 2 * SHEET_MARGIN_PX) // rows
+    side = min(cell_w, cell_h - (CAPTION_PX if caption else 0)) - 20
+
+    for i, (_, token, link) in enumerate(items[:cols * rows]):
+        # Целый размер модуля под ячейку вместо ресэмплинга: все модули одинаковые, края четкие
+        qr = _make_qr(link, box_size=1, border=2)
+        qr.box_size = max(1, side // (qr.modules_count + 2 * qr.border))
+        img = qr.make_image(fill_color="black", back_color="white").get_image().convert("L")
+        if caption:
+            img = _with_caption(img, token)
+        x = SHEET_MARGIN_PX + (i % cols) * cell_w + (cell_w - img.width) // 2
+        y = SHEET_MARGIN_PX + (i // cols) * cell_h + (cell_h - img.height) // 2
+        page.paste(img, (x, y))
+
+    # 1 бит: в PDF уходит без потерь (CCITT), а не JPEG-ом с артефактами на краях модулей
+    buf = io.BytesIO()
+    page.convert("1", dither=Image.NONE).save(buf, "PDF", resolution=DPI)
+    return [(name, buf.getvalue())]
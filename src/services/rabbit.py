@@ -1,3 +1,4 @@
+import asyncio
 import json
 import aio_pika
 from src.config import settings
@@ -48,4 +49,58 @@ async def send_to_queue(queue_name: str, data: dict):
         await send_alert(e, context=f"RabbitMQ ({queue_name})")
         
         # Пробрасываем ошибку дальше, чтобы вызывающий код знал о провале
-        raise e
\ No newline at end of file
+        raise e
+
+def _encode(item) -> bytes:
+    """dict -> JSON; уже готовое тело (bytes) из шаблона рассылки отдаем как есть."""
+    return item if isinstance(item, bytes) else json.dumps(item).encode()
+
+
+class QueuePublisher:
+    """
+    Одно соединение и канал на всю рассылку: публикуем пачками, не переподключаясь.
+    async with QueuePublisher("q_notifications") as publisher:
+        await publisher.publish_batch(items)
+    """
+    def __init__(self, queue_name: str, chunk_size: int = 500):
+        self.queue_name = queue_name
+        self.chunk_size = chunk_size
+        self.log = logger.bind(service="rabbitmq", queue=queue_name)
+        self._connection = None
+        self._channel = None
+
+    async def __aenter__(self):
+        try:
+            self._connection = await aio_pika.connect_robust(settings.RABBIT_URL)
+            self._channel = await self._connection.channel()
+            await self._channel.declare_queue(self.queue_name, durable=True)
+        except Exception as e:
+            await self._fail(e, count=0)
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._connection:
+            await self._connection.close()
+
+    async def _fail(self, e: Exception, count: int):
+        self.log.error("batch_publish_failed", error=str(e), count=count)
+        SYSTEM_ERRORS.labels(service="rabbitmq", error_type=type(e).__name__).inc()
+        await send_alert(e, context=f"RabbitMQ batch ({self.queue_name})")
+        raise e
+
+    async def publish_batch(self, items: list):
+        """Публикуем порциями параллельно, дожидаясь подтверждений брокера."""
+        try:
+            for start in range(0, len(items), self.chunk_size):
+                await asyncio.gather(*[
+                    self._channel.default_exchange.publish(
+                        aio_pika.Message(
+                            body=_encode(item),
+                            delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                        ),
+                        routing_key=self.queue_name
+                    )
+                    for item in items[start:start + self.chunk_size]
+                ])
+        except Exception as e:
+            await self._fail(e, count=len(items))
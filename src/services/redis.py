@@ -1,3 +1,4 @@
+import hashlib
 import json
 from typing import Optional, Any
 from redis.asyncio import Redis, from_url
@@ -12,6 +13,58 @@ from src.utils.metrics import SYSTEM_ERRORS
 # --- ЕДИНСТВЕННЫЙ ЭКЗЕМПЛЯР КЛИЕНТА ---
 redis_client: Redis = from_url(settings.REDIS_URL, decode_responses=True)
 
+# Отметка трекинга: проверка дубля и постановка в очередь записи — атомарно, одним вызовом
+_TRACKING_ENQUEUE_LUA = """
+if redis.call('SADD', KEYS[1], ARGV[1]) == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    redis.call('RPUSH', KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Снимаем блокировку, только если она все еще наша
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Продлеваем блокировку, только если она все еще наша
+_EXTEND_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Срезаем голову очереди трекинга, только если блокировка наша и голова та же, что мы прочитали
+# (строки уникальны: дубль отсекается SADD при постановке)
+_TRACKING_TRIM_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+local count = tonumber(ARGV[2])
+if redis.call('LINDEX', KEYS[2], 0) ~= ARGV[3] or redis.call('LINDEX', KEYS[2], count - 1) ~= ARGV[4] then
+    return 0
+end
+redis.call('LTRIM', KEYS[2], count, -1)
+return 1
+"""
+
+# Версию анкеты храним дольше, чем живет незавершенная анкета в FSM
+SURVEY_VERSION_TTL = 7 * 86400
+
+# Хэши содержимого, записанного синхронизацией ("survey:diet" -> хэш), и канал событий об изменениях
+CONFIG_HASHES_KEY = "config_hashes"
+CONFIG_CHANNEL = "config_changed"
+
+def survey_config_version(config) -> str:
+    """Короткий хэш содержимого анкеты: одинаковые вопросы -> одинаковая версия."""
+    raw = json.dumps(config, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
 class RedisService:
     """
     Класс-сервис для инкапсуляции всей логики работы с Redis.
@@ -20,6 +73,10 @@ class RedisService:
     def __init__(self, client: Redis):
         self.client = client
         self.log = logger.bind(service="redis")
+        self._tracking_enqueue = client.register_script(_TRACKING_ENQUEUE_LUA)
+        self._release_lock = client.register_script(_RELEASE_LOCK_LUA)
+        self._extend_lock = client.register_script(_EXTEND_LOCK_LUA)
+        self._tracking_trim = client.register_script(_TRACKING_TRIM_LUA)
 
     async def _safe_get(self, key: str) -> Optional[str]:
         """Внутренний метод для безопасного чтения."""
@@ -53,8 +110,30 @@ class RedisService:
                 return None
         return None
 
-    async def set_survey_config(self, mode: str, config: dict):
-        await self._safe_set(f"survey_config:{mode}", json.dumps(config))
+    async def set_survey_config(self, mode: str, config: dict) -> str:
+        """
+        Пишет актуальную анкету и ее копию под версией (хэш содержимого).
+        Начатые анкеты закреплены за версией в FSM и дочитывают свою копию.
+        """
+        version = survey_config_version(config)
+        async with self.client.pipeline(transaction=True) as pipe:
+            self._queue_survey_config(pipe, mode, version, config)
+            await pipe.execute()
+        return version
+
+    @staticmethod
+    def _queue_survey_config(pipe, mode: str, version: str, config):
+        data = json.dumps(config)
+        pipe.set(f"survey_config:{mode}:{version}", data, ex=SURVEY_VERSION_TTL)
+        pipe.set(f"survey_config:{mode}", data)
+        pipe.set(f"survey_config_version:{mode}", version)
+
+    async def get_survey_config_version(self, mode: str) -> Optional[str]:
+        return await self._safe_get(f"survey_config_version:{mode}")
+
+    async def get_survey_config_by_version(self, mode: str, version: str) -> Optional[list]:
+        data = await self._safe_get(f"survey_config:{mode}:{version}")
+        return json.loads(data) if data else None
 
     # --- Работа с промптами ---
     async def get_prompt(self, mode: str) -> Optional[str]:
@@ -63,6 +142,44 @@ class RedisService:
     async def set_prompt(self, mode: str, text: str):
         await self._safe_set(f"prompt:{mode}", text)
 
+    # --- Синхронизация конфигов (только изменившиеся ключи + событие) ---
+    async def get_config_hashes(self) -> dict:
+        return await self.client.hgetall(CONFIG_HASHES_KEY)
+
+    async def missing_config_modes(self, survey_modes: list, prompt_modes: list) -> tuple[list, list]:
+        """Режимы, чьих анкет / промптов нет в Redis (свежий или очищенный Redis)."""
+        async with self.client.pipeline(transaction=False) as pipe:
+            for mode in survey_modes:
+                pipe.exists(f"survey_config_version:{mode}")
+            for mode in prompt_modes:
+                pipe.exists(f"prompt:{mode}")
+            found = await pipe.execute()
+        surveys_found, prompts_found = found[:len(survey_modes)], found[len(survey_modes):]
+        return (
+            [mode for mode, ok in zip(survey_modes, surveys_found) if not ok],
+            [mode for mode, ok in zip(prompt_modes, prompts_found) if not ok],
+        )
+
+    async def apply_config_changes(self, surveys: dict, prompts: dict, hashes: dict, event: dict):
+        """
+        surveys: {mode: (version, questions)}, prompts: {mode: text}, hashes: {"survey:mode": хэш}.
+        Все изменения и новые хэши — одной транзакцией, событие — после нее.
+        """
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                for mode, (version, questions) in surveys.items():
+                    self._queue_survey_config(pipe, mode, version, questions)
+                for mode, text in prompts.items():
+                    pipe.set(f"prompt:{mode}", text)
+                pipe.hset(CONFIG_HASHES_KEY, mapping=hashes)
+                await pipe.execute()
+            await self.client.publish(CONFIG_CHANNEL, json.dumps(event))
+        except RedisError as e:
+            self.log.error("redis_config_apply_failed", error=str(e))
+            SYSTEM_ERRORS.labels(service="redis", error_type=type(e).__name__).inc()
+            await send_alert(e, context="Redis Config Sync")
+            raise e
+
     # --- Работа с гороскопами ---
     async def get_horoscope(self, sign: str) -> Optional[str]:
         return await self._safe_get(f"horoscope:{sign}")
@@ -70,6 +187,217 @@ class RedisService:
     async def set_horoscope(self, sign: str, text: str):
         await self._safe_set(f"horoscope:{sign}", text, ex=86400) 
 
+    # --- Вечерние отчеты: последняя обработанная минута (эпоха, в минутах) ---
+    async def get_checkin_cursor(self, name: str) -> Optional[int]:
+        value = await self._safe_get(f"checkin:last_minute:{name}")
+        return int(value) if value else None
+
+    async def set_checkin_cursor(self, name: str, minute: int):
+        await self._safe_set(f"checkin:last_minute:{name}", minute, ex=86400)
+
+    # --- Работа с дейтингом (очереди кандидатов) ---
+    async def set_dating_feed(self, user_id: int, candidate_ids: list[int], ex: int = 172800):
+        """Атомарно заменяет очередь кандидатов пользователя."""
+        key = f"dating_feed:{user_id}"
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                if candidate_ids:
+                    pipe.rpush(key, *candidate_ids)
+                    pipe.expire(key, ex)
+                await pipe.execute()
+        except RedisError as e:
+            self.log.error("redis_feed_set_failed", key=key, error=str(e))
+            SYSTEM_ERRORS.labels(service="redis", error_type=type(e).__name__).inc()
+
+    async def pop_dating_candidate(self, user_id: int) -> Optional[int]:
+        key = f"dating_feed:{user_id}"
+        try:
+            value = await self.client.lpop(key)
+            return int(value) if value else None
+        except RedisError as e:
+            self.log.error("redis_feed_pop_failed", key=key, error=str(e))
+            SYSTEM_ERRORS.labels(service="redis", error_type=type(e).__name__).inc()
+            return None
+
+    async def get_dating_feed_length(self, user_id: int) -> int:
+        try:
+            return await self.client.llen(f"dating_feed:{user_id}")
+        except RedisError as e:
+            self.log.error("redis_feed_len_failed", user_id=user_id, error=str(e))
+            return 0
+
+    async def get_dating_feed_lengths(self, user_ids: list[int]) -> dict:
+        """{user_id: длина очереди} одним пайплайном."""
+        if not user_ids:
+            return {}
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for uid in user_ids:
+                    pipe.llen(f"dating_feed:{uid}")
+                lengths = await pipe.execute()
+            return dict(zip(user_ids, lengths))
+        except RedisError as e:
+            self.log.error("redis_feed_lengths_failed", count=len(user_ids), error=str(e))
+            SYSTEM_ERRORS.labels(service="redis", error_type=type(e).__name__).inc()
+            return {}
+
+    async def set_dating_card(self, user_id: int, card: dict):
+        await self._safe_set(f"dating_card:{user_id}", json.dumps(card), ex=604800)
+
+    async def get_dating_card(self, user_id: int) -> Optional[dict]:
+        data = await self._safe_get(f"dating_card:{user_id}")
+        return json.loads(data) if data else None
+
+    async def set_dating_bulk(self, feeds: dict, cards: dict, ex: int = 172800, chunk: int = 1000):
+        """Пакетная запись очередей и карточек (для ежедневного пересчета) пайплайнами."""
+        try:
+            items = [("feed", uid, ids) for uid, ids in feeds.items()] + [("card", uid, c) for uid, c in cards.items()]
+            for start in range(0, len(items), chunk):
+                async with self.client.pipeline(transaction=False) as pipe:
+                    for kind, uid, value in items[start:start + chunk]:
+                        if kind == "card":
+                            pipe.set(f"dating_card:{uid}", json.dumps(value), ex=604800)
+                            continue
+                        key = f"dating_feed:{uid}"
+                        pipe.delete(key)
+                        if value:
+                            pipe.rpush(key, *value)
+                            pipe.expire(key, ex)
+                    await pipe.execute()
+        except RedisError as e:
+            self.log.error("redis_feed_bulk_failed", error=str(e))
+            SYSTEM_ERRORS.labels(service="redis", error_type=type(e).__name__).inc()
+            await send_alert(e, context="Redis Dating Bulk Write")
+            raise e
+
+    async def set_dating_similarity_bulk(self, similar: dict, ex: int = 172800, chunk: int = 1000):
+        """Сохраняет соседей по тексту 'О себе': dating_sim:{user_id} -> {cand_id: score}."""
+        try:
+            items = list(similar.items())
+            for start in range(0, len(items), chunk):
+                async with self.client.pipeline(transaction=False) as pipe:
+                    for uid, scores in items[start:start + chunk]:
+                        key = f"dating_sim:{uid}"
+                        pipe.delete(key)
+                        if scores:
+                            pipe.hset(key, mapping=scores)
+                            pipe.expire(key, ex)
+                    await pipe.execute()
+        except RedisError as e:
+            self.log.error("redis_similarity_bulk_failed", error=str(e))
+            SYSTEM_ERRORS.labels(service="redis", error_type=type(e).__name__).inc()
+
+    async def get_dating_similarity(self, user_id: int) -> dict:
+        try:
+            raw = await self.client.hgetall(f"dating_sim:{user_id}")
+            return {int(k): float(v) for k, v in raw.items()}
+        except RedisError as e:
+            self.log.error("redis_similarity_get_failed", user_id=user_id, error=str(e))
+            SYSTEM_ERRORS.labels(service="redis", error_type=type(e).__name__).inc()
+            return {}
+
+    async def mark_dating_dirty(self, *user_ids: int):
+        """Помечает пользователей: их очереди нужно пересчитать."""
+        if not user_ids:
+            return
+        try:
+            await self.client.sadd("dating_feed:dirty", *user_ids)
+        except RedisError as e:
+            self.log.error("redis_feed_dirty_failed", user_ids=list(user_ids), error=str(e))
+            SYSTEM_ERRORS.labels(service="redis", error_type=type(e).__name__).inc()
+
+    async def pop_dating_dirty(self, count: int) -> list[int]:
+        try:
+            members = await self.client.spop("dating_feed:dirty", count)
+            return [int(x) for x in members or []]
+        except RedisError as e:
+            self.log.error("redis_feed_dirty_pop_failed", error=str(e))
+            SYSTEM_ERRORS.labels(service="redis", error_type=type(e).__name__).inc()
+            return []
+
+    # --- Работа с трекингом (write-behind буфер) ---
+    TRACKING_PENDING_KEY = "tracking:pending"
+
+    async def enqueue_tracking(self, user_id: int, mode: str, date: str, status: str, ex: int = 172800) -> bool:
+        """
+        Ставит отметку в очередь на запись в БД.
+        False — юзер уже отмечался сегодня по этому режиму (дубль).
+        """
+        row = json.dumps({"user_id": user_id, "mode": mode, "date": date, "status": status})
+        try:
+            added = await self._tracking_enqueue(
+                keys=[f"tracking_done:{date}", self.TRACKING_PENDING_KEY],
+                args=[f"{user_id}:{mode}", row, ex],
+            )
+            return bool(added)
+        except RedisError as e:
+            self.log.error("redis_tracking_enqueue_failed", user_id=user_id, error=str(e))
+            SYSTEM_ERRORS.labels(service="redis", error_type=type(e).__name__).inc()
+            raise e
+
+    async def peek_tracking_pending(self, count: int) -> list[str]:
+        """Первые count записей очереди как есть (без удаления — удаляем только после commit в БД)."""
+        return await self.client.lrange(self.TRACKING_PENDING_KEY, 0, count - 1)
+
+    async def trim_tracking_pending(self, lock: str, token: str, raw: list[str]) -> bool:
+        """
+        Удаляет прочитанную голову очереди (raw — результат peek_tracking_pending).
+        False — блокировку перехватили или голова уже другая: ничего не удаляем.
+        """
+        trimmed = await self._tracking_trim(
+            keys=[f"lock:{lock}", self.TRACKING_PENDING_KEY], args=[token, len(raw), raw[0], raw[-1]],
+        )
+        return bool(trimmed)
+
+    async def get_tracking_pending_length(self) -> int:
+        return await self.client.llen(self.TRACKING_PENDING_KEY)
+
+    async def get_tracking_snapshot(self, user_id: int, mode: str) -> Optional[dict]:
+        data = await self._safe_get(f"tracking_stats:{user_id}:{mode}")
+        return json.loads(data) if data else None
+
+    async def set_tracking_snapshot(self, user_id: int, mode: str, snapshot: dict, ex: int = 259200):
+        await self._safe_set(f"tracking_stats:{user_id}:{mode}", json.dumps(snapshot), ex=ex)
+
+    # --- Кэш подписки ---
+    async def get_subscription_expiry(self, user_id: int) -> Optional[str]:
+        return await self._safe_get(f"sub_expires:{user_id}")
+
+    async def set_subscription_expiry(self, user_id: int, value: str, ex: int):
+        try:
+            await self.client.set(f"sub_expires:{user_id}", value, ex=ex)
+        except RedisError as e:
+            # Кэш не критичен: следующая проверка просто сходит в БД
+            self.log.error("redis_subscription_set_failed", user_id=user_id, error=str(e))
+            SYSTEM_ERRORS.labels(service="redis", error_type=type(e).__name__).inc()
+
+    async def delete_subscription_expiry(self, user_id: int):
+        await self.client.delete(f"sub_expires:{user_id}")
+
+    # --- Версия фильтра QR-кодов (растет с каждой новой партией) ---
+    async def get_qr_filter_version(self) -> Optional[str]:
+        return await self._safe_get("qr_filter_version")
+
+    async def bump_qr_filter_version(self) -> int:
+        return await self.client.incr("qr_filter_version")
+
+    # --- Дедупликация апдейтов (webhook-реплики) ---
+    async def claim_update(self, update_id: int, ex: int) -> bool:
+        """True — апдейт наш; False — его уже взяла другая реплика (или это ретрай)."""
+        return bool(await self.client.set(f"update_seen:{update_id}", "1", nx=True, ex=ex))
+
+    # --- Блокировки ---
+    async def acquire_lock(self, name: str, token: str, ttl_ms: int) -> bool:
+        return bool(await self.client.set(f"lock:{name}", token, nx=True, px=ttl_ms))
+
+    async def release_lock(self, name: str, token: str):
+        await self._release_lock(keys=[f"lock:{name}"], args=[token])
+
+    async def extend_lock(self, name: str, token: str, ttl_ms: int) -> bool:
+        """False — блокировка уже не наша (истекла и ее взял другой)."""
+        return bool(await self._extend_lock(keys=[f"lock:{name}"], args=[token, ttl_ms]))
+
     # --- Общие операции ---
     async def get(self, key: str) -> Optional[str]:
         return await self._safe_get(key)
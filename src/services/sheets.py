@@ -1,7 +1,13 @@
-import json
+import asyncio
 import time
-from gspread_asyncio import AsyncioGspreadClientManager
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
+from prometheus_client import Counter
+
 from src.config import settings
 
 # --- OBSERVABILITY ---
@@ -9,70 +15,164 @@ from src.utils.logger import logger
 from src.utils.alerting import send_alert
 from src.utils.metrics import SYSTEM_ERRORS
 
-def get_creds():
-    creds = Credentials.from_service_account_file(settings.GOOGLE_CREDENTIALS_FILE)
-    scoped = creds.with_scopes([
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ])
-    return scoped
+SHEETS_API_CALLS = Counter('rex_sheets_api_calls_total', 'Google API calls made by survey sync', ['call']) # marker, metadata, values
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets.readonly",
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+]
+SHEETS_API = "https://sheets.googleapis.com/v4"
+DRIVE_API = "https://www.googleapis.com/drive/v3"
+REQUEST_TIMEOUT = 30
+
+# Лист 1 — вопросы (mode, key, type, text, options), лист "Prompts" (или второй) — промпты (mode, text)
+PROMPTS_SHEET = "Prompts"
+QUESTIONS_COLUMNS = "A:E"
+PROMPTS_COLUMNS = "A:B"
+
+
+@dataclass(frozen=True, slots=True)
+class SheetsSnapshot:
+    marker: str   # Версия файла в Drive на момент чтения
+    surveys: dict
+    prompts: dict
+
+
+# --- РАЗБОР ЛИСТОВ ---
+
+def parse_surveys(rows: list) -> dict:
+    surveys = {}
+    for r in rows[1:]:
+        if len(r) < 4 or not r[0]: continue
+        mode, key, q_type, text = r[0].strip(), r[1].strip(), r[2].strip(), r[3].strip()
+        options = [x.strip() for x in r[4].split(',')] if len(r) > 4 and r[4] else []
+        surveys.setdefault(mode, []).append({"key": key, "type": q_type, "text": text, "options": options})
+    return surveys
 
-agcm = AsyncioGspreadClientManager(get_creds)
 
-async def fetch_all_data():
-    """Скачивает и вопросы (Лист 1), и промпты (Лист 2) с мониторингом."""
+def parse_prompts(rows: list) -> dict:
+    prompts = {}
+    for r in rows[1:]:
+        if len(r) < 2 or not r[0]: continue
+        prompts[r[0].strip()] = r[1].strip()
+    return prompts
+
+
+def _a1(title: str, columns: str) -> str:
+    return "'" + title.replace("'", "''") + "'!" + columns
+
+
+# --- КЛИЕНТ ---
+
+class SheetsClient:
+    """
+    Тонкий клиент Sheets/Drive REST: токен и HTTP-сессия живут весь процесс.
+    Цикл синхронизации: версия файла в Drive (1 легкий запрос) -> если изменился,
+    названия листов + оба диапазона одним values:batchGet.
+    api_url — свой сервер (фейковый для локальных проверок, см. scripts/fake_sheets_api.py), без авторизации.
+    """
+    def __init__(self, sheet_id: str, api_url: Optional[str] = None):
+        self.sheet_id = sheet_id
+        self.stub = bool(api_url)
+        self.sheets_api = f"{api_url.rstrip('/')}/v4" if api_url else SHEETS_API
+        self.drive_api = f"{api_url.rstrip('/')}/drive/v3" if api_url else DRIVE_API
+        self._creds: Optional[Credentials] = None
+        self._auth_lock = asyncio.Lock()
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._synced_marker: Optional[str] = None
+
+    async def _headers(self) -> dict:
+        if self.stub:
+            return {}
+        async with self._auth_lock:
+            if self._creds is None:
+                self._creds = Credentials.from_service_account_file(settings.GOOGLE_CREDENTIALS_FILE, scopes=SCOPES)
+            if not self._creds.valid:
+                # Обновление токена — синхронный HTTP google-auth, уводим в поток (раз в час)
+                await asyncio.to_thread(self._creds.refresh, Request())
+        return {"Authorization": f"Bearer {self._creds.token}"}
+
+    async def _get(self, call: str, url: str, params) -> dict:
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+        SHEETS_API_CALLS.labels(call=call).inc()
+        async with self._http.get(url, params=params, headers=await self._headers()) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def modified_marker(self) -> str:
+        data = await self._get(
+            "marker", f"{self.drive_api}/files/{self.sheet_id}",
+            {"fields": "version,modifiedTime", "supportsAllDrives": "true"},
+        )
+        return str(data.get("version") or data["modifiedTime"])
+
+    async def _sheet_titles(self) -> list[str]:
+        data = await self._get(
+            "metadata", f"{self.sheets_api}/spreadsheets/{self.sheet_id}",
+            {"fields": "sheets.properties(title,index)"},
+        )
+        sheets = sorted(data.get("sheets", []), key=lambda s: s["properties"].get("index", 0))
+        return [s["properties"]["title"] for s in sheets]
+
+    async def fetch(self, force: bool = False) -> Optional[SheetsSnapshot]:
+        """None — файл не менялся с последней успешной синхронизации (см. mark_synced)."""
+        # Версию читаем ДО данных: правка посередине даст новую версию и перечитку в следующий раз
+        marker = await self.modified_marker()
+        if not force and marker == self._synced_marker:
+            return None
+
+        titles = await self._sheet_titles()
+        ranges = [_a1(titles[0], QUESTIONS_COLUMNS)]
+        prompts_title = PROMPTS_SHEET if PROMPTS_SHEET in titles else (titles[1] if len(titles) > 1 else None)
+        if prompts_title:
+            ranges.append(_a1(prompts_title, PROMPTS_COLUMNS))
+
+        data = await self._get(
+            "values", f"{self.sheets_api}/spreadsheets/{self.sheet_id}/values:batchGet",
+            [("ranges", r) for r in ranges] + [("majorDimension", "ROWS")],
+        )
+        value_ranges = data.get("valueRanges", [])
+        rows_q = value_ranges[0].get("values", []) if value_ranges else []
+        rows_p = value_ranges[1].get("values", []) if len(value_ranges) > 1 else []
+        return SheetsSnapshot(marker=marker, surveys=parse_surveys(rows_q), prompts=parse_prompts(rows_p))
+
+    def mark_synced(self, marker: str):
+        """Вызывать после того, как снимок записан: до этого сбой синхронизации приведет к повторному чтению."""
+        self._synced_marker = marker
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+
+sheets_client = SheetsClient(settings.GOOGLE_SHEET_ID, settings.GOOGLE_API_URL)
+
+
+async def fetch_all_data(force: bool = False) -> Optional[SheetsSnapshot]:
+    """Вопросы (Лист 1) и промпты (Лист 2) с мониторингом; None — таблица не менялась."""
     log = logger.bind(service="google_sheets")
     start_time = time.time()
-    
-    try:
-        agc = await agcm.authorize()
-        sh = await agc.open_by_key(settings.GOOGLE_SHEET_ID)
-        
-        # 1. Читаем вопросы (Лист 1)
-        ws_questions = await sh.get_worksheet(0)
-        rows_q = await ws_questions.get_all_values()
-        surveys = {}
-        
-        if rows_q:
-            for r in rows_q[1:]:
-                if len(r) < 4 or not r[0]: continue
-                mode, key, q_type, text = r[0].strip(), r[1].strip(), r[2].strip(), r[3].strip()
-                options = [x.strip() for x in r[4].split(',')] if len(r) > 4 and r[4] else []
-                
-                if mode not in surveys: surveys[mode] = []
-                surveys[mode].append({"key": key, "type": q_type, "text": text, "options": options})
-
-        # 2. Читаем промпты (Лист 2)
-        try:
-            ws_prompts = await sh.worksheet("Prompts")
-        except:
-            try:
-                ws_prompts = await sh.get_worksheet(1)
-            except:
-                ws_prompts = None
-
-        prompts = {}
-        if ws_prompts:
-            rows_p = await ws_prompts.get_all_values()
-            if rows_p:
-                for r in rows_p[1:]: 
-                    if len(r) < 2 or not r[0]: continue
-                    mode, text = r[0].strip(), r[1].strip()
-                    prompts[mode] = text
-
-        duration = time.time() - start_time
-        log.info(
-            "sheets_fetch_success", 
-            duration=duration, 
-            survey_modes=list(surveys.keys()),
-            prompt_modes=list(prompts.keys())
-        )
-        
-        return surveys, prompts
 
+    try:
+        snapshot = await sheets_client.fetch(force=force)
     except Exception as e:
         log.error("sheets_fetch_failed", error=str(e))
         SYSTEM_ERRORS.labels(service="google_sheets", error_type=type(e).__name__).inc()
         await send_alert(e, context="Google Sheets Sync")
-        raise e
\ No newline at end of file
+        raise e
+
+    duration = time.time() - start_time
+    if snapshot is None:
+        log.info("sheets_not_modified", duration=duration)
+        return None
+
+    log.info(
+        "sheets_fetch_success",
+        duration=duration,
+        marker=snapshot.marker,
+        survey_modes=list(snapshot.surveys.keys()),
+        prompt_modes=list(snapshot.prompts.keys())
+    )
+    return snapshot
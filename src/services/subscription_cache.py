@@ -0,0 +1,107 @@
+import datetime
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from prometheus_client import Counter
+
+from src.database.session import async_session_maker
+from src.database.models import User
+from src.services.redis import redis_service
+
+# --- МЕТРИКИ ---
+SUBSCRIPTION_CACHE = Counter('rex_subscription_cache_total', 'Subscription lookups by cache level', ['level']) # local, redis, db
+
+LOCAL_MAX_SIZE = 50_000
+LOCAL_TTL = 60        # Активная подписка: срок только растет, устаревшая запись безопасна
+NEGATIVE_TTL = 5      # Нет подписки: держим коротко, активация могла пройти на другой реплике
+REDIS_TTL = 600
+NO_SUBSCRIPTION = "none"
+
+
+class TTLCache:
+    """Ограниченный LRU словарь с временем жизни на каждую запись."""
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float):
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+
+_local = TTLCache(LOCAL_MAX_SIZE)
+
+
+def _is_active(expires_at: Optional[datetime.datetime]) -> bool:
+    return bool(expires_at) and expires_at > datetime.datetime.now(datetime.timezone.utc)
+
+
+def _encode(expires_at: Optional[datetime.datetime]) -> str:
+    return expires_at.isoformat() if expires_at else NO_SUBSCRIPTION
+
+
+def _decode(value: str) -> Optional[datetime.datetime]:
+    return None if value == NO_SUBSCRIPTION else datetime.datetime.fromisoformat(value)
+
+
+async def _load_from_db(user_id: int) -> Optional[datetime.datetime]:
+    async with async_session_maker() as session:
+        db_user = await session.get(User, user_id)
+    return db_user.subscription_expires_at if db_user else None
+
+
+async def get_subscription_expiry(
+    user_id: int, load: Optional[Callable[[], Awaitable[Optional[datetime.datetime]]]] = None
+) -> Optional[datetime.datetime]:
+    """
+    subscription_expires_at юзера: процесс -> Redis -> БД.
+    Обычный случай (активная подписка) обходится без похода в БД.
+    load — загрузчик из БД текущего апдейта (UserContext), чтобы промах кэша
+    не открывал отдельную сессию, а переиспользовал снимок юзера.
+    """
+    cached = _local.get(user_id)
+    if cached is not None:
+        SUBSCRIPTION_CACHE.labels(level="local").inc()
+        return _decode(cached)
+
+    cached = await redis_service.get_subscription_expiry(user_id)
+    if cached is None:
+        SUBSCRIPTION_CACHE.labels(level="db").inc()
+        cached = _encode(await load() if load else await _load_from_db(user_id))
+        expires_at = _decode(cached)
+        await redis_service.set_subscription_expiry(
+            user_id, cached, ex=REDIS_TTL if _is_active(expires_at) else NEGATIVE_TTL
+        )
+    else:
+        SUBSCRIPTION_CACHE.labels(level="redis").inc()
+        expires_at = _decode(cached)
+
+    _local.set(user_id, cached, LOCAL_TTL if _is_active(expires_at) else NEGATIVE_TTL)
+    return expires_at
+
+
+async def has_active_subscription(user_id: int, load=None) -> bool:
+    return _is_active(await get_subscription_expiry(user_id, load))
+
+
+async def invalidate_subscription(user_id: int):
+    """Сбросить кэш после изменения подписки (активация QR)."""
+    _local.pop(user_id)
+    await redis_service.delete_subscription_expiry(user_id)
@@ -0,0 +1,164 @@
+import datetime
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from aiogram.types import InlineKeyboardMarkup, Message
+from prometheus_client import Counter
+
+from src.bot.keyboards.menu import get_options_keyboard_inline
+from src.services.redis import redis_service, survey_config_version
+from src.services.config_sync import config_watcher, snapshot_survey, CACHE_TTL
+
+# --- МЕТРИКИ ---
+SURVEY_PLAN_CACHE = Counter('rex_survey_plan_cache_total', 'Survey plan lookups', ['result']) # hit, compiled, missing
+
+PLAN_CACHE_SIZE = 64  # режимов 5, версий на режим — единицы
+
+# Валидатор ответа: (значение, текст ошибки)
+Validator = Callable[[Message], tuple[Optional[str], Optional[str]]]
+
+
+# --- ВАЛИДАТОРЫ (выбираются один раз при компиляции) ---
+
+def _validate_photo(message: Message):
+    if not message.photo:
+        return None, "📸 Нужно прислать ФОТО!"
+    return message.photo[-1].file_id, None
+
+
+def _validate_text(message: Message):
+    if not message.text:
+        return None, "✍️ Нужно прислать ТЕКСТ!"
+    return message.text.strip(), None
+
+
+def _validate_birth_date(message: Message):
+    value, error = _validate_text(message)
+    if error:
+        return value, error
+    try:
+        datetime.datetime.strptime(value, "%d.%m.%Y")
+    except ValueError:
+        return None, "❗️ Неверный формат даты! (ДД.ММ.ГГГГ)"
+    return value, None
+
+
+def _pick_validator(question: dict) -> Validator:
+    if question['type'] == 'photo':
+        return _validate_photo
+    if question['key'] == 'birth_date':
+        return _validate_birth_date
+    return _validate_text
+
+
+# --- ПЛАН АНКЕТЫ ---
+
+@dataclass(frozen=True, slots=True)
+class QuestionPlan:
+    key: str
+    type: str
+    text: str
+    prompt: str                              # "Вопрос 2/7:\n..." — готовый текст сообщения
+    keyboard: Optional[InlineKeyboardMarkup] # Inline-кнопки вариантов (собраны заранее)
+    validate: Validator
+
+
+@dataclass(frozen=True, slots=True)
+class SurveyPlan:
+    """Скомпилированная анкета одной версии: неизменяема, общая для всех апдейтов процесса."""
+    mode: str
+    version: str
+    header: str
+    questions: tuple[QuestionPlan, ...]
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+
+def compile_plan(mode: str, version: str, questions: list) -> SurveyPlan:
+    total = len(questions)
+    compiled = tuple(
+        QuestionPlan(
+            key=q['key'],
+            type=q['type'],
+            text=q['text'],
+            prompt=f"Вопрос {i + 1}/{total}:\n{q['text']}",
+            keyboard=get_options_keyboard_inline(q['options']) if q['type'] == 'button' and q.get('options') else None,
+            validate=_pick_validator(q),
+        )
+        for i, q in enumerate(questions)
+    )
+    return SurveyPlan(mode=mode, version=version, header=f"🚀 <b>Режим: {mode.upper()}</b>", questions=compiled)
+
+
+# --- КЭШ В ПРОЦЕССЕ ---
+
+_plans: OrderedDict = OrderedDict()
+_current: dict = {}  # mode -> (актуальная версия, время проверки); обновляется событием config_changed
+
+
+def _remember(plan: SurveyPlan) -> SurveyPlan:
+    _plans[(plan.mode, plan.version)] = plan
+    _plans.move_to_end((plan.mode, plan.version))
+    if len(_plans) > PLAN_CACHE_SIZE:
+        _plans.popitem(last=False)
+    return plan
+
+
+async def _current_version(mode: str) -> Optional[str]:
+    cached = _current.get(mode)
+    if cached is not None and time.monotonic() - cached[1] < CACHE_TTL:
+        return cached[0]
+    version = await redis_service.get_survey_config_version(mode)
+    if version is not None:
+        _current[mode] = (version, time.monotonic())
+    return version
+
+
+def _on_config_change(event: dict):
+    if event.get("reset"):
+        _current.clear()
+        return
+    # Новая версия приходит в самом событии — Redis не трогаем, план соберется при первом запросе
+    now = time.monotonic()
+    for mode, version in event.get("surveys", {}).items():
+        _current[mode] = (version, now)
+
+
+config_watcher.on_change(_on_config_change)
+
+
+async def get_plan(mode: str, version: Optional[str] = None) -> Optional[SurveyPlan]:
+    """
+    План анкеты для режима.
+    version=None — актуальная версия (из памяти; смена версии приходит событием config_changed);
+    version из FSM — закрепленная версия: обычно это просто поиск в словаре, без Redis.
+    None, если анкета не настроена или закрепленная версия уже недоступна.
+    """
+    if version is None:
+        version = await _current_version(mode)
+
+    if version is not None:
+        plan = _plans.get((mode, version))
+        if plan is not None:
+            SURVEY_PLAN_CACHE.labels(result="hit").inc()
+            return plan
+        questions = await redis_service.get_survey_config_by_version(mode, version)
+    else:
+        questions = None
+
+    if questions is None:
+        # Данные записаны до появления версий: версию считаем по актуальной анкете
+        current = await redis_service.get_survey_config(mode)
+        if current is None:
+            # Redis пуст (сброшен и еще не восстановлен) — анкета из снимка, загруженного при старте
+            current = snapshot_survey(mode)
+        if current is None or (version is not None and survey_config_version(current) != version):
+            SURVEY_PLAN_CACHE.labels(result="missing").inc()
+            return None
+        questions, version = current, survey_config_version(current)
+
+    SURVEY_PLAN_CACHE.labels(result="compiled").inc()
+    return _remember(compile_plan(mode, version, questions))
@@ -0,0 +1,331 @@
+import math
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from scipy import sparse
+
+# --- OBSERVABILITY ---
+from src.utils.logger import logger
+
+log = logger.bind(service="text_similarity")
+
+# --- ТОКЕНИЗАЦИЯ ---
+
+_WORD_RE = re.compile(r"[а-яёa-z]+")
+
+_STOPWORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было
+вот от меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до вас нибудь
+опять уж вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя их чем была сам
+чтоб без будто чего раз тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь
+этом один почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при наконец два об другой
+хоть после над больше тот через эти нас про всего них какая много разве три эту моя впрочем хорошо свою
+этой перед иногда лучше чуть том нельзя такой им более всегда конечно всю между люблю очень просто ищу
+""".split())
+
+_VOWELS = "аеиоуыэюя"
+
+def _by_len(*endings):
+    return tuple(sorted(endings, key=len, reverse=True))
+
+_PERFECTIVE_GERUND_1 = _by_len("в", "вши", "вшись")
+_PERFECTIVE_GERUND_2 = _by_len("ив", "ивши", "ившись", "ыв", "ывши", "ывшись")
+_REFLEXIVE = _by_len("ся", "сь")
+_ADJECTIVE = _by_len(
+    "ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им", "ым", "ом",
+    "его", "ого", "ему", "ому", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею"
+)
+_PARTICIPLE_1 = _by_len("ем", "нн", "вш", "ющ", "щ")
+_PARTICIPLE_2 = _by_len("ивш", "ывш", "ующ")
+_VERB_1 = _by_len("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют", "ны", "ть", "ешь", "нно")
+_VERB_2 = _by_len(
+    "ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил", "ыл", "им", "ым", "ен",
+    "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю"
+)
+_NOUN = _by_len(
+    "а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и", "ией", "ей", "ой", "ий", "й",
+    "иям", "ям", "ием", "ем", "ам", "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия", "ья", "я"
+)
+_SUPERLATIVE = _by_len("ейш", "ейше")
+_DERIVATIONAL = _by_len("ост", "ость")
+
+
+def _strip(word: str, endings: tuple, after_a_ya: bool = False):
+    """Отрезает самое длинное подходящее окончание, иначе None."""
+    for ending in endings:
+        if word.endswith(ending):
+            stem = word[:-len(ending)]
+            if after_a_ya and not stem.endswith(("а", "я")):
+                continue
+            return stem
+    return None
+
+
+@lru_cache(maxsize=200_000)
+def stem_ru(word: str) -> str:
+    """
+    Упрощенный стеммер Snowball для русского языка.
+    Приводит 'бегаю', 'бегать', 'бегаем' к одной основе без словарей.
+    """
+    word = word.replace("ё", "е")
+    pos = next((i for i, ch in enumerate(word) if ch in _VOWELS), None)
+    if pos is None:
+        return word
+    head, rv = word[:pos + 1], word[pos + 1:]
+
+    # Шаг 1
+    stem = _strip(rv, _PERFECTIVE_GERUND_1, after_a_ya=True)
+    if stem is None:
+        stem = _strip(rv, _PERFECTIVE_GERUND_2)
+    if stem is None:
+        rv = _strip(rv, _REFLEXIVE) or rv
+        stem = _strip(rv, _ADJECTIVE)
+        if stem is not None:
+            stem = _strip(stem, _PARTICIPLE_1, after_a_ya=True) or _strip(stem, _PARTICIPLE_2) or stem
+        else:
+            stem = _strip(rv, _VERB_1, after_a_ya=True)
+            if stem is None:
+                stem = _strip(rv, _VERB_2)
+            if stem is None:
+                stem = _strip(rv, _NOUN)
+    rv = rv if stem is None else stem
+
+    # Шаг 2
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    # Шаг 3 (упрощенно: словообразовательный суффикс, если останется основа)
+    stem = _strip(rv, _DERIVATIONAL)
+    if stem is not None and len(stem) >= 3:
+        rv = stem
+
+    # Шаг 4
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    else:
+        stem = _strip(rv, _SUPERLATIVE)
+        if stem is not None:
+            rv = stem[:-1] if stem.endswith("нн") else stem
+        elif rv.endswith("ь"):
+            rv = rv[:-1]
+
+    return head + rv
+
+
+def tokenize(text: str) -> list[str]:
+    """Текст 'О себе' -> список основ без стоп-слов."""
+    words = _WORD_RE.findall(str(text or "").lower())
+    return [stem_ru(w) for w in words if len(w) > 2 and w not in _STOPWORDS]
+
+
+# --- ИНДЕКС TF-IDF ---
+
+class AboutSimilarityIndex:
+    """
+    Разреженная TF-IDF матрица по полю 'about' и поиск top-k соседей по косинусу.
+    - build(): полная пересборка (словарь, idf, матрица)
+    - update(): замена строк изменившихся анкет без пересчета словаря
+    - top_k(): кандидаты по урезанному инвертированному индексу, точный косинус для отобранных;
+      candidates ограничивает поиск пулом шарда (блочное произведение вместо всей матрицы)
+    """
+    def __init__(
+        self, min_df: int = 2, max_df_ratio: float = 0.5, query_terms: int = 8,
+        max_postings: int = 100, rescore_factor: int = 2, chunk_size: int = 2000, workers: int | None = None,
+    ):
+        self.min_df = min_df
+        # Слова чаще чем в половине анкет не различают их, но раздувают произведение.
+        # Порог в долях процента на коротких текстах выкидывает весь словарь.
+        self.max_df_ratio = max_df_ratio
+        # Для запроса берем только самые весомые термины строки
+        self.query_terms = query_terms
+        # Кандидаты: не больше max_postings анкет на термин, точно пересчитываем k * rescore_factor лучших
+        self.max_postings = max_postings
+        self.rescore_factor = rescore_factor
+        self.chunk_size = chunk_size
+        self.workers = workers or min(4, os.cpu_count() or 1)
+
+        self._tokens: dict[int, Counter] = {}
+        self._vocab: dict[str, int] = {}
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._ids: list[int] = []
+        self._pos: dict[int, int] = {}
+        self._matrix = sparse.csr_matrix((0, 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._vocab)
+
+    def _vectorize(self, counters: list[Counter]) -> sparse.csr_matrix:
+        """Строки TF-IDF (l2-нормированные) для списка мешков слов."""
+        indptr, indices, data = [0], [], []
+        for counter in counters:
+            for term, tf in counter.items():
+                col = self._vocab.get(term)
+                if col is not None:
+                    indices.append(col)
+                    data.append((1.0 + math.log(tf)) * self._idf[col])
+            indptr.append(len(indices))
+
+        matrix = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(counters), len(self._vocab)),
+        )
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix, dtype=np.float32)
+
+    def build(self, texts: dict):
+        """Полная пересборка по {user_id: about}."""
+        self._tokens = {uid: Counter(tokenize(text)) for uid, text in texts.items()}
+
+        df = Counter()
+        for counter in self._tokens.values():
+            df.update(counter.keys())
+
+        n_docs = max(len(self._tokens), 1)
+        max_df = max(self.min_df, int(n_docs * self.max_df_ratio))
+        terms = sorted(t for t, n in df.items() if self.min_df <= n <= max_df)
+
+        self._vocab = {t: i for i, t in enumerate(terms)}
+        self._idf = np.asarray([math.log((1 + n_docs) / (1 + df[t])) + 1.0 for t in terms], dtype=np.float32)
+        self._ids = list(self._tokens)
+        self._pos = {uid: i for i, uid in enumerate(self._ids)}
+        self._matrix = self._vectorize([self._tokens[uid] for uid in self._ids])
+
+        log.info("similarity_vocabulary", documents=len(self._ids), terms=len(df), vocabulary=len(terms))
+        # Термины прошли min_df, но все отрезаны max_df — соседей не будет ни у кого, это ошибка настройки
+        if not terms and any(n >= self.min_df for n in df.values()):
+            raise ValueError(
+                f"Empty TF-IDF vocabulary: {len(df)} terms, max_df={max_df} of {n_docs} documents"
+            )
+
+    def update(self, texts: dict):
+        """
+        Инкрементальное обновление: анкеты из texts заменяются/добавляются.
+        Словарь и idf остаются от последней полной сборки.
+        """
+        if not texts:
+            return
+        for uid, text in texts.items():
+            self._tokens[uid] = Counter(tokenize(text))
+
+        changed = set(texts)
+        keep_ids = [uid for uid in self._ids if uid not in changed]
+        keep_rows = [self._pos[uid] for uid in keep_ids]
+        new_ids = list(texts)
+
+        self._matrix = sparse.vstack([
+            self._matrix[keep_rows],
+            self._vectorize([self._tokens[uid] for uid in new_ids]),
+        ], format="csr")
+        self._ids = keep_ids + new_ids
+        self._pos = {uid: i for i, uid in enumerate(self._ids)}
+
+    def remove(self, user_ids):
+        gone = set(user_ids) & set(self._pos)
+        if not gone:
+            return
+        keep_ids = [uid for uid in self._ids if uid not in gone]
+        self._matrix = self._matrix[[self._pos[uid] for uid in keep_ids]]
+        self._ids = keep_ids
+        self._pos = {uid: i for i, uid in enumerate(self._ids)}
+        for uid in gone:
+            self._tokens.pop(uid, None)
+
+    def _query_rows(self, rows: list) -> sparse.csr_matrix:
+        """Строки запроса, урезанные до query_terms самых весомых терминов."""
+        query = self._matrix[rows].tocsr()
+        for row in range(query.shape[0]):
+            lo, hi = query.indptr[row], query.indptr[row + 1]
+            if hi - lo > self.query_terms:
+                weights = query.data[lo:hi]
+                weak = np.argpartition(weights, hi - lo - self.query_terms)[:hi - lo - self.query_terms]
+                weights[weak] = 0.0
+        query.eliminate_zeros()
+        return query
+
+    def _postings(self, columns: sparse.csr_matrix) -> sparse.csr_matrix:
+        """
+        Инвертированный индекс термин -> анкеты пула (строки упорядочены по весу).
+        Длинные списки урезаются до max_postings самых весомых анкет: для отбора
+        кандидатов хватает "сильных" вхождений, точный косинус считаем потом.
+        """
+        by_term = columns.tocsc()
+        lengths = np.diff(by_term.indptr)
+        for term in np.flatnonzero(lengths > self.max_postings):
+            lo, hi = by_term.indptr[term], by_term.indptr[term + 1]
+            weights = by_term.data[lo:hi]
+            weak = np.argpartition(weights, hi - lo - self.max_postings)[:hi - lo - self.max_postings]
+            weights[weak] = 0.0
+        by_term.eliminate_zeros()
+        return by_term.T.tocsr()
+
+    def _top_k_chunk(self, chunk: list, ids: np.ndarray, columns, postings, k: int, min_score: float) -> dict:
+        """top-k для одного блока пользователей."""
+        shortlist = k * self.rescore_factor
+        rows = np.asarray([self._pos[uid] for uid in chunk])
+        approx = (self._query_rows(rows) @ postings).tocsr()
+
+        # Отбор: по приближенной оценке не больше shortlist кандидатов на строку (себя исключаем)
+        entry_rows = np.repeat(np.arange(len(chunk)), np.diff(approx.indptr))
+        keep = ids[approx.indices] != np.asarray(chunk, dtype=np.int64)[entry_rows]
+        for row in np.flatnonzero(np.diff(approx.indptr) > shortlist):
+            lo, hi = approx.indptr[row], approx.indptr[row + 1]
+            weak = np.argpartition(approx.data[lo:hi], hi - lo - shortlist)[:hi - lo - shortlist]
+            keep[lo + weak] = False
+        pair_rows, pair_cols = entry_rows[keep], approx.indices[keep]
+
+        # Точный косинус по полным строкам, затем top-k внутри строки
+        exact = np.asarray(self._matrix[rows[pair_rows]].multiply(columns[pair_cols]).sum(axis=1)).ravel()
+        order = np.lexsort((-exact, pair_rows))
+        pair_rows, pair_cols, exact = pair_rows[order], pair_cols[order], exact[order]
+        rank = np.arange(len(pair_rows)) - np.searchsorted(pair_rows, pair_rows)
+        best = (rank < k) & (exact >= min_score)
+        pair_rows = pair_rows[best]
+        neighbours, scores = ids[pair_cols[best]].tolist(), np.round(exact[best], 4).tolist()
+
+        bounds = np.searchsorted(pair_rows, np.arange(len(chunk) + 1)).tolist()
+        return {
+            uid: dict(zip(neighbours[bounds[row]:bounds[row + 1]], scores[bounds[row]:bounds[row + 1]]))
+            for row, uid in enumerate(chunk)
+        }
+
+    def top_k(self, user_ids=None, k: int = 50, min_score: float = 0.05, candidates=None) -> dict:
+        """
+        {user_id: {neighbour_id: cosine}} для указанных (или всех) пользователей.
+        candidates — искать соседей только среди этих user_id (пул шарда).
+        Кандидаты — по инвертированному индексу терминов запроса, итоговый косинус — точный.
+        """
+        targets = [uid for uid in (user_ids if user_ids is not None else self._ids) if uid in self._pos]
+        result = {}
+        if not targets or not self._vocab:
+            return result
+
+        if candidates is None:
+            ids = np.asarray(self._ids, dtype=np.int64)
+            columns = self._matrix
+        else:
+            ids = np.asarray([uid for uid in candidates if uid in self._pos], dtype=np.int64)
+            if not len(ids):
+                return result
+            columns = self._matrix[[self._pos[uid] for uid in ids.tolist()]]
+        postings = self._postings(columns)
+
+        chunks = [targets[start:start + self.chunk_size] for start in range(0, len(targets), self.chunk_size)]
+        # Разреженные операции scipy отпускают GIL: блоки считаются параллельно на нескольких ядрах
+        workers = min(self.workers, len(chunks))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(lambda chunk: self._top_k_chunk(chunk, ids, columns, postings, k, min_score), chunks))
+        else:
+            parts = [self._top_k_chunk(chunk, ids, columns, postings, k, min_score) for chunk in chunks]
+        for part in parts:
+            result.update(part)
+        return result
@@ -0,0 +1,231 @@
+import asyncio
+import datetime
+import json
+import time
+import uuid
+from typing import Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from src.config import settings
+from src.database.session import async_session_maker
+from src.database.models import DailyTracking, TrackingStats
+from src.services.redis import redis_service
+from src.services.tracking_stats import apply_checkin, streak_on
+
+# --- OBSERVABILITY ---
+from src.utils.logger import logger
+from src.utils.alerting import send_alert
+from src.utils.metrics import SYSTEM_ERRORS
+
+# --- МЕТРИКИ ---
+TRACKING_FLUSHED_ROWS = Counter('rex_tracking_flushed_rows_total', 'Tracking rows written to Postgres by the buffer')
+TRACKING_FLUSH_DURATION = Histogram('rex_tracking_flush_seconds', 'Tracking buffer flush duration')
+TRACKING_PENDING = Gauge('rex_tracking_pending_rows', 'Tracking rows waiting in the write-behind buffer')
+
+FLUSH_LOCK = "tracking_flush"
+FLUSH_LOCK_TTL_MS = 30_000
+
+
+def _snapshot_to_stats(user_id: int, mode: str, snapshot: dict) -> TrackingStats:
+    return TrackingStats(
+        user_id=user_id, mode=mode,
+        current_streak=snapshot["streak"],
+        last_date=datetime.date.fromisoformat(snapshot["last_date"]) if snapshot.get("last_date") else None,
+        recent=snapshot.get("recent", ""),
+    )
+
+
+class TrackingBuffer:
+    """
+    Write-behind для отметок трекинга.
+    - submit(): дубль проверяется по Redis set, строка встает в Redis очередь, ответ юзеру сразу
+    - фоновый цикл сбрасывает очередь в Postgres multi-row INSERT-ом каждые N мс или N строк
+    - очередь живет в Redis, строки удаляются из нее только после commit, stop() делает финальный сброс
+    """
+    def __init__(self, interval_ms: int = None, max_rows: int = None):
+        self.interval = (interval_ms or settings.TRACKING_FLUSH_INTERVAL_MS) / 1000
+        self.max_rows = max_rows or settings.TRACKING_FLUSH_MAX_ROWS
+        self.log = logger.bind(service="tracking_buffer")
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._submitted = 0
+
+    # --- ЗАПИСЬ ---
+
+    async def submit(self, user_id: int, mode: str, date: datetime.date, status: str) -> Optional[int]:
+        """Возвращает серию после отметки или None, если юзер уже отмечался сегодня."""
+        if not await redis_service.enqueue_tracking(user_id, mode, date.isoformat(), status):
+            return None
+
+        self._submitted += 1
+        if self._submitted >= self.max_rows:
+            self._wake.set()
+
+        # Серию считаем по снимку в Redis (холодный старт — одна выборка по PK)
+        snapshot = await redis_service.get_tracking_snapshot(user_id, mode)
+        if snapshot:
+            stats = _snapshot_to_stats(user_id, mode, snapshot)
+        else:
+            async with async_session_maker() as session:
+                stored = await session.get(TrackingStats, (user_id, mode))
+            stats = TrackingStats(
+                user_id=user_id, mode=mode,
+                current_streak=stored.current_streak if stored else 0,
+                last_date=stored.last_date if stored else None,
+                recent=stored.recent if stored else "",
+            )
+
+        apply_checkin(stats, date, status)
+        await redis_service.set_tracking_snapshot(user_id, mode, {
+            "streak": stats.current_streak,
+            "last_date": stats.last_date.isoformat(),
+            "recent": stats.recent,
+        })
+        return streak_on(stats, date)
+
+    async def write_direct(self, user_id: int, mode: str, date: datetime.date, status: str) -> Optional[int]:
+        """Запасной путь, если Redis недоступен: сразу в БД, как раньше."""
+        async with async_session_maker() as session:
+            inserted = await self._insert_rows(session, [
+                {"user_id": user_id, "mode": mode, "date": date, "status": status}
+            ])
+            if not inserted:
+                return None
+            stats = (await self._apply_stats(session, inserted))[(user_id, mode)]
+            await session.commit()
+        return streak_on(stats, date)
+
+    # --- СБРОС В БД ---
+
+    @staticmethod
+    async def _insert_rows(session, rows: list) -> list:
+        """Multi-row INSERT ... ON CONFLICT DO NOTHING; возвращает реально вставленные строки."""
+        stmt = (
+            pg_insert(DailyTracking)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["user_id", "mode", "date"])
+            .returning(DailyTracking.user_id, DailyTracking.mode, DailyTracking.date, DailyTracking.status)
+        )
+        return (await session.execute(stmt)).all()
+
+    @staticmethod
+    async def _apply_stats(session, inserted: list) -> dict:
+        """Обновляет сводки tracking_stats для вставленных строк одной выборкой FOR UPDATE."""
+        keys = {(row.user_id, row.mode) for row in inserted}
+        stmt = select(TrackingStats).where(
+            tuple_(TrackingStats.user_id, TrackingStats.mode).in_(list(keys))
+        ).with_for_update()
+        stats = {(s.user_id, s.mode): s for s in (await session.execute(stmt)).scalars()}
+
+        for row in sorted(inserted, key=lambda r: r.date):
+            key = (row.user_id, row.mode)
+            if key not in stats:
+                stats[key] = TrackingStats(user_id=row.user_id, mode=row.mode, current_streak=0, recent="")
+                session.add(stats[key])
+            apply_checkin(stats[key], row.date, row.status)
+        return stats
+
+    async def flush(self) -> Optional[int]:
+        """
+        Переносит очередь из Redis в Postgres пачками по max_rows.
+        None — сейчас сбрасывает другая реплика.
+        Одновременно сбрасывает только одна реплика (блокировка продлевается после каждой пачки);
+        вставка идемпотентна, поэтому повтор пачки после сбоя между commit и LTRIM ничего не задвоит.
+        Голову очереди срезаем атомарно и только если блокировка наша и голова та же, что прочитали:
+        иначе перехватившая реплика потеряла бы строки, которые никто не вставил.
+        """
+        token = uuid.uuid4().hex
+        if not await redis_service.acquire_lock(FLUSH_LOCK, token, FLUSH_LOCK_TTL_MS):
+            return None
+
+        total = 0
+        try:
+            while True:
+                raw = await redis_service.peek_tracking_pending(self.max_rows)
+                if not raw:
+                    break
+
+                started = time.perf_counter()
+                rows = [json.loads(x) for x in raw]
+                for row in rows:
+                    row["date"] = datetime.date.fromisoformat(row["date"])
+
+                async with async_session_maker() as session:
+                    inserted = await self._insert_rows(session, rows)
+                    if inserted:
+                        await self._apply_stats(session, inserted)
+                    await session.commit()
+
+                if not await redis_service.trim_tracking_pending(FLUSH_LOCK, token, raw):
+                    # Пачка в БД (вставка идемпотентна), остаток досбросит владелец блокировки
+                    self.log.warning("tracking_flush_lock_lost", rows=len(rows))
+                    break
+                total += len(rows)
+                TRACKING_FLUSHED_ROWS.inc(len(inserted))
+                TRACKING_FLUSH_DURATION.observe(time.perf_counter() - started)
+
+                if len(rows) < self.max_rows:
+                    break
+                # Долгий разбор очереди (например, после простоя БД) не должен пережить блокировку
+                if not await redis_service.extend_lock(FLUSH_LOCK, token, FLUSH_LOCK_TTL_MS):
+                    self.log.warning("tracking_flush_lock_lost", rows=0)
+                    break
+
+            TRACKING_PENDING.set(await redis_service.get_tracking_pending_length())
+        finally:
+            await redis_service.release_lock(FLUSH_LOCK, token)
+
+        if total:
+            self.log.info("tracking_buffer_flushed", rows=total)
+        return total
+
+    # --- ЖИЗНЕННЫЙ ЦИКЛ ---
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            self._submitted = 0
+
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Строки остаются в Redis очереди, повторим на следующем тике
+                self.log.error("tracking_buffer_flush_failed", error=str(e))
+                SYSTEM_ERRORS.labels(service="tracking_buffer", error_type=type(e).__name__).inc()
+                await send_alert(e, context="Tracking Buffer Flush")
+                await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self.log.info("tracking_buffer_started", interval=self.interval, max_rows=self.max_rows)
+
+    async def stop(self):
+        """Останавливает цикл и делает финальный сброс (вызывать при остановке бота)."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # Если сейчас сбрасывает другая реплика — дождемся блокировки и досбросим остаток
+        for _ in range(FLUSH_LOCK_TTL_MS // 1000):
+            if await self.flush() is not None:
+                break
+            await asyncio.sleep(1)
+        self.log.info("tracking_buffer_stopped")
+
+
+# --- ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР ---
+tracking_buffer = TrackingBuffer()
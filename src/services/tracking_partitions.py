@@ -0,0 +1,147 @@
+import datetime
+import re
+
+from sqlalchemy import text
+
+from src.config import settings
+from src.database.session import async_session_maker
+
+# --- OBSERVABILITY ---
+from src.utils.logger import logger
+
+PARENT_TABLE = "daily_tracking"
+# Страховка: строки без своей партиции не падают на INSERT, а ждут ежедневного обслуживания
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+COLUMNS = "id, user_id, mode, date, status, created_at"
+_PARTITION_RE = re.compile(rf"^{PARENT_TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def add_months(month: datetime.date, count: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"{PARENT_TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str):
+    """'daily_tracking_y2026m10' -> date(2026, 10, 1); чужие имена -> None."""
+    match = _PARTITION_RE.match(name)
+    return datetime.date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def create_partition_sql(month: datetime.date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+async def _stray_months(session) -> list[datetime.date]:
+    """Месяцы, чьи строки попали в DEFAULT-партицию (своей партиции на момент записи не было)."""
+    result = await session.execute(text(
+        f"SELECT DISTINCT date_trunc('month', date)::date FROM {DEFAULT_PARTITION}"
+    ))
+    return sorted(row[0] for row in result)
+
+
+async def _move_out_of_default(session, month: datetime.date):
+    """
+    Партиция месяца не создается, пока его строки лежат в DEFAULT:
+    отцепляем DEFAULT, создаем партицию, переносим строки, цепляем обратно — в одной транзакции.
+    """
+    bounds = {"start": month, "end": add_months(month, 1)}
+    await session.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    await session.execute(text(create_partition_sql(month)))
+    moved = await session.execute(text(f"""
+        INSERT INTO {PARENT_TABLE} ({COLUMNS})
+        SELECT {COLUMNS} FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end
+    """), bounds)
+    await session.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end"), bounds)
+    await session.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    return moved.rowcount
+
+
+async def ensure_partitions(months_ahead: int = None):
+    """
+    Создает партиции на текущий и следующие месяцы (индексы наследуются от родителя).
+    Строки, попавшие в DEFAULT, переносит в партиции своих месяцев.
+    """
+    months_ahead = settings.TRACKING_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(datetime.date.today())
+    log = logger.bind(service="tracking_partitions")
+
+    async with async_session_maker() as session:
+        for month in await _stray_months(session):
+            moved = await _move_out_of_default(session, month)
+            # Задача обслуживания не успела создать партицию заранее — стоит разобраться почему
+            log.error("tracking_default_partition_drained", month=month.isoformat(), rows=moved)
+        for offset in range(months_ahead + 1):
+            await session.execute(text(create_partition_sql(add_months(current, offset))))
+        await session.commit()
+
+
+async def _list_partitions(session) -> list[str]:
+    result = await session.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :parent
+    """), {"parent": PARENT_TABLE})
+    return [row[0] for row in result]
+
+
+async def archive_old_partitions(retention_months: int = None) -> list[str]:
+    """
+    Партиции старше срока хранения: сворачиваем в tracking_monthly, затем DETACH и DROP.
+    Каждая партиция — отдельная транзакция: итоги и удаление либо вместе, либо никак.
+    """
+    retention_months = settings.TRACKING_RETENTION_MONTHS if retention_months is None else retention_months
+    cutoff = add_months(month_start(datetime.date.today()), -retention_months)
+    log = logger.bind(service="tracking_partitions", cutoff=cutoff.isoformat())
+
+    async with async_session_maker() as session:
+        names = await _list_partitions(session)
+
+    archived = []
+    for name in sorted(names):
+        month = partition_month(name)
+        if month is None or month >= cutoff:
+            continue
+
+        # Итоги за месяц уже могли быть свернуты (строки из DEFAULT-партиции и т.п.) — суммируем.
+        # Вставка, DETACH и DROP в одной транзакции, поэтому повторный запуск не посчитает дважды
+        async with async_session_maker() as session:
+            rolled = await session.execute(text(f"""
+                INSERT INTO tracking_monthly (user_id, mode, month, success, partial, fail)
+                SELECT user_id, mode, :month,
+                       count(*) FILTER (WHERE status = 'success'),
+                       count(*) FILTER (WHERE status = 'partial'),
+                       count(*) FILTER (WHERE status = 'fail')
+                FROM {name}
+                GROUP BY user_id, mode
+                ON CONFLICT (user_id, mode, month) DO UPDATE
+                SET success = tracking_monthly.success + EXCLUDED.success,
+                    partial = tracking_monthly.partial + EXCLUDED.partial,
+                    fail = tracking_monthly.fail + EXCLUDED.fail
+            """), {"month": month})
+            await session.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            await session.execute(text(f"DROP TABLE {name}"))
+            await session.commit()
+
+        archived.append(name)
+        log.info("tracking_partition_archived", partition=name, summary_rows=rolled.rowcount)
+
+    return archived
+
+
+async def maintain_tracking_partitions():
+    """Ежедневное обслуживание: партиции наперед + свертка и удаление старых."""
+    await ensure_partitions()
+    await archive_old_partitions()
@@ -0,0 +1,59 @@
+import datetime
+from typing import Optional
+
+from src.database.models import TrackingStats
+
+WEEK_DAYS = 7
+STATUS_CODES = {'success': 's', 'partial': 'p', 'fail': 'f'}
+NO_MARK = '-'
+
+
+# --- ЧИСТАЯ ЛОГИКА (без БД) ---
+
+def apply_checkin(stats: TrackingStats, date: datetime.date, status: str):
+    """
+    Сдвигает сводку на новую отметку за O(1).
+    Серия: подряд идущие дни со статусом success/partial; fail или пропуск дня ее сбрасывает.
+    """
+    code = STATUS_CODES.get(status, 'f')
+    last_date = stats.last_date
+    recent = stats.recent or ""
+
+    if last_date is not None and date <= last_date:
+        # Отметки за прошлые дни (бэкфилл не по порядку) не трогают серию
+        return
+
+    gap = (date - last_date).days if last_date else WEEK_DAYS
+    recent = (code + NO_MARK * (gap - 1) + recent)[:WEEK_DAYS]
+
+    if code == 'f':
+        stats.current_streak = 0
+    elif gap == 1 and stats.current_streak:
+        stats.current_streak += 1
+    else:
+        stats.current_streak = 1
+
+    stats.last_date = date
+    stats.recent = recent
+    stats.week_success = recent.count('s')
+    stats.week_partial = recent.count('p')
+    stats.week_fail = recent.count('f')
+
+
+def streak_on(stats: Optional[TrackingStats], today: datetime.date) -> int:
+    """Актуальная серия на дату: если вчера отметки не было, серия уже прервана."""
+    if not stats or not stats.last_date:
+        return 0
+    return stats.current_streak if (today - stats.last_date).days <= 1 else 0
+
+
+def week_counts(stats: Optional[TrackingStats], today: datetime.date) -> dict:
+    """Счетчики за скользящие 7 дней, заканчивающиеся today."""
+    counts = {'success': 0, 'partial': 0, 'fail': 0}
+    if not stats or not stats.last_date:
+        return counts
+    shift = (today - stats.last_date).days
+    window = (stats.recent or "")[:max(WEEK_DAYS - shift, 0)]
+    for status, code in STATUS_CODES.items():
+        counts[status] = window.count(code)
+    return counts
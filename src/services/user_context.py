@@ -0,0 +1,87 @@
+import datetime
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.database.models import User
+from src.utils.checkin import DEFAULT_SLOT
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    """Узкий срез users, нужный хендлерам: без ORM-объекта и ленивых связей."""
+    user_id: int
+    natal_chart_credits: int
+    is_diet_tracking: bool
+    is_trainer_tracking: bool
+    has_accepted_policy: bool
+    subscription_expires_at: Optional[datetime.datetime]
+    checkin_slot: int
+
+    def is_tracking(self, mode: str) -> bool:
+        if mode == 'diet':
+            return self.is_diet_tracking
+        if mode == 'trainer':
+            return self.is_trainer_tracking
+        return False
+
+
+_SNAPSHOT_COLUMNS = (
+    User.user_id,
+    User.natal_chart_credits,
+    User.is_diet_tracking,
+    User.is_trainer_tracking,
+    User.has_accepted_policy,
+    User.subscription_expires_at,
+    User.checkin_slot,
+)
+
+
+class UserContext:
+    """
+    Контекст пользователя на время одного апдейта.
+    Снимок грузится лениво и не больше одного раза: хендлер, которому юзер не нужен,
+    не делает ни одного запроса, остальные — ровно один.
+    """
+    def __init__(self, session: AsyncSession, user_id: int):
+        self.session = session
+        self.user_id = user_id
+        self.is_admin = user_id in settings.admin_ids
+        self._snapshot: Optional[UserSnapshot] = None
+        self._loaded = False
+
+    async def get(self) -> Optional[UserSnapshot]:
+        if not self._loaded:
+            row = (await self.session.execute(
+                select(*_SNAPSHOT_COLUMNS).where(User.user_id == self.user_id)
+            )).first()
+            self._snapshot = UserSnapshot(
+                user_id=row.user_id,
+                natal_chart_credits=row.natal_chart_credits or 0,
+                is_diet_tracking=bool(row.is_diet_tracking),
+                is_trainer_tracking=bool(row.is_trainer_tracking),
+                has_accepted_policy=bool(row.has_accepted_policy),
+                subscription_expires_at=row.subscription_expires_at,
+                checkin_slot=row.checkin_slot or DEFAULT_SLOT,
+            ) if row else None
+            self._loaded = True
+        return self._snapshot
+
+    def patch(self, **fields):
+        """Хендлер записал изменения в БД — держим снимок в актуальном виде до конца апдейта."""
+        if self._snapshot is not None:
+            self._snapshot = replace(self._snapshot, **fields)
+
+    async def subscription_expiry(self) -> Optional[datetime.datetime]:
+        snapshot = await self.get()
+        return snapshot.subscription_expires_at if snapshot else None
+
+    async def menu_credits(self) -> int:
+        """Баланс натальных карт для главного меню (админам БД не нужна)."""
+        if self.is_admin:
+            return 999
+        snapshot = await self.get()
+        return snapshot.natal_chart_credits if snapshot else 0
@@ -0,0 +1,47 @@
+import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+from src.config import settings
+
+MINUTES_PER_DAY = 24 * 60
+# Слоты, которые юзер может выбрать в меню трекинга
+CHECKIN_SLOTS = ["08:00", "19:00", "20:00", "21:00", "22:00"]
+
+
+def parse_slot(value: str) -> int:
+    """'20:00' -> минуты от полуночи."""
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def format_slot(slot: int) -> str:
+    return f"{slot // 60:02d}:{slot % 60:02d}"
+
+
+DEFAULT_SLOT = parse_slot(settings.CHECKIN_DEFAULT_SLOT)
+
+
+def staggered_minute(user_id: int, slot: int = DEFAULT_SLOT) -> int:
+    """
+    Минута (местного времени) отправки отчета юзеру.
+    Юзеры слота равномерно размазаны по окну CHECKIN_WINDOW_MINUTES, сдвиг стабилен для user_id.
+    """
+    return (slot + user_id % max(settings.CHECKIN_WINDOW_MINUTES, 1)) % MINUTES_PER_DAY
+
+
+@lru_cache(maxsize=None)
+def _zone(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
+
+def due_buckets(now: datetime.datetime, timezones) -> list[tuple[str, int]]:
+    """
+    Для каждого часового пояса — местная минута, которая наступила в момент now.
+    [(timezone, minute_of_day), ...] — ровно те корзины, которым пора отправлять.
+    """
+    buckets = []
+    for tz in timezones:
+        local = now.astimezone(_zone(tz))
+        buckets.append((tz, local.hour * 60 + local.minute))
+    return buckets
@@ -14,8 +14,8 @@ from src.services.llm import generate_response
 from src.database.session import async_session_maker
 from src.database.models import UserSurvey
 from sqlalchemy import update
-from src.services.redis import redis_service 
 from src.services.rabbit import send_to_queue
+from src.services.config_sync import config_watcher, get_prompt, warm_start
 
 # --- НОВЫЕ ИМПОРТЫ (OBSERVABILITY) ---
 from src.utils.logger import logger
@@ -45,8 +45,8 @@ async def process_task(message: aio_pika.IncomingMessage):
         log.info("task_started")
 
         try:
-            # 2. Получаем шаблон промпта
-            prompt_template = await redis_service.get_prompt(mode)
+            # 2. Получаем шаблон промпта (кэш процесса, сбрасывается событием config_changed)
+            prompt_template = await get_prompt(mode)
             if not prompt_template:
                 log.error("prompt_missing_in_redis")
                 # Тут можно отправить юзеру "Извините, сервис недоступен", но пока просто выходим
@@ -134,13 +134,16 @@ async def main():
     queue = await channel.declare_queue("q_ai_generation", durable=True)
     await channel.set_qos(prefetch_count=5)
 
+    # Промпты из последнего снимка в БД (до первой синхронизации с Google),
+    # дальше правки в таблице приходят событием и сбрасывают кэш
+    await warm_start()
+    config_watcher.start()
+
     async with queue.iterator() as queue_iter:
         async for message in queue_iter:
             asyncio.create_task(process_task(message))
 
 if __name__ == "__main__":
-    from src.services.redis import redis_service
-    
     # Запуск сервера метрик на порту 8000
     start_metrics_server(8000)
     
@@ -3,7 +3,7 @@ import sys
 import datetime
 from os.path import abspath, dirname
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy import select, func, and_, or_, tuple_
 
 # --- НАСТРОЙКА ПУТЕЙ ---
 sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
@@ -13,11 +13,15 @@ from src.config import settings
 from src.services.llm import generate_response
 from src.services.horoscope import RUS_SIGNS
 from src.database.models import User, DailyTracking
-from src.database.session import async_session_maker
-from src.services.rabbit import send_to_queue
+from src.services.broadcast import MessageTemplate, fan_out, publish_stream, stream_rows
 from src.scripts.update_surveys import update_surveys
-from src.services.matching import run_daily_matching
+from src.services.matching import run_daily_matching, refresh_dirty_feeds
 from src.services.redis import redis_service
+from src.services.geo import get_gazetteer
+from src.services.tracking_partitions import maintain_tracking_partitions
+from src.services.admin_stats import refresh_active_subscriptions
+from src.services.config_sync import get_prompt, warm_start
+from src.utils.checkin import due_buckets
 from src.utils.text import clean_html_for_telegram # <--- Убедись, что этот файл создан (см. прошлые ответы)
 
 # --- OBSERVABILITY ---
@@ -47,7 +51,7 @@ async def tick():
 async def generate_daily_horoscopes():
     """Генерирует гороскопы с умными ретраями для обхода Rate Limits (429)."""
     logger.info("horoscope_generation_started")
-    base_prompt = await redis_service.get_prompt("horoscope") or "Ты астролог. Составь краткий гороскоп для {sign}."
+    base_prompt = await get_prompt("horoscope") or "Ты астролог. Составь краткий гороскоп для {sign}."
     current_date_str = datetime.date.today().strftime("%d.%m.%Y")
     
     for sign_en, sign_ru in RUS_SIGNS.items():
@@ -93,119 +97,137 @@ async def generate_daily_horoscopes():
                     break
 
 
-async def send_diet_checkin():
-    logger.info("diet_checkin_started")
-    async with async_session_maker() as session:
-        stmt = select(User).where(
-            and_(User.subscription_expires_at > func.now(), User.is_diet_tracking == True)
-        )
-        users = (await session.execute(stmt)).scalars().all()
-        
-        keyboard = {
-            "inline_keyboard": [
-                [{"text": "✅ Всё по плану", "callback_data": "track_diet_success"}],
-                [{"text": "⚠️ Частично", "callback_data": "track_diet_partial"}],
-                [{"text": "❌ Срыв", "callback_data": "track_diet_fail"}]
-            ]
-        }
-
-        count = 0
-        for user in users:
-            msg = {"user_id": user.user_id, "text": "🥦 <b>Вечерний отчет:</b>\nКак прошел день по питанию?", "keyboard": keyboard}
-            await send_to_queue("q_notifications", msg)
-            count += 1
-        logger.info("diet_checkin_completed", sent_count=count)
-
-async def send_trainer_checkin():
-    logger.info("trainer_checkin_started")
-    async with async_session_maker() as session:
-        stmt = select(User).where(
-            and_(User.subscription_expires_at > func.now(), User.is_trainer_tracking == True)
+# --- ВЕЧЕРНИЕ ЧЕК-ИНЫ (общий шаблон на всю аудиторию) ---
+DIET_CHECKIN = MessageTemplate(
+    "🥦 <b>Вечерний отчет:</b>\nКак прошел день по питанию?",
+    {
+        "inline_keyboard": [
+            [{"text": "✅ Всё по плану", "callback_data": "track_diet_success"}],
+            [{"text": "⚠️ Частично", "callback_data": "track_diet_partial"}],
+            [{"text": "❌ Срыв", "callback_data": "track_diet_fail"}]
+        ]
+    },
+)
+
+TRAINER_CHECKIN = MessageTemplate(
+    "💪 <b>Вечерний отчет:</b>\nБыла ли тренировка?",
+    {
+        "inline_keyboard": [[
+            {"text": "✅ Тренировка была!", "callback_data": "track_trainer_success"},
+            {"text": "⚠️ Не полностью", "callback_data": "track_trainer_partial"},
+            {"text": "❌ Пропустил(а)", "callback_data": "track_trainer_fail"}
+        ]]
+    },
+)
+
+CHECKINS = (
+    ("diet_checkin", User.is_diet_tracking, DIET_CHECKIN),
+    ("trainer_checkin", User.is_trainer_tracking, TRAINER_CHECKIN),
+)
+
+CHECKIN_CATCHUP_MINUTES = 60  # После простоя дольше — пропущенные отчеты уже не досылаем
+
+def _buckets_between(first: int, last: int, timezones) -> list[tuple[int, str]]:
+    """Корзины (checkin_minute, timezone) всех минут [first, last] (минуты эпохи)."""
+    buckets = set()
+    for minute in range(first, last + 1):
+        moment = datetime.datetime.fromtimestamp(minute * 60, datetime.timezone.utc)
+        buckets.update((local_minute, tz) for tz, local_minute in due_buckets(moment, timezones))
+    return sorted(buckets)
+
+async def send_due_checkins():
+    """
+    Раз в минуту: отчеты тем, у кого по местному времени наступила их минута.
+    Каждая корзина — (checkin_minute, timezone) по индексу, поэтому нагрузка ровная весь вечер.
+    Последняя обработанная минута лежит в Redis: запуск после задержки (misfire, рестарт)
+    досылает все пропущенные минуты, а не только текущую.
+    """
+    timezones = get_gazetteer().timezones() | {settings.DEFAULT_TIMEZONE}
+    now_minute = int(datetime.datetime.now(datetime.timezone.utc).timestamp() // 60)
+
+    for name, flag, template in CHECKINS:
+        last = await redis_service.get_checkin_cursor(name)
+        first = now_minute if last is None else max(last + 1, now_minute - CHECKIN_CATCHUP_MINUTES + 1)
+        if first > now_minute:
+            continue
+        if first < now_minute:
+            logger.warning("checkin_catch_up", checkin=name, minutes=now_minute - first + 1)
+
+        in_bucket = tuple_(User.checkin_minute, User.timezone).in_(_buckets_between(first, now_minute, timezones))
+        audience = select(User.user_id).where(
+            and_(in_bucket, User.subscription_expires_at > func.now(), flag == True)
         )
-        users = (await session.execute(stmt)).scalars().all()
-        
-        keyboard = {
-            "inline_keyboard": [[
-                {"text": "✅ Тренировка была!", "callback_data": "track_trainer_success"},
-                {"text": "⚠️ Не полностью", "callback_data": "track_trainer_partial"},
-                {"text": "❌ Пропустил(а)", "callback_data": "track_trainer_fail"}
-            ]]
-        }
-
-        count = 0
-        for user in users:
-            msg = {"user_id": user.user_id, "text": "💪 <b>Вечерний отчет:</b>\nБыла ли тренировка?", "keyboard": keyboard}
-            await send_to_queue("q_notifications", msg)
-            count += 1
-        logger.info("trainer_checkin_completed", sent_count=count)
+        await fan_out(name, audience, template.render)
+        await redis_service.set_checkin_cursor(name, now_minute)
 
-async def run_weekly_report():
-    logger.info("weekly_report_started")
-    
-    async with async_session_maker() as session:
-        stmt = select(User).where(
+# --- ЕЖЕНЕДЕЛЬНЫЙ ОТЧЕТ ---
+REPORT_STREAM_CHUNK = 1000   # Строк агрегата за один fetch серверного курсора
+REPORT_PUBLISH_BATCH = 500   # Отчетов в одной пачке публикации
+
+def _format_report_block(title: str, counts: dict) -> str:
+    if not counts: return ""
+    return (
+        f"\n<b>{title}</b>\n"
+        f"✅ Успех: {counts.get('success', 0)}\n"
+        f"⚠️ Частично: {counts.get('partial', 0)}\n"
+        f"❌ Пропуски: {counts.get('fail', 0)}\n"
+    )
+
+def render_weekly_report(is_diet: bool, is_trainer: bool, stats: dict) -> str:
+    """stats: {mode: {status: count}} за последние 7 дней."""
+    report_text = f"📊 <b>Ваш отчет за неделю:</b>\n"
+    if is_diet:
+        report_text += _format_report_block("🥦 Питание", stats.get('diet'))
+    if is_trainer:
+        report_text += _format_report_block("💪 Спорт", stats.get('trainer'))
+
+    total_recs = sum(n for counts in stats.values() for n in counts.values())
+    total_good = sum(counts.get('success', 0) + counts.get('partial', 0) for counts in stats.values())
+
+    if total_recs > 0:
+        ratio = total_good / total_recs
+        if ratio >= 0.8: report_text += "\n🔥 <b>Потрясающий результат!</b>"
+        elif ratio >= 0.5: report_text += "\n👍 <b>Хороший темп.</b>"
+        else: report_text += "\n💪 <b>Не сдавайтесь!</b>"
+    return report_text
+
+async def _weekly_reports():
+    """
+    Один агрегирующий запрос (GROUP BY user, mode, status) вместо запроса на каждого юзера.
+    Строки идут серверным курсором по user_id, отчет юзера отдается, как только его строки закончились.
+    """
+    week_ago = datetime.date.today() - datetime.timedelta(days=7)
+
+    stmt = (
+        select(
+            User.user_id, User.is_diet_tracking, User.is_trainer_tracking,
+            DailyTracking.mode, DailyTracking.status, func.count().label("cnt"),
+        )
+        .join(DailyTracking, DailyTracking.user_id == User.user_id)
+        .where(
             and_(
                 User.subscription_expires_at > func.now(),
-                or_(User.is_diet_tracking == True, User.is_trainer_tracking == True)
+                or_(User.is_diet_tracking == True, User.is_trainer_tracking == True),
+                DailyTracking.date >= week_ago,
             )
         )
-        users = (await session.execute(stmt)).scalars().all()
-        
-        today = datetime.date.today()
-        week_ago = today - datetime.timedelta(days=7)
-        
-        count = 0
-        for user in users:
-            stats_stmt = select(DailyTracking).where(
-                and_(
-                    DailyTracking.user_id == user.user_id,
-                    DailyTracking.date >= week_ago
-                )
-            )
-            records = (await session.execute(stats_stmt)).scalars().all()
-            
-            if not records: continue
-
-            diet_recs = [r for r in records if r.mode == 'diet']
-            trainer_recs = [r for r in records if r.mode == 'trainer']
-            
-            def format_block(title, recs):
-                if not recs: return ""
-                s = sum(1 for r in recs if r.status == 'success')
-                p = sum(1 for r in recs if r.status == 'partial')
-                f = sum(1 for r in recs if r.status == 'fail')
-                return (
-                    f"\n<b>{title}</b>\n"
-                    f"✅ Успех: {s}\n"
-                    f"⚠️ Частично: {p}\n"
-                    f"❌ Пропуски: {f}\n"
-                )
+        .group_by(User.user_id, DailyTracking.mode, DailyTracking.status)
+        .order_by(User.user_id)
+    )
+
+    current_user, flags, stats = None, None, {}
+    async for row in stream_rows(stmt, chunk=REPORT_STREAM_CHUNK):
+        if row.user_id != current_user:
+            if current_user is not None:
+                yield {"user_id": current_user, "text": render_weekly_report(*flags, stats)}
+            current_user, flags, stats = row.user_id, (row.is_diet_tracking, row.is_trainer_tracking), {}
+        stats.setdefault(row.mode, {})[row.status] = row.cnt
 
-            report_text = f"📊 <b>Ваш отчет за неделю:</b>\n"
-            has_data = False
-            if user.is_diet_tracking:
-                report_text += format_block("🥦 Питание", diet_recs)
-                has_data = True
-            
-            if user.is_trainer_tracking:
-                report_text += format_block("💪 Спорт", trainer_recs)
-                has_data = True
-            
-            if not has_data: continue
-
-            total_good = sum(1 for r in records if r.status in ['success', 'partial'])
-            total_recs = len(records)
-            
-            if total_recs > 0:
-                ratio = total_good / total_recs
-                if ratio >= 0.8: report_text += "\n🔥 <b>Потрясающий результат!</b>"
-                elif ratio >= 0.5: report_text += "\n👍 <b>Хороший темп.</b>"
-                else: report_text += "\n💪 <b>Не сдавайтесь!</b>"
-
-            await send_to_queue("q_notifications", {"user_id": user.user_id, "text": report_text})
-            count += 1
-            
-        logger.info("weekly_report_completed", sent_count=count)
+    if current_user is not None:
+        yield {"user_id": current_user, "text": render_weekly_report(*flags, stats)}
+
+async def run_weekly_report():
+    await publish_stream("weekly_report", _weekly_reports(), batch_size=REPORT_PUBLISH_BATCH)
 
 async def main():
     logger.info("service_started", service="scheduler")
@@ -214,10 +236,18 @@ async def main():
     scheduler.add_job(safe_job_run, 'interval', minutes=10, args=[update_surveys, 'update_surveys'])
     scheduler.add_job(safe_job_run, 'cron', hour=8, minute=0, args=[generate_daily_horoscopes, 'horoscopes'])
     scheduler.add_job(safe_job_run, 'cron', hour=12, minute=0, args=[run_daily_matching, 'dating'])
-    scheduler.add_job(safe_job_run, 'cron', hour=20, minute=0, args=[send_diet_checkin, 'diet_checkin'])
-    scheduler.add_job(safe_job_run, 'cron', hour=20, minute=1, args=[send_trainer_checkin, 'trainer_checkin'])
+    scheduler.add_job(safe_job_run, 'interval', minutes=5, args=[refresh_dirty_feeds, 'dating_feed_refresh'])
+    # Один экземпляр: опоздавший запуск сам досылает пропущенные минуты (курсор в Redis)
+    scheduler.add_job(
+        safe_job_run, 'cron', minute='*', max_instances=1, coalesce=True, misfire_grace_time=300,
+        args=[send_due_checkins, 'checkins'],
+    )
     scheduler.add_job(safe_job_run, 'cron', day_of_week='sun', hour=21, minute=0, args=[run_weekly_report, 'weekly_report'])
+    scheduler.add_job(safe_job_run, 'cron', hour=3, minute=30, args=[maintain_tracking_partitions, 'tracking_partitions'])
+    scheduler.add_job(safe_job_run, 'interval', minutes=5, args=[refresh_active_subscriptions, 'admin_stats'])
 
+    # Сначала снимок из БД: недостающие в Redis анкеты/промпты восстанавливаются без Google
+    await warm_start()
     scheduler.start()
     
     try:
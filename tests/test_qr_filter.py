@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("redis")
+pytest.importorskip("sqlalchemy")
+
+from src.services.qr_filter import BloomFilter, QRCodeFilter
+
+
+def test_bloom_has_no_false_negatives():
+    bloom = BloomFilter(5000)
+    codes = [f"code-{i}" for i in range(5000)]
+    for code in codes:
+        bloom.add(code)
+    assert all(code in bloom for code in codes)
+
+
+def test_bloom_false_positive_rate_near_target():
+    bloom = BloomFilter(5000, error_rate=0.01)
+    for i in range(5000):
+        bloom.add(f"code-{i}")
+    false_hits = sum(f"other-{i}" in bloom for i in range(20000))
+    assert false_hits / 20000 < 0.03
+
+
+def test_unbuilt_filter_passes_everything_to_db():
+    assert asyncio.run(QRCodeFilter().may_exist("anything"))
+
+
+def test_current_filter_rejects_unknown_code():
+    qr = QRCodeFilter()
+    qr._bloom = BloomFilter(10)
+    qr._bloom.add("known")
+    qr._checked_at = time.monotonic()
+
+    assert asyncio.run(qr.may_exist("known"))
+    assert not asyncio.run(qr.may_exist("unknown"))
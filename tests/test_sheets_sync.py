@@ -0,0 +1,92 @@
+import asyncio
+import contextlib
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+
+from src.scripts.fake_sheets_api import FakeSheetsAPI, SHEET_ID
+from src.services import sheets
+from src.services.sheets import SheetsClient
+
+
+@contextlib.asynccontextmanager
+async def fake_api():
+    """Фейковый Sheets/Drive API на свободном порту + клиент к нему."""
+    api = FakeSheetsAPI()
+    runner = web.AppRunner(api.app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    client = SheetsClient(SHEET_ID, f"http://127.0.0.1:{runner.addresses[0][1]}")
+    try:
+        yield api, client
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+def test_unchanged_file_costs_one_drive_call():
+    async def scenario():
+        async with fake_api() as (api, client):
+            first = await client.fetch()
+            client.mark_synced(first.marker)
+
+            api.calls.clear()
+            assert await client.fetch() is None
+            assert api.calls == {"drive.files.get": 1}
+
+    asyncio.run(scenario())
+
+
+def test_change_costs_metadata_and_one_batch_get():
+    async def scenario():
+        async with fake_api() as (api, client):
+            first = await client.fetch()
+            client.mark_synced(first.marker)
+
+            api.calls.clear()
+            api.edit()
+            changed = await client.fetch()
+            assert changed is not None and changed.marker != first.marker
+            assert changed.prompts["diet"] != first.prompts["diet"]
+            assert api.calls == {"drive.files.get": 1, "spreadsheets.get": 1, "values.batchGet": 1}
+
+    asyncio.run(scenario())
+
+
+def test_marker_is_synced_only_after_successful_sync(monkeypatch):
+    from src.scripts import update_surveys as script
+    from src.services.config_sync import SyncResult
+
+    synced = []
+
+    async def failing_sync(*args, **kwargs):
+        raise RuntimeError("postgres is down")
+
+    async def successful_sync(surveys, prompts, force=False, marker=None):
+        synced.append(marker)
+        return SyncResult()
+
+    async def scenario():
+        async with fake_api() as (api, client):
+            monkeypatch.setattr(sheets, "sheets_client", client)
+            monkeypatch.setattr(script, "sheets_client", client)
+
+            # Запись упала — версия не отмечена, следующий прогон перечитывает таблицу
+            monkeypatch.setattr(script, "sync_configs", failing_sync)
+            with pytest.raises(RuntimeError):
+                await script.update_surveys()
+
+            api.calls.clear()
+            monkeypatch.setattr(script, "sync_configs", successful_sync)
+            await script.update_surveys()
+            assert api.calls["values.batchGet"] == 1
+            assert synced == [str(api.version)]
+
+            # Успешно записали — без правок остается один легкий запрос
+            api.calls.clear()
+            await script.update_surveys()
+            assert api.calls == {"drive.files.get": 1}
+            assert len(synced) == 1
+
+    asyncio.run(scenario())
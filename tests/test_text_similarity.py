@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip("scipy")
+
+from src.services.text_similarity import AboutSimilarityIndex, stem_ru, tokenize
+
+TEXTS = {
+    1: "Люблю бегать по утрам и плавать в бассейне",
+    2: "Бегаю каждое утро, летом плаваю в озере",
+    3: "Играю в футбол и смотрю футбольные матчи",
+    4: "Футбол по выходным, иногда теннис",
+    5: "Читаю книги и хожу в театр",
+    6: "Книги, театр и немного бега по вечерам",
+}
+
+
+@pytest.mark.parametrize("words", [
+    ("бегаю", "бегать", "бегаем", "бегал"),
+    ("плавание", "плаванием"),
+    ("футбол", "футболом"),
+    ("ёлка", "елки"),
+    ("красивая", "красивый"),
+    ("тренировка", "тренировки"),
+])
+def test_stem_ru_merges_word_forms(words):
+    assert len({stem_ru(word) for word in words}) == 1
+
+
+def test_tokenize_drops_stopwords_and_short_words():
+    assert tokenize("Я люблю бегать и читать книги, но не в метро") == ["бега", "чита", "книг", "метр"]
+
+
+def build(**kwargs) -> AboutSimilarityIndex:
+    index = AboutSimilarityIndex(**kwargs)
+    index.build(TEXTS)
+    return index
+
+
+def test_top_k_finds_similar_profiles_and_skips_self():
+    similar = build().top_k(k=2)
+    assert set(similar) == set(TEXTS)
+    assert next(iter(similar[1])) == 2
+    assert next(iter(similar[3])) == 4
+    assert all(uid not in neighbours for uid, neighbours in similar.items())
+    assert all(0 < score <= 1 for neighbours in similar.values() for score in neighbours.values())
+
+
+def test_top_k_respects_candidates_pool():
+    similar = build().top_k([1], k=5, candidates=[3, 4, 5, 6])
+    assert set(similar[1]) <= {3, 4, 5, 6}
+    assert 2 not in similar[1]
+
+
+def test_truncated_postings_keep_exact_scores():
+    # Урезанный индекс находит меньше кандидатов, но косинус у найденных — точный
+    exact = build(max_postings=10_000, query_terms=100).top_k(k=5)
+    truncated = build(max_postings=1, rescore_factor=1, query_terms=1, workers=1).top_k(k=5)
+    for uid, neighbours in truncated.items():
+        for other, score in neighbours.items():
+            assert exact[uid][other] == score
+
+
+def test_update_and_remove():
+    index = build()
+    index.update({7: "Бегаю и плаваю, люблю бассейн"})
+    assert 7 in index.top_k([1], k=3)[1]
+
+    index.remove([2, 7])
+    assert len(index) == len(TEXTS) - 1
+    similar = index.top_k(k=5)
+    assert 2 not in similar and all(2 not in neighbours for neighbours in similar.values())
@@ -0,0 +1,106 @@
+import datetime
+import random
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from src.database.models import TrackingStats
+from src.services.tracking_stats import apply_checkin, streak_on, week_counts
+
+DAY = datetime.timedelta(days=1)
+START = datetime.date(2024, 1, 1)
+
+
+def walk_streak(history: dict, today: datetime.date) -> int:
+    """Эталон: прежний _calculate_streak — обход истории назад от today."""
+    streak = 0
+    check_date = today
+    for date in sorted(history, reverse=True):
+        if date > check_date:
+            continue
+        if date == check_date and history[date] in ('success', 'partial'):
+            streak += 1
+            check_date -= DAY
+        else:
+            break
+    return streak
+
+
+def walk_week(history: dict, today: datetime.date) -> dict:
+    """Эталон: счетчики по записям за 7 дней, заканчивающихся today."""
+    counts = {'success': 0, 'partial': 0, 'fail': 0}
+    for date, status in history.items():
+        if today - 6 * DAY <= date <= today:
+            counts[status] += 1
+    return counts
+
+
+def replay(marks: list) -> TrackingStats:
+    stats = TrackingStats(user_id=1, mode='diet')
+    for date, status in marks:
+        apply_checkin(stats, date, status)
+    return stats
+
+
+def test_consecutive_days_grow_streak():
+    stats = replay([(START + i * DAY, 'success' if i % 2 else 'partial') for i in range(10)])
+    assert streak_on(stats, START + 9 * DAY) == 10
+    assert week_counts(stats, START + 9 * DAY) == {'success': 4, 'partial': 3, 'fail': 0}
+
+
+def test_gap_resets_streak():
+    marks = [(START, 'success'), (START + DAY, 'success'), (START + 3 * DAY, 'success')]
+    stats = replay(marks)
+    assert stats.current_streak == 1 == walk_streak(dict(marks), START + 3 * DAY)
+    assert stats.recent == "s-ss---"
+
+
+def test_fail_resets_streak():
+    marks = [(START, 'success'), (START + DAY, 'fail'), (START + 2 * DAY, 'partial')]
+    stats = replay(marks[:2])
+    assert streak_on(stats, START + DAY) == 0 == walk_streak(dict(marks[:2]), START + DAY)
+    apply_checkin(stats, *marks[2])
+    assert streak_on(stats, START + 2 * DAY) == 1 == walk_streak(dict(marks), START + 2 * DAY)
+
+
+def test_out_of_order_mark_does_not_touch_stats():
+    stats = replay([(START, 'success'), (START + 2 * DAY, 'success')])
+    before = (stats.current_streak, stats.recent, stats.last_date, stats.week_success)
+
+    # Бэкфилл прошлого дня и повтор за последний день игнорируются
+    apply_checkin(stats, START + DAY, 'success')
+    apply_checkin(stats, START + 2 * DAY, 'fail')
+    assert (stats.current_streak, stats.recent, stats.last_date, stats.week_success) == before
+
+
+def test_streak_expires_after_missed_day():
+    stats = replay([(START, 'success'), (START + DAY, 'success')])
+    assert streak_on(stats, START + 2 * DAY) == 2
+    assert streak_on(stats, START + 3 * DAY) == 0
+
+
+def test_week_window_shifts_with_today():
+    marks = [(START + i * DAY, 'success') for i in range(7)]
+    stats = replay(marks)
+    history = dict(marks)
+    for shift in range(9):
+        today = START + (6 + shift) * DAY
+        assert week_counts(stats, today) == walk_week(history, today)
+    assert week_counts(stats, START + 13 * DAY) == {'success': 0, 'partial': 0, 'fail': 0}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_history_walk(seed):
+    rng = random.Random(seed)
+    history, date = {}, START
+    stats = TrackingStats(user_id=1, mode='diet')
+    for _ in range(60):
+        date += rng.choice([1, 1, 1, 2, 4]) * DAY
+        history[date] = rng.choice(['success', 'success', 'partial', 'fail'])
+        apply_checkin(stats, date, history[date])
+
+        # Сразу после отметки (как в хендлере) серия совпадает с обходом истории
+        assert streak_on(stats, date) == walk_streak(history, date)
+        for shift in (0, 1, 3, 7):
+            assert week_counts(stats, date + shift * DAY) == walk_week(history, date + shift * DAY)